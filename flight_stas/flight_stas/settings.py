@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import copy
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,12 +42,12 @@ INSTALLED_APPS = [
 
     'rest_framework',
     'flightapp',
-    'psycopg2',
     'django.contrib.gis',  # Make sure this is included
 
 ]
 
 MIDDLEWARE = [
+    'flightapp.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,23 +81,153 @@ WSGI_APPLICATION = 'flight_stas.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.contrib.gis.db.backends.postgis',
-        'NAME': 'demo',
-        'USER': 'postgres',
-        'PASSWORD': 'password',
-        'HOST': '127.0.0.1',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'demo'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
+        'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # Persistent connections: reuse a worker's connection for DB_CONN_MAX_AGE
+        # seconds instead of reconnecting (and renegotiating search_path) per request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
         'OPTIONS': {
             'options': '-c search_path=bookings,public',
-            'sslmode': 'disable'
+            'sslmode': os.environ.get('DB_SSLMODE', 'disable'),
+        },
+    }
+}
 
+# psycopg 3 connection pool (Django 5.1+), shared by the threads of one worker.
+# Replaces persistent connections, which Django does not allow together with a pool.
+if env_bool('DB_POOL'):
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+        # Health check on checkout, like CONN_HEALTH_CHECKS for persistent connections
+        'check': ConnectionPool.check_connection if env_bool('DB_CONN_HEALTH_CHECKS', True) else None,
+        'name': 'flightstats',
+    }
 
+# Read replicas for the statistics endpoints (flightapp/replicas.py).
+# DB_REPLICAS=host[:port],... adds aliases replica1, replica2, ... with the
+# primary's credentials and options; tests read them from the test database.
+DB_REPLICAS = [value.strip() for value in os.environ.get('DB_REPLICAS', '').split(',') if value.strip()]
+for number, address in enumerate(DB_REPLICAS, 1):
+    host, _, port = address.partition(':')
+    replica = copy.deepcopy(DATABASES['default'])
+    replica.update({'HOST': host, 'PORT': port or replica['PORT'], 'TEST': {'MIRROR': 'default'}})
+    if 'pool' in replica['OPTIONS']:
+        replica['OPTIONS']['pool']['name'] = f'flightstats-replica{number}'
+    DATABASES[f'replica{number}'] = replica
+
+DATABASE_ROUTERS = ['flightapp.replicas.ReplicaRouter']
+
+STATS_REPLICAS = {
+    'ALIASES': [f'replica{number}' for number in range(1, len(DB_REPLICAS) + 1)],
+    # 'round_robin' or 'least_latency'
+    'STRATEGY': os.environ.get('DB_REPLICA_STRATEGY', 'round_robin'),
+    # Seconds a replica may be behind to serve reads. Without a stats cache, windows
+    # that ended before today may use any replica.
+    'MAX_LAG': float(os.environ.get('DB_REPLICA_MAX_LAG', 5)),
+    'CHECK_INTERVAL': float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)),
+    'RETRY_AFTER': float(os.environ.get('DB_REPLICA_RETRY_AFTER', 30)),
+}
+
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Flight statistics responses (flightapp/cache.py). Entries are invalidated by
+# bumping a per-airport generation in this cache, also from other processes:
+# ingest_feed, refresh_route_stats, apply_route_stats_changelog, the matview
+# scheduler and generate_dataset. Those invalidations only reach the web
+# workers through a shared backend, so production needs STATS_CACHE_URL:
+#   redis://host:6379/1        (needs the redis package)
+#   memcached://host:11211     (needs pymemcache)
+# Without it each process keeps its own LocMemCache, which evicts the least
+# recently used entries once MAX_ENTRIES is reached.
+STATS_CACHE_URL = os.environ.get('STATS_CACHE_URL', '')
+if STATS_CACHE_URL.startswith(('redis://', 'rediss://')):
+    STATS_CACHE_BACKEND = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': STATS_CACHE_URL,
+    }
+elif STATS_CACHE_URL.startswith('memcached://'):
+    STATS_CACHE_BACKEND = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': STATS_CACHE_URL.removeprefix('memcached://'),
+    }
+else:
+    STATS_CACHE_BACKEND = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'flight-stats',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
         },
     }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stats': {**STATS_CACHE_BACKEND, 'TIMEOUT': 60},
+}
+
+STATS_CACHE = {
+    'ALIAS': 'stats',
+    # Windows that still include today or the future
+    'TIMEOUT': 60,
+    # Windows that ended before yesterday, whose flights no longer change
+    'HISTORICAL_TIMEOUT': 24 * 60 * 60,
+}
+
+# Identical concurrent cache misses share one computation (flightapp/singleflight.py).
+# ADVISORY_LOCK extends this across workers; it needs a shared 'stats' cache.
+STATS_SINGLE_FLIGHT = {
+    'ENABLED': env_bool('STATS_SINGLE_FLIGHT', True),
+    'ADVISORY_LOCK': env_bool('STATS_SINGLE_FLIGHT_ADVISORY_LOCK'),
+    'TIMEOUT': float(os.environ.get('STATS_SINGLE_FLIGHT_TIMEOUT', 30)),
 }
 
+# Pre-aggregated source for /api/stats1/: 'rollup' (route_daily_stats) or
+# 'matview' (route_stats_mv, kept fresh by manage.py refresh_route_stats_mv)
+STATS_SOURCE = os.environ.get('STATS_SOURCE', 'rollup')
+
+STATS_MATVIEW = {
+    'MAX_STALENESS': int(os.environ.get('STATS_MATVIEW_MAX_STALENESS', 300)),
+    'CHECK_INTERVAL': int(os.environ.get('STATS_MATVIEW_CHECK_INTERVAL', 30)),
+}
+
+# Per-request SQL/serialization profiling, exported at /api/_metrics
+STATS_PROFILING = {
+    'ENABLED': env_bool('STATS_PROFILING', True),
+    'SLOW_QUERY_MS': int(os.environ.get('STATS_SLOW_QUERY_MS', 500)),
+    'EXPLAIN_SLOW': env_bool('STATS_EXPLAIN_SLOW'),
+}
+
+# Parquet export for closed historical windows (manage.py export_parquet).
+# Requests opt in with ?engine=parquet, or all covered windows with AUTO.
+STATS_PARQUET = {
+    'ROOT': os.environ.get('STATS_PARQUET_ROOT') or None,
+    'AUTO': env_bool('STATS_PARQUET_AUTO'),
+}
 
 
 # Password validation
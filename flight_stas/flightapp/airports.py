@@ -0,0 +1,112 @@
+"""
+In-process index of AirportsData.
+
+airports_data is small and almost never changes, so it is loaded once per
+process and kept in memory. Lookups match the airport code or the airport
+name in any language, case-insensitively. The index is dropped on
+AirportsData save/delete (see signals.py) and reloaded on next use.
+"""
+import bisect
+import threading
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+
+from .models import AirportsData
+
+
+class Airport(NamedTuple):
+    code: str
+    name: str
+    names: dict
+    coordinates: object
+    timezone: str
+
+    @property
+    def longitude(self):
+        return self.coordinates.x
+
+    @property
+    def latitude(self):
+        return self.coordinates.y
+
+
+def _normalize(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+class AirportIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self):
+        by_code = {}
+        by_key = {}
+        for row in AirportsData.objects.values_list('airport_code', 'airport_name', 'coordinates', 'timezone'):
+            code, names, coordinates, tz = row
+            names = names if isinstance(names, dict) else {}
+            airport = Airport(
+                code=code,
+                name=names.get('en'),
+                names=names,
+                coordinates=coordinates,
+                timezone=tz,
+            )
+            by_code[code] = airport
+            for key in (code, *names.values()):
+                by_key.setdefault(_normalize(key), airport)
+        # Codes win over names if they ever collide
+        for code, airport in by_code.items():
+            by_key[_normalize(code)] = airport
+        return by_code, by_key, sorted(by_key)
+
+    def _get_state(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._load()
+                state = self._state
+        return state
+
+    async def aload(self):
+        """Load the index from async code; lookups after that do not query."""
+        if self._state is None:
+            await sync_to_async(self._get_state)()
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def get(self, name_or_code):
+        """Exact (case-insensitive) match on the code or any airport name."""
+        if not name_or_code:
+            return None
+        return self._get_state()[1].get(_normalize(name_or_code))
+
+    async def aget(self, name_or_code):
+        await self.aload()
+        return self.get(name_or_code)
+
+    def by_code(self, code):
+        return self._get_state()[0].get(code)
+
+    def all(self):
+        return list(self._get_state()[0].values())
+
+    def search(self, prefix, limit=10):
+        """Airports whose code or name (any language) starts with prefix."""
+        _, by_key, keys = self._get_state()
+        prefix = _normalize(prefix)
+        found = {}
+        position = bisect.bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix) and len(found) < limit:
+            airport = by_key[keys[position]]
+            found.setdefault(airport.code, airport)
+            position += 1
+        return list(found.values())
+
+
+airport_index = AirportIndex()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FlightappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flightapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
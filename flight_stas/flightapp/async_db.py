@@ -0,0 +1,107 @@
+"""
+Async PostgreSQL access for the ASGI statistics views.
+
+Django's async ORM still runs every query in one worker thread, so the views
+use psycopg 3's AsyncConnectionPool directly. Independent queries can then
+run at the same time on separate connections. There is one pool per
+DATABASES alias (the primary and each read replica), opened lazily on first
+use inside the running event loop.
+"""
+import asyncio
+import os
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import metrics
+
+
+_pools = {}
+_pool_loop = None
+_pool_lock = None
+
+
+def conninfo_kwargs(alias=DEFAULT_DB_ALIAS):
+    db = connections[alias].settings_dict
+    options = db.get('OPTIONS', {})
+    # Same session settings Django uses: bookings schema first, UTC clock
+    server_options = ' '.join(filter(None, [options.get('options', ''), '-c TimeZone=UTC']))
+    kwargs = {
+        'dbname': db['NAME'],
+        'user': db.get('USER') or None,
+        'password': db.get('PASSWORD') or None,
+        'host': db.get('HOST') or None,
+        'port': db.get('PORT') or None,
+        'options': server_options,
+    }
+    if options.get('sslmode'):
+        kwargs['sslmode'] = options['sslmode']
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+async def get_pool(alias=DEFAULT_DB_ALIAS):
+    global _pools, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(alias)
+    if pool is not None and _pool_loop is loop:
+        return pool
+    if _pool_loop is not loop:
+        # Pools belong to the event loop that opened them (one per ASGI
+        # worker); a new loop, e.g. async_to_sync's in tests, gets new pools
+        stale, stale_loop = _pools, _pool_loop
+        _pools, _pool_loop, _pool_lock = {}, loop, asyncio.Lock()
+        await close_pools(stale, stale_loop)
+    async with _pool_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            from psycopg_pool import AsyncConnectionPool
+
+            pool = AsyncConnectionPool(
+                kwargs=conninfo_kwargs(alias),
+                min_size=int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 4)),
+                max_size=int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 20)),
+                timeout=float(os.environ.get('ASYNC_DB_POOL_TIMEOUT', 30)),
+                open=False,
+                name=f'flightstats-async-{alias}',
+            )
+            await pool.open()
+            _pools[alias] = pool
+    return pool
+
+
+async def close_pools(pools, loop):
+    """
+    Close the pools of an event loop that is no longer used. A pool can only
+    be closed on its own loop, so if that loop still runs (in another thread)
+    the pool is closed there. Otherwise the pool's worker tasks went with the
+    loop and only its idle connections are left to close.
+    """
+    for pool in pools.values():
+        if loop.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(pool.close(), loop))
+            continue
+        idle = list(pool._pool)
+        pool._pool.clear()
+        for conn in idle:
+            await conn.close()
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS):
+    pool = _pools.get(alias)
+    return pool.get_stats() if pool is not None else None
+
+
+async def fetchall(query, params, alias=DEFAULT_DB_ALIAS):
+    pool = await get_pool(alias)
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            started = time.perf_counter()
+            await cursor.execute(query, params)
+            rows = await cursor.fetchall()
+            metrics.record_query(time.perf_counter() - started)
+            return rows
+
+
+async def gather_queries(*queries, alias=DEFAULT_DB_ALIAS):
+    """Run (query, params) pairs concurrently, each on its own pooled connection to alias."""
+    return await asyncio.gather(*(fetchall(query, params, alias) for query, params in queries))
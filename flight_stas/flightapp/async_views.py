@@ -0,0 +1,131 @@
+"""
+ASGI versions of /api/stats1/ and /api/stats2/.
+
+The views run on the event loop. Responses go through the same response
+cache as the synchronous views, via its async API (acached_stats), and the
+same source selection: Parquet aside, FlightStatisticsSQL.route_query picks
+the matview, rollup, fact table or live query for the window. That choice
+and replicas.choose() read through Django's connections, so they run in the
+request's sync thread; the statistics queries themselves are awaited on the
+alias' async pool (async_db.py). On the live query the flight aggregation
+and the passenger aggregation run concurrently, each on its own pooled
+connection. Airports and distances come from the in-memory indexes.
+Responses are identical to the synchronous views.
+"""
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+from django.views import View
+from psycopg import OperationalError
+
+from . import async_db, replicas
+from .airports import airport_index
+from .cache import acached_stats
+from .distances import distance_matrix
+from .renderers import StatsJsonResponse
+from .views import FlightStatisticsAPIView, FlightStatisticsSQL
+
+
+FLIGHTS_SQL = """
+    SELECT
+        arrival_airport,
+        AVG(actual_arrival - actual_departure) AS avg_flight_time,
+        COUNT(flight_id) AS flight_count
+    FROM bookings.flights
+    WHERE departure_airport = %s
+    AND scheduled_departure >= %s::timestamp
+    AND scheduled_departure < %s::timestamp
+    GROUP BY arrival_airport
+"""
+
+PASSENGERS_SQL = """
+    SELECT f.arrival_airport, COUNT(*) AS passenger_count
+    FROM bookings.ticket_flights tf
+    JOIN bookings.flights f ON f.flight_id = tf.flight_id
+    WHERE f.departure_airport = %s
+    AND f.scheduled_departure >= %s::timestamp
+    AND f.scheduled_departure < %s::timestamp
+    GROUP BY f.arrival_airport
+"""
+
+
+async def fetch_route_rows(alias, query, params):
+    if query != FlightStatisticsSQL.live_query:
+        rows, = await async_db.gather_queries((query, params), alias=alias)
+        return rows
+
+    flights, passengers = await async_db.gather_queries((FLIGHTS_SQL, params), (PASSENGERS_SQL, params), alias=alias)
+    passenger_counts = dict(passengers)
+    return [
+        (arrival, avg_flight_time, flight_count, passenger_counts.get(arrival, 0))
+        for arrival, avg_flight_time, flight_count in flights
+    ]
+
+
+def route_source(departure_code, from_date, to_date):
+    """(alias, query, params) for the alias replicas.choose() picks."""
+    alias = replicas.replica_set.choose(from_date, to_date)
+    # The source bookkeeping is read on the same alias as the rows
+    query, params = replicas.run_on(alias, FlightStatisticsSQL().route_query, departure_code, from_date, to_date)
+    return alias, query, params
+
+
+async def route_rows(departure_code, from_date, to_date):
+    """(arrival_airport, avg_flight_time, flight_count, passenger_count) rows."""
+    alias, query, params = await sync_to_async(route_source)(departure_code, from_date, to_date)
+    try:
+        return await fetch_route_rows(alias, query, params)
+    except OperationalError:
+        if alias == DEFAULT_DB_ALIAS:
+            raise
+        # Only this call moves to the primary, as in ReplicaSet.run()
+        query, params = await sync_to_async(FlightStatisticsSQL().route_query)(departure_code, from_date, to_date)
+        return await fetch_route_rows(DEFAULT_DB_ALIAS, query, params)
+
+
+class AsyncStatsView(View):
+
+    async def get(self, request):
+        departure_airport_name = request.GET.get('departure_airport_name')
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+
+        if await airport_index.aget(departure_airport_name) is None:
+            return self.unknown_airport(departure_airport_name)
+
+        payload = await self.stats(departure_airport_name, from_date, to_date)
+        return StatsJsonResponse(payload)
+
+
+class AsyncFlightStatisticsSQL(AsyncStatsView):
+
+    def unknown_airport(self, departure_airport_name):
+        return JsonResponse({'data': []})
+
+    @acached_stats('async_stats1')
+    async def stats(self, departure_airport_name, from_date, to_date):
+        departure_code = (await airport_index.aget(departure_airport_name)).code
+        rows = await route_rows(departure_code, from_date, to_date)
+        await distance_matrix.aload()
+        return {'data': FlightStatisticsSQL.build_rows(departure_code, rows)}
+
+
+class AsyncFlightStatisticsAPIView(AsyncStatsView):
+
+    def unknown_airport(self, departure_airport_name):
+        return JsonResponse({'detail': f'Unknown departure airport: {departure_airport_name}'}, status=404)
+
+    @acached_stats('async_stats2')
+    async def stats(self, departure_airport_name, from_date, to_date):
+        departure_code = (await airport_index.aget(departure_airport_name)).code
+        flights_list = [
+            {
+                'arrival_airport': arrival,
+                'avg_flight_time': avg_flight_time,
+                'flight_count': flight_count,
+                'total_passengers': passenger_count,
+            }
+            for arrival, avg_flight_time, flight_count, passenger_count in await route_rows(departure_code, from_date, to_date)
+        ]
+        await distance_matrix.aload()
+        return {'data': FlightStatisticsAPIView.build_rows(departure_code, flights_list)}
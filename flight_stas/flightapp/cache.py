@@ -0,0 +1,235 @@
+"""
+Response cache for the flight statistics endpoints.
+
+Entries are keyed by (endpoint, departure airport, from_date, to_date) plus a
+per-airport generation number. Saving or deleting Flights/TicketFlights rows
+bumps the generation of the departure airport once the write commits (see
+signals.py), so older entries are never read again and age out through the
+backend's LRU eviction. Bumping before the commit would let a concurrent miss
+store the pre-commit result under the new generation.
+Bulk loads that bypass the ORM must call invalidate_airport() themselves.
+
+Generations live in the stats cache itself, so an invalidation made by
+another process (feed ingestion, rollup and matview refreshes, the dataset
+generator) only reaches the web workers if that cache is shared: set
+STATS_CACHE_URL to a Redis or Memcached server. With the per-process
+LocMemCache default those responses stay stale until they expire.
+
+Concurrent misses for the same key are computed once (singleflight.py).
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import metrics, singleflight
+from .airports import airport_index
+
+
+# Days before today whose flights can still change (actual times filled in,
+# late tickets); rollup.refresh_route_stats always recomputes them as well
+MUTABLE_DAYS = 1
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'HISTORICAL_TIMEOUT': 24 * 60 * 60,
+}
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'invalidations': 0}
+
+
+def _conf(name):
+    return getattr(settings, 'STATS_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[_conf('ALIAS')]
+
+
+def enabled():
+    """False when the stats cache is a DummyCache, i.e. responses are not kept."""
+    return not isinstance(get_cache(), DummyCache)
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def _coalesced(endpoint, scope):
+    _count('coalesced')
+    metrics.count_coalesced(endpoint, scope)
+
+
+def cache_info():
+    with _lock:
+        info = dict(_counters)
+    lookups = info['hits'] + info['misses']
+    info['hit_ratio'] = round(info['hits'] / lookups, 4) if lookups else None
+    info['alias'] = _conf('ALIAS')
+    return info
+
+
+def _generation_key(airport_code):
+    return f'flightstats:gen:{airport_code}'
+
+
+def _generation(cache, airport_code):
+    key = _generation_key(airport_code)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from a fresh value rather than 0: if the generation itself
+        # was evicted, entries stored under the old one must stay unreachable
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+async def _ageneration(cache, airport_code):
+    key = _generation_key(airport_code)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def invalidate_airport(airport_code):
+    if airport_code is None:
+        return
+    get_cache().set(_generation_key(airport_code), time.time_ns(), None)
+    _count('invalidations')
+
+
+def parse_bound(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        parsed = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def is_historical(to_date):
+    """True if the window ended before the last MUTABLE_DAYS, so its flights no longer change."""
+    try:
+        end = parse_bound(to_date or '')
+    except ValueError:
+        end = None
+    horizon = datetime.combine(timezone.now().date() - timedelta(days=MUTABLE_DAYS), dt_time.min, tzinfo=dt_timezone.utc)
+    return end is not None and end <= horizon
+
+
+def timeout_for(to_date):
+    """Historical windows are kept for longer."""
+    if is_historical(to_date):
+        return _conf('HISTORICAL_TIMEOUT')
+    return _conf('TIMEOUT')
+
+
+def airport_code_for(departure_airport_name):
+    airport = airport_index.get(departure_airport_name)
+    return airport.code if airport is not None else None
+
+
+def make_key(endpoint, airport_code, generation, from_date, to_date, *extra):
+    raw = '\x1f'.join(str(part) for part in (from_date, to_date, *extra))
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f'flightstats:{endpoint}:{airport_code}:{generation}:{digest}'
+
+
+def cached_stats(endpoint):
+    """
+    Cache the payload returned by a view's stats(departure_airport_name,
+    from_date, to_date, *extra) method. Extra arguments (e.g. a bucket
+    granularity) are part of the key.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, departure_airport_name, from_date, to_date, *extra):
+            airport_code = airport_code_for(departure_airport_name)
+            if airport_code is None:
+                return method(self, departure_airport_name, from_date, to_date, *extra)
+
+            cache = get_cache()
+            key = make_key(endpoint, airport_code, _generation(cache, airport_code), from_date, to_date, *extra)
+            payload = cache.get(key)
+            if payload is not None:
+                _count('hits')
+                return payload
+
+            _count('misses')
+
+            def compute():
+                payload = method(self, departure_airport_name, from_date, to_date, *extra)
+                cache.set(key, payload, timeout_for(to_date))
+                return payload
+
+            if not singleflight.conf('ENABLED'):
+                return compute()
+
+            def lead():
+                if singleflight.conf('ADVISORY_LOCK'):
+                    payload, shared = singleflight.across_workers(key, lambda: cache.get(key), compute)
+                    if shared:
+                        _coalesced(endpoint, 'database')
+                    return payload
+                return compute()
+
+            payload, shared = singleflight.single_flight.do(key, lead)
+            if shared:
+                _coalesced(endpoint, 'process')
+            return payload
+        return wrapper
+    return decorator
+
+
+def acached_stats(endpoint):
+    """
+    cached_stats for async stats() methods (the ASGI views). The cache is read
+    and written through the backend's async API and identical misses of this
+    worker share one computation on the event loop. The advisory lock is not
+    taken: it would hold a Django connection for the whole computation.
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, departure_airport_name, from_date, to_date, *extra):
+            airport_code = airport_code_for(departure_airport_name)
+            if airport_code is None:
+                return await method(self, departure_airport_name, from_date, to_date, *extra)
+
+            cache = get_cache()
+            key = make_key(endpoint, airport_code, await _ageneration(cache, airport_code), from_date, to_date, *extra)
+            payload = await cache.aget(key)
+            if payload is not None:
+                _count('hits')
+                return payload
+
+            _count('misses')
+
+            async def compute():
+                payload = await method(self, departure_airport_name, from_date, to_date, *extra)
+                await cache.aset(key, payload, timeout_for(to_date))
+                return payload
+
+            if not singleflight.conf('ENABLED'):
+                return await compute()
+
+            payload, shared = await singleflight.async_single_flight.do(key, compute)
+            if shared:
+                _coalesced(endpoint, 'process')
+            return payload
+        return wrapper
+    return decorator
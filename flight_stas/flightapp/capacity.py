@@ -0,0 +1,54 @@
+"""
+Seat capacity per aircraft, by fare class.
+
+seats holds one row per seat, so counting it per flight would multiply the
+work of every revenue query by the cabin size. The counts only change when
+an aircraft is refitted, so they are computed once per process with one
+grouped query and kept in memory, like the airport index. They are dropped
+on Seats/AircraftsData save or delete (see signals.py).
+"""
+import threading
+
+from django.db.models import Count
+
+from .models import Seats
+
+
+FARE_CONDITIONS = ('Economy', 'Comfort', 'Business')
+
+
+class SeatCapacity:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self):
+        capacity = {}
+        rows = Seats.objects.values_list('aircraft_code', 'fare_conditions').annotate(seats=Count('*'))
+        for aircraft_code, fare_conditions, seats in rows:
+            capacity.setdefault(aircraft_code, dict.fromkeys(FARE_CONDITIONS, 0))[fare_conditions] = seats
+        return capacity
+
+    def _get_state(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._load()
+                state = self._state
+        return state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def by_fare(self, aircraft_code):
+        """{fare class: seats} for one aircraft; all zero if it has no seat map."""
+        return self._get_state().get(aircraft_code) or dict.fromkeys(FARE_CONDITIONS, 0)
+
+    def total(self, aircraft_code):
+        return sum(self.by_fare(aircraft_code).values())
+
+
+seat_capacity = SeatCapacity()
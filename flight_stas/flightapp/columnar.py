@@ -0,0 +1,189 @@
+"""
+Parquet copy of the bookings data and a NumPy engine over it.
+
+export_parquet writes closed months as Hive-style partitions:
+
+    <ROOT>/flights/month=YYYY-MM/departure_airport=XXX/part-0.parquet
+    <ROOT>/ticket_flights/month=YYYY-MM/departure_airport=XXX/part-0.parquet
+    <ROOT>/airports.parquet
+    <ROOT>/_manifest.json      {"covered_from": ..., "covered_to": ...}
+
+Historical windows inside the manifest's coverage can then be answered
+without touching Postgres: the files for the requested months and departure
+airport are memory-mapped and aggregated with NumPy. The result rows have
+the same shape as the /api/stats1/ SQL query, so the views render them
+unchanged. pyarrow is only imported when the engine or the export is used.
+"""
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+import json
+import os
+from pathlib import Path
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .cache import parse_bound
+from .partitions import add_months, month_start
+
+
+DEFAULTS = {
+    'ROOT': None,
+    # Route closed windows to the engine without ?engine=parquet
+    'AUTO': False,
+}
+
+MANIFEST = '_manifest.json'
+
+_manifest_lock = threading.Lock()
+_manifest = (None, None)
+
+
+def conf(name):
+    return getattr(settings, 'STATS_PARQUET', {}).get(name, DEFAULTS[name])
+
+
+def root():
+    value = conf('ROOT')
+    return Path(value) if value else None
+
+
+def partition_path(table, month, departure_code):
+    return root() / table / f'month={month:%Y-%m}' / f'departure_airport={departure_code}' / 'part-0.parquet'
+
+
+def read_manifest():
+    """(covered_from, covered_to) of the export, re-read when the file changes."""
+    global _manifest
+    base = root()
+    if base is None:
+        return None
+    path = base / MANIFEST
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _manifest_lock:
+        if _manifest[0] != mtime:
+            data = json.loads(path.read_text())
+            _manifest = (mtime, (date.fromisoformat(data['covered_from']), date.fromisoformat(data['covered_to'])))
+        return _manifest[1]
+
+
+def write_manifest(covered_from, covered_to):
+    path = root() / MANIFEST
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'covered_from': covered_from.isoformat(), 'covered_to': covered_to.isoformat()}))
+    os.replace(tmp, path)
+
+
+def wanted(engine):
+    """Should a request with ?engine=<engine> try the Parquet engine?"""
+    if engine == 'parquet':
+        return True
+    if engine in ('postgres', 'sql'):
+        return False
+    return bool(conf('AUTO'))
+
+
+def covered_window(from_date, to_date):
+    """(start, end) aware datetimes if the export covers the window, otherwise None."""
+    coverage = read_manifest()
+    if coverage is None:
+        return None
+    try:
+        start, end = parse_bound(from_date or ''), parse_bound(to_date or '')
+    except ValueError:
+        return None
+    if start is None or end is None or start >= end:
+        return None
+    covered_from, covered_to = (datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc) for day in coverage)
+    if start < covered_from or end > covered_to:
+        return None
+    return start, end
+
+
+@lru_cache(maxsize=512)
+def _read(path, mtime_ns, columns):
+    import pyarrow.parquet as pq
+
+    # mtime_ns is part of the cache key, so a re-export is picked up
+    return pq.read_table(path, columns=list(columns), memory_map=True)
+
+
+def _columns(table, month, departure_code, columns):
+    path = partition_path(table, month, departure_code)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    data = _read(str(path), mtime, columns)
+    return {name: data.column(name).to_numpy(zero_copy_only=False) for name in columns}
+
+
+def _load(table, months, departure_code, columns):
+    parts = [part for part in (_columns(table, month, departure_code, columns) for month in months) if part]
+    if not parts:
+        return None
+    return {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+
+def _months(start, end):
+    # Partitions are cut by UTC month, whatever the bounds' offset
+    month = month_start(start.astimezone(dt_timezone.utc))
+    last = month_start(end.astimezone(dt_timezone.utc) - timedelta(microseconds=1))
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def route_stats(departure_code, start, end):
+    """
+    (arrival_airport, avg_flight_time, flight_count, passenger_count) per
+    destination for flights departing in [start, end), like the SQL query.
+    """
+    months = list(_months(start, end))
+    flights = _load('flights', months, departure_code,
+                    ('flight_id', 'arrival_airport', 'scheduled_departure', 'actual_departure', 'actual_arrival'))
+    if flights is None:
+        return []
+
+    lower = np.datetime64(start.astimezone(dt_timezone.utc).replace(tzinfo=None), 'us')
+    upper = np.datetime64(end.astimezone(dt_timezone.utc).replace(tzinfo=None), 'us')
+    scheduled = flights['scheduled_departure'].astype('datetime64[us]')
+    selected = (scheduled >= lower) & (scheduled < upper)
+    if not selected.any():
+        return []
+
+    flight_ids = flights['flight_id'][selected]
+    arrivals, arrival_index = np.unique(flights['arrival_airport'][selected], return_inverse=True)
+    groups = len(arrivals)
+    flight_count = np.bincount(arrival_index, minlength=groups)
+
+    departed = flights['actual_departure'][selected].astype('datetime64[us]')
+    arrived = flights['actual_arrival'][selected].astype('datetime64[us]')
+    has_time = ~(np.isnat(departed) | np.isnat(arrived))
+    flight_time = np.where(has_time, (arrived - departed).astype(np.int64), 0)
+    actual_count = np.bincount(arrival_index, weights=has_time, minlength=groups).astype(np.int64)
+    # Integer sums: float weights would lose microseconds on long ranges
+    total_time = np.zeros(groups, dtype=np.int64)
+    np.add.at(total_time, arrival_index, flight_time)
+
+    passenger_count = np.zeros(groups, dtype=np.int64)
+    tickets = _load('ticket_flights', months, departure_code, ('flight_id',))
+    if tickets is not None and len(tickets['flight_id']):
+        order = np.argsort(flight_ids)
+        sorted_ids = flight_ids[order]
+        position = np.searchsorted(sorted_ids, tickets['flight_id'])
+        position = np.minimum(position, len(sorted_ids) - 1)
+        matched = sorted_ids[position] == tickets['flight_id']
+        np.add.at(passenger_count, arrival_index[order[position[matched]]], 1)
+
+    rows = []
+    for i, arrival in enumerate(arrivals):
+        count = int(actual_count[i])
+        # AVG(interval) divides in floating point and rounds half to even
+        avg = timedelta(microseconds=round(int(total_time[i]) / count)) if count else None
+        rows.append((str(arrival), avg, int(flight_count[i]), int(passenger_count[i])))
+    return rows
@@ -0,0 +1,339 @@
+"""
+Reproducible synthetic bookings dataset for benchmarks.
+
+synthetic.py inserts a few thousand rows inside a transaction that is rolled
+back; this module builds a whole dataset that stays: airports with
+coordinates, aircraft with seats, bookings, tickets, flights and
+ticket_flights, from 10k up to tens of millions of ticket_flights rows.
+
+Every value is drawn from random.Random(seed), so the same seed and scale
+produce the same rows (and, on a database without other synthetic data, the
+same flight_ids). Departure airports are picked with Zipf weights, so the
+dataset has a few large hubs and a long tail of small airports, which is
+what the benchmark suite sweeps over. Rows are generated in chunks of
+flights and bulk loaded with COPY, one transaction per chunk, so memory stays
+bounded whatever the scale.
+
+Synthetic identifiers start with PREFIX ('Z'), which delete() uses to remove
+a previous dataset.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+import io
+import json
+import math
+import random
+import string
+
+from django.db import connection, transaction
+
+from . import cache, partitions
+from .airports import airport_index
+from .distances import distance_matrix
+from .ingest import copy_into, copy_line
+from .network import flight_networks
+
+
+PREFIX = 'Z'
+
+AIRCRAFT = (
+    # code, model, range (km), rows, seats per row, business rows
+    ('Z01', 'Synthetic Regional 90', 3000, 15, 6, 2),
+    ('Z02', 'Synthetic Narrowbody 150', 5500, 25, 6, 3),
+    ('Z03', 'Synthetic Narrowbody 186', 6500, 31, 6, 4),
+    ('Z04', 'Synthetic Widebody 280', 12000, 35, 8, 5),
+)
+
+FIRST_NAMES = ('ALEXANDER', 'ANNA', 'DMITRY', 'ELENA', 'IVAN', 'MARIA', 'NIKOLAY', 'OLGA', 'PAVEL', 'TATIANA')
+LAST_NAMES = ('IVANOV', 'KUZNETSOV', 'MOROZOV', 'NOVIKOV', 'PETROV', 'POPOV', 'SMIRNOV', 'SOKOLOV', 'VOLKOV', 'ZAITSEV')
+
+CRUISE_KMH = 800
+CANCELLED_RATE = 0.03
+BUSINESS_RATE = 0.1
+
+
+@dataclass(frozen=True)
+class Dataset:
+    ticket_flights: int
+    seed: int = 42
+    airports: int = 100
+    start: datetime = datetime(2017, 1, 1, tzinfo=dt_timezone.utc)
+    days: int = 365
+    chunk_flights: int = 5000
+
+    @property
+    def end(self):
+        return self.start + timedelta(days=self.days)
+
+
+def parse_scale(value):
+    """'10k', '1.5M', '50m' or '20000' -> number of ticket_flights rows."""
+    text = value.strip().lower()
+    factor = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    if factor != 1:
+        text = text[:-1]
+    count = int(float(text) * factor)
+    if count <= 0:
+        raise ValueError(value)
+    return count
+
+
+def airport_code(index):
+    letters = string.ascii_uppercase
+    return PREFIX + letters[index // 26] + letters[index % 26]
+
+
+def _copy(cursor, table, columns, buffer):
+    copy_into(cursor, f'{partitions.SCHEMA}.{table}', columns, buffer.getvalue())
+
+
+def _distance_km(a, b):
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(h))
+
+
+def exists():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM bookings.airports_data WHERE airport_code LIKE %s)", [PREFIX + '%']
+        )
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def delete():
+    """Remove a previously generated dataset."""
+    pattern = PREFIX + '%'
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            DELETE FROM bookings.ticket_flights tf
+            USING bookings.flights f
+            WHERE f.flight_id = tf.flight_id AND f.flight_no LIKE %s
+        """, [pattern])
+        cursor.execute("DELETE FROM bookings.tickets WHERE ticket_no LIKE %s", [pattern])
+        cursor.execute("DELETE FROM bookings.bookings WHERE book_ref LIKE %s", [pattern])
+        cursor.execute("DELETE FROM bookings.flights WHERE flight_no LIKE %s", [pattern])
+        cursor.execute("""
+            DELETE FROM bookings.route_daily_stats
+            WHERE departure_airport LIKE %s OR arrival_airport LIKE %s
+        """, [pattern, pattern])
+        cursor.execute("DELETE FROM bookings.seats WHERE aircraft_code LIKE %s", [pattern])
+        cursor.execute("DELETE FROM bookings.aircrafts_data WHERE aircraft_code LIKE %s", [pattern])
+        cursor.execute("DELETE FROM bookings.airports_data WHERE airport_code LIKE %s", [pattern])
+    _invalidate()
+
+
+def _invalidate():
+    airport_index.invalidate()
+    distance_matrix.invalidate()
+    flight_networks.invalidate()
+    for index in range(26 * 26):
+        cache.invalidate_airport(airport_code(index))
+
+
+class Generator:
+
+    def __init__(self, dataset):
+        if not 2 <= dataset.airports <= 26 * 26:
+            raise ValueError("airports must be between 2 and 676")
+        self.dataset = dataset
+        self.rng = random.Random(dataset.seed)
+        self.airports = []
+        self.weights = []
+        self.capacity = {}
+        self.cumulative = []
+
+    def generate(self, progress=None):
+        """Load the dataset; returns the number of rows written per table."""
+        counts = dict.fromkeys(('airports_data', 'aircrafts_data', 'seats', 'flights', 'bookings',
+                                'tickets', 'ticket_flights'), 0)
+        with transaction.atomic(), connection.cursor() as cursor:
+            counts['airports_data'] = self.load_airports(cursor)
+            counts['aircrafts_data'], counts['seats'] = self.load_aircraft(cursor)
+            cursor.execute("SELECT COALESCE(MAX(flight_id), 0) FROM bookings.flights")
+            next_flight_id = cursor.fetchone()[0] + 1
+        self.ensure_partitions()
+
+        remaining = self.dataset.ticket_flights
+        flight_count = self.estimate_flights()
+        flight_index = ticket_index = booking_index = 0
+        while remaining > 0:
+            buffers = {table: io.StringIO() for table in ('bookings', 'tickets', 'flights', 'ticket_flights')}
+            for _ in range(self.dataset.chunk_flights):
+                if remaining <= 0:
+                    break
+                tickets, bookings = self.flight(
+                    buffers, next_flight_id + flight_index, flight_index, flight_count,
+                    ticket_index, booking_index, remaining,
+                )
+                flight_index += 1
+                ticket_index += tickets
+                booking_index += bookings
+                remaining -= tickets
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Parents first: tickets and ticket_flights reference them
+                _copy(cursor, 'bookings', ('book_ref', 'book_date', 'total_amount'), buffers['bookings'])
+                _copy(cursor, 'tickets', ('ticket_no', 'book_ref', 'passenger_id', 'passenger_name'),
+                      buffers['tickets'])
+                _copy(cursor, 'flights', (
+                    'flight_id', 'flight_no', 'scheduled_departure', 'scheduled_arrival', 'departure_airport',
+                    'arrival_airport', 'status', 'aircraft_code', 'actual_departure', 'actual_arrival',
+                ), buffers['flights'])
+                _copy(cursor, 'ticket_flights', ('ticket_no', 'flight_id', 'fare_conditions', 'amount'),
+                      buffers['ticket_flights'])
+            if progress is not None:
+                progress(flight_index, self.dataset.ticket_flights - remaining)
+
+        counts.update(flights=flight_index, bookings=booking_index, tickets=ticket_index,
+                      ticket_flights=ticket_index)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT setval('bookings.flights_flight_id_seq', GREATEST(%s, (SELECT MAX(flight_id) FROM bookings.flights)))",
+                [next_flight_id + flight_index - 1],
+            )
+            for table in ('airports_data', 'flights', 'bookings', 'tickets', 'ticket_flights'):
+                cursor.execute(f"ANALYZE {partitions.SCHEMA}.{table}")
+        _invalidate()
+        return counts
+
+    def load_airports(self, cursor):
+        buffer = io.StringIO()
+        for index in range(self.dataset.airports):
+            code = airport_code(index)
+            longitude = round(self.rng.uniform(-170, 170), 6)
+            latitude = round(self.rng.uniform(-55, 70), 6)
+            self.airports.append((code, (longitude, latitude)))
+            # Zipf weights: airport 0 is the largest hub
+            self.weights.append(1 / (index + 1))
+            name = f'Synthetic {code} Airport'
+            buffer.write(copy_line(
+                code,
+                json.dumps({'en': name, 'ru': name}, ensure_ascii=False),
+                json.dumps({'en': f'Synthetic City {code}', 'ru': f'Synthetic City {code}'}, ensure_ascii=False),
+                f'SRID=4326;POINT({longitude} {latitude})',
+                'UTC',
+            ))
+        _copy(cursor, 'airports_data', ('airport_code', 'airport_name', 'city', 'coordinates', 'timezone'), buffer)
+        total = 0
+        for weight in self.weights:
+            total += weight
+            self.cumulative.append(total)
+        return len(self.airports)
+
+    def load_aircraft(self, cursor):
+        aircraft, seats = io.StringIO(), io.StringIO()
+        seat_count = 0
+        for code, model, range_km, rows, per_row, business_rows in AIRCRAFT:
+            aircraft.write(copy_line(code, json.dumps({'en': model, 'ru': model}), range_km))
+            for row in range(1, rows + 1):
+                fare = 'Business' if row <= business_rows else 'Economy'
+                for letter in string.ascii_uppercase[:per_row]:
+                    seats.write(copy_line(code, f'{row}{letter}', fare))
+            self.capacity[code] = (rows * per_row, range_km)
+            seat_count += rows * per_row
+        _copy(cursor, 'aircrafts_data', ('aircraft_code', 'model', 'range'), aircraft)
+        _copy(cursor, 'seats', ('aircraft_code', 'seat_no', 'fare_conditions'), seats)
+        return len(AIRCRAFT), seat_count
+
+    def ensure_partitions(self):
+        existing = partitions.month_partitions()
+        month = partitions.month_start(self.dataset.start)
+        last = partitions.month_start(self.dataset.end - timedelta(microseconds=1))
+        while month <= last:
+            if month not in existing:
+                partitions.create_month(month)
+            month = partitions.add_months(month, 1)
+
+    def estimate_flights(self):
+        """Flights needed at an average load factor of 75%, used to spread departures."""
+        average_seats = sum(capacity for capacity, _ in self.capacity.values()) / len(self.capacity)
+        return max(1, math.ceil(self.dataset.ticket_flights / (0.75 * average_seats)))
+
+    def flight(self, buffers, flight_id, index, flight_count, ticket_index, booking_index, remaining):
+        rng = self.rng
+        departure_index = rng.choices(range(len(self.airports)), cum_weights=self.cumulative)[0]
+        arrival_index = departure_index
+        while arrival_index == departure_index:
+            arrival_index = rng.choices(range(len(self.airports)), cum_weights=self.cumulative)[0]
+        departure_code, departure_point = self.airports[departure_index]
+        arrival_code, arrival_point = self.airports[arrival_index]
+        distance = _distance_km(departure_point, arrival_point)
+
+        # Smallest aircraft with enough range (AIRCRAFT is ordered by range)
+        aircraft_code = next((code for code, _, range_km, *_ in AIRCRAFT if range_km >= distance), AIRCRAFT[-1][0])
+        capacity = self.capacity[aircraft_code][0]
+
+        # Departures are spread evenly over the window; flights beyond the
+        # estimate wrap around a few seconds later, so (flight_no,
+        # scheduled_departure) stays unique
+        slot = self.dataset.days * 24 * 60 / flight_count
+        scheduled = self.dataset.start + timedelta(
+            minutes=int(index % flight_count * slot), seconds=index // flight_count % 60,
+        )
+        duration = timedelta(minutes=round(30 + distance / CRUISE_KMH * 60))
+        flight_no = f'{PREFIX}{index % 100000:05d}'
+        cancelled = rng.random() < CANCELLED_RATE
+        if cancelled:
+            status, actual_departure, actual_arrival = 'Cancelled', None, None
+        else:
+            actual_departure = scheduled + timedelta(minutes=rng.randrange(0, 45))
+            actual_arrival = actual_departure + duration + timedelta(minutes=rng.randrange(-10, 15))
+            status = 'Arrived'
+        buffers['flights'].write(copy_line(
+            flight_id, flight_no, scheduled.isoformat(), (scheduled + duration).isoformat(),
+            departure_code, arrival_code, status, aircraft_code,
+            actual_departure.isoformat() if actual_departure else None,
+            actual_arrival.isoformat() if actual_arrival else None,
+        ))
+
+        passengers = min(remaining, round(capacity * rng.uniform(0.5, 1.0)))
+        economy = int(round(2000 + distance * 4, -2))
+        booked = 0
+        bookings = 0
+        while booked < passengers:
+            party = min(passengers - booked, rng.choice((1, 1, 1, 2, 2, 3)))
+            book_ref = f'{PREFIX}{_base36(booking_index + bookings):0>5}'
+            book_date = scheduled - timedelta(days=rng.randrange(1, 60), minutes=rng.randrange(0, 1440))
+            total = 0
+            for _ in range(party):
+                ticket_no = f'{PREFIX}{ticket_index + booked:012d}'
+                business = rng.random() < BUSINESS_RATE
+                amount = economy * 3 if business else economy
+                total += amount
+                buffers['tickets'].write(copy_line(
+                    ticket_no, book_ref, f'{rng.randrange(10 ** 10):010d}',
+                    f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                ))
+                buffers['ticket_flights'].write(copy_line(
+                    ticket_no, flight_id, 'Business' if business else 'Economy', f'{amount}.00',
+                ))
+                booked += 1
+            buffers['bookings'].write(copy_line(book_ref, book_date.isoformat(), f'{total}.00'))
+            bookings += 1
+        return booked, bookings
+
+
+def _base36(number):
+    digits = string.digits + string.ascii_uppercase
+    text = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+        if not number:
+            return text
+
+
+def generate(dataset, progress=None):
+    return Generator(dataset).generate(progress)
+
+
+def dataset_window():
+    """(first, last) scheduled_departure of the synthetic flights, or None."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT MIN(scheduled_departure), MAX(scheduled_departure) FROM bookings.flights WHERE flight_no LIKE %s",
+            [PREFIX + '%'],
+        )
+        first, last = cursor.fetchone()
+    return None if first is None else (first, last)
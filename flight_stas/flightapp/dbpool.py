@@ -0,0 +1,50 @@
+"""
+Connection reuse metrics for the default database.
+
+With DB_POOL enabled the numbers come from the psycopg pool itself (pool
+size, waiting requests, wait time, checkouts). With persistent connections
+we count requests against newly opened connections to get the reuse ratio.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from . import async_db
+
+
+_lock = threading.Lock()
+_counters = {'requests': 0, 'connections_created': 0}
+
+
+def count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def pool_info(alias='default'):
+    db = settings.DATABASES[alias]
+    pool_options = db.get('OPTIONS', {}).get('pool')
+    with _lock:
+        counters = dict(_counters)
+    info = {
+        'mode': 'pool' if pool_options else ('persistent' if db.get('CONN_MAX_AGE') else 'per-request'),
+        'conn_max_age': db.get('CONN_MAX_AGE'),
+        'conn_health_checks': db.get('CONN_HEALTH_CHECKS', False),
+        'requests': counters['requests'],
+        'connections_created': counters['connections_created'],
+        'reuse_ratio': (
+            round(1 - counters['connections_created'] / counters['requests'], 4)
+            if counters['requests'] else None
+        ),
+    }
+    if pool_options:
+        info['pool_config'] = {
+            key: pool_options.get(key) for key in ('min_size', 'max_size', 'timeout', 'max_idle')
+        }
+        pool = getattr(connections[alias], 'pool', None)
+        # pool_size, pool_available, requests_num (checkouts), requests_waiting,
+        # requests_wait_ms, requests_errors, connections_num, connections_ms, ...
+        info['pool'] = pool.get_stats() if pool is not None else None
+    info['async_pool'] = async_db.pool_stats(alias)
+    return info
@@ -0,0 +1,104 @@
+"""
+Great-circle distances between every pair of airports.
+
+Airport coordinates are static, so instead of calling ST_DistanceSphere per
+destination row on every request the full matrix is computed once per
+process from the airport index with vectorized NumPy math. Lookups are O(1).
+The matrix is dropped together with the airport index when AirportsData
+changes (see signals.py).
+"""
+import threading
+
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from .airports import airport_index
+
+
+# ST_DistanceSphere on SRID 4326 uses the mean WGS84 radius (2a + b) / 3
+EARTH_RADIUS_KM = 6371.0087714150598
+
+
+def great_circle_km(lon1, lat1, lon2, lat2):
+    """Vectorized sphere distance (the same atan2 form PostGIS uses), in km."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2))
+    dlon = lon2 - lon1
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_lat2, cos_lat2 = np.sin(lat2), np.cos(lat2)
+    cos_dlon = np.cos(dlon)
+    a = cos_lat2 * np.sin(dlon)
+    b = cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos_dlon
+    y = np.hypot(a, b)
+    x = sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_dlon
+    return EARTH_RADIUS_KM * np.arctan2(y, x)
+
+
+class DistanceMatrix:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _build(self):
+        airports = sorted(airport_index.all(), key=lambda airport: airport.code)
+        positions = {airport.code: i for i, airport in enumerate(airports)}
+        lon = np.array([airport.longitude for airport in airports], dtype=np.float64)
+        lat = np.array([airport.latitude for airport in airports], dtype=np.float64)
+        matrix = great_circle_km(lon[:, None], lat[:, None], lon[None, :], lat[None, :])
+        matrix.setflags(write=False)
+        # Per departure airport: destination code -> position by distance,
+        # filled on first use
+        return positions, matrix, {}
+
+    def _get_state(self):
+        state = self._state
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._build()
+                state = self._state
+        return state
+
+    async def aload(self):
+        """Build the matrix (and the airport index) from async code."""
+        await airport_index.aload()
+        if self._state is None:
+            await sync_to_async(self._get_state)()
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    @property
+    def codes(self):
+        positions = self._get_state()[0]
+        return sorted(positions, key=positions.get)
+
+    @property
+    def matrix(self):
+        return self._get_state()[1]
+
+    def distance_km(self, from_code, to_code):
+        positions, matrix, _ = self._get_state()
+        i = positions.get(from_code)
+        j = positions.get(to_code)
+        if i is None or j is None:
+            return None
+        return float(matrix[i, j])
+
+    def ranks(self, from_code):
+        """{destination code: rank by distance from from_code}, computed once per airport."""
+        positions, matrix, ranks = self._get_state()
+        found = ranks.get(from_code)
+        if found is None:
+            i = positions.get(from_code)
+            if i is None:
+                return {}
+            order = np.argsort(matrix[i], kind='stable')
+            codes = sorted(positions, key=positions.get)
+            found = {codes[j]: rank for rank, j in enumerate(order.tolist())}
+            ranks[from_code] = found
+        return found
+
+
+distance_matrix = DistanceMatrix()
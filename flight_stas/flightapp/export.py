@@ -0,0 +1,100 @@
+"""
+Streaming export of per-flight statistics.
+
+Rows are read through a server-side (named) cursor in chunks and encoded one
+chunk at a time, so memory use does not depend on how many rows are exported.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+COLUMNS = [
+    'flight_id',
+    'flight_no',
+    'departure_airport',
+    'arrival_airport',
+    'scheduled_departure',
+    'status',
+    'actual_duration_seconds',
+    'passenger_count',
+    'revenue',
+]
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+EXPORT_SQL = """
+    SELECT
+        f.flight_id,
+        f.flight_no,
+        f.departure_airport,
+        f.arrival_airport,
+        f.scheduled_departure,
+        f.status,
+        EXTRACT(EPOCH FROM f.actual_arrival - f.actual_departure)::integer AS actual_duration_seconds,
+        COALESCE(t.passenger_count, 0) AS passenger_count,
+        COALESCE(t.revenue, 0) AS revenue
+    FROM bookings.flights f
+    LEFT JOIN (
+        SELECT tf.flight_id, COUNT(*) AS passenger_count, SUM(tf.amount) AS revenue
+        FROM bookings.ticket_flights tf
+        JOIN bookings.flights f2 ON f2.flight_id = tf.flight_id
+        WHERE f2.scheduled_departure >= %(from_date)s::timestamp
+        AND f2.scheduled_departure < %(to_date)s::timestamp
+        {ticket_airport_filter}
+        GROUP BY tf.flight_id
+    ) t ON t.flight_id = f.flight_id
+    WHERE f.scheduled_departure >= %(from_date)s::timestamp
+    AND f.scheduled_departure < %(to_date)s::timestamp
+    {airport_filter}
+    ORDER BY f.scheduled_departure, f.flight_id
+"""
+
+
+def iter_rows(from_date, to_date, airport_code=None, chunk_size=5000, using=DEFAULT_DB_ALIAS):
+    """Yield export rows as tuples in COLUMNS order."""
+    params = {'from_date': from_date, 'to_date': to_date, 'airport': airport_code}
+    query = EXPORT_SQL.format(
+        ticket_airport_filter='AND f2.departure_airport = %(airport)s' if airport_code else '',
+        airport_filter='AND f.departure_airport = %(airport)s' if airport_code else '',
+    )
+    with connections[using].chunked_cursor() as cursor:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+
+class Echo:
+    """File-like object that returns what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(COLUMNS, row))) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in row
+        ])
+
+
+def encode(rows, fmt):
+    if fmt == 'csv':
+        return csv_lines(rows)
+    return ndjson_lines(rows)
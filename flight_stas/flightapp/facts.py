@@ -0,0 +1,168 @@
+"""
+Per-flight fact table (bookings.flight_facts) for the statistics endpoints.
+
+The live statistics queries join flights to ticket_flights for every request
+just to count passengers, and compute actual_arrival - actual_departure row
+by row. flight_facts holds one narrow row per flight with both already
+worked out. The windows that the rollup cannot answer (not day aligned, or
+outside its covered days) are aggregated from it instead.
+
+Triggers on flights and ticket_flights keep the rows current (migration
+0013). backfill() builds the table, one month per transaction. It is used
+by the views only once a full backfill has finished, recorded as the
+'flight_facts' StatsRefresh row. Before that they keep using the live
+queries. Each process checks for that row at most every CHECK_INTERVAL
+seconds, not on every request.
+"""
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import StatsRefresh
+from .partitions import add_months, month_bound, month_start
+
+
+FACTS_NAME = 'flight_facts'
+FACTS_TABLE = 'bookings.flight_facts'
+
+# Seconds a process keeps its answer to available(); a backfill run by
+# another process is picked up within this time
+CHECK_INTERVAL = 60
+
+
+BACKFILL_SQL = """
+WITH filtered_flights AS (
+    SELECT *
+    FROM bookings.flights
+    WHERE scheduled_departure >= %(start)s
+    AND scheduled_departure < %(end)s
+),
+passengers AS (
+    SELECT tf.flight_id, COUNT(*) AS passenger_count, SUM(tf.amount) AS revenue
+    FROM bookings.ticket_flights tf
+    JOIN filtered_flights ff ON ff.flight_id = tf.flight_id
+    GROUP BY tf.flight_id
+)
+INSERT INTO bookings.flight_facts (
+    flight_id, departure_airport, arrival_airport, scheduled_departure,
+    duration_seconds, passenger_count, revenue
+)
+SELECT
+    f.flight_id,
+    f.departure_airport,
+    f.arrival_airport,
+    f.scheduled_departure,
+    EXTRACT(EPOCH FROM f.actual_arrival - f.actual_departure)::integer,
+    COALESCE(p.passenger_count, 0),
+    COALESCE(p.revenue, 0)
+FROM filtered_flights f
+LEFT JOIN passengers p ON p.flight_id = f.flight_id;
+"""
+
+# Same shape as the /api/stats1/ live query. SUM(seconds) / COUNT is the
+# arithmetic the rollup uses, so both give the same averages.
+ROUTE_STATS_SQL = """
+SELECT
+    ff.arrival_airport,
+    SUM(ff.duration_seconds) * INTERVAL '1 second' / NULLIF(COUNT(ff.duration_seconds), 0) AS avg_flight_time,
+    COUNT(*) AS flight_count,
+    SUM(ff.passenger_count) AS passenger_count
+FROM bookings.flight_facts ff
+WHERE ff.departure_airport = %s
+AND ff.scheduled_departure >= %s::timestamp
+AND ff.scheduled_departure < %s::timestamp
+GROUP BY ff.arrival_airport;
+"""
+
+BATCH_ROUTE_STATS_SQL = """
+SELECT
+    ff.departure_airport,
+    ff.arrival_airport,
+    SUM(ff.duration_seconds) * INTERVAL '1 second' / NULLIF(COUNT(ff.duration_seconds), 0) AS avg_flight_time,
+    COUNT(*) AS flight_count,
+    SUM(ff.passenger_count) AS passenger_count
+FROM bookings.flight_facts ff
+WHERE ff.scheduled_departure >= %s::timestamp
+AND ff.scheduled_departure < %s::timestamp
+{airport_filter}
+GROUP BY ff.departure_airport, ff.arrival_airport
+ORDER BY ff.departure_airport;
+"""
+
+
+_available = None
+
+
+def available():
+    """True once a full backfill has finished; the triggers keep it current from then on."""
+    global _available
+    now = time.monotonic()
+    state = _available
+    if state is not None and now - state[1] < CHECK_INTERVAL:
+        return state[0]
+    value = StatsRefresh.objects.filter(name=FACTS_NAME).exists()
+    _available = (value, now)
+    return value
+
+
+def invalidate():
+    global _available
+    _available = None
+
+
+def flight_months():
+    """First days of the months (UTC) that have flights."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT date_trunc('month', scheduled_departure AT TIME ZONE 'UTC')::date
+            FROM bookings.flights
+            ORDER BY 1
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+
+@transaction.atomic
+def backfill_month(month):
+    """Rebuild the facts of the flights scheduled in one month; returns the row count."""
+    start, end = month_bound(month), month_bound(add_months(month, 1))
+    with connection.cursor() as cursor:
+        # Like refresh_route_stats: waits for writers whose triggers already
+        # touched flight_facts and holds new ones back, so none of their
+        # changes is lost or counted twice
+        cursor.execute(f"LOCK TABLE {FACTS_TABLE} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            f"DELETE FROM {FACTS_TABLE} WHERE scheduled_departure >= %s AND scheduled_departure < %s",
+            [start, end],
+        )
+        cursor.execute(BACKFILL_SQL, {'start': start, 'end': end})
+        return cursor.rowcount
+
+
+def backfill(start=None, end=None, progress=None):
+    """
+    Rebuild flight_facts for the months with flights in [start, end), by
+    default all of them. Months without flights (archived ones) keep their
+    facts. Only a backfill over all months makes the table available to the
+    views. Returns (months, rows).
+    """
+    months = flight_months()
+    if start is not None:
+        months = [month for month in months if month >= month_start(start)]
+    if end is not None:
+        months = [month for month in months if month_bound(month) < month_bound(end)]
+
+    rows = 0
+    for month in months:
+        count = backfill_month(month)
+        rows += count
+        if progress is not None:
+            progress(month, count)
+
+    if start is None and end is None:
+        StatsRefresh.objects.update_or_create(
+            name=FACTS_NAME,
+            defaults={'covered_from': None, 'covered_to': None, 'refreshed_at': timezone.now()},
+        )
+        invalidate()
+    return len(months), rows
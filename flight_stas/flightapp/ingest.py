@@ -0,0 +1,442 @@
+"""
+Bulk ingestion of flight and ticket feeds.
+
+A feed is a CSV file (with a header row) or NDJSON, optionally gzipped. It is
+read lazily and validated row by row; rejected rows are counted and reported
+with their line number instead of failing the load. Valid rows are
+collected into batches. Each batch runs in its own transaction: it is COPYed
+into a temporary staging table, then merged into the real tables with
+INSERT ... ON CONFLICT. Memory is bounded by the batch size, not by the size
+of the feed.
+
+Flights are upserted on (flight_no, scheduled_departure). Ticket feeds carry
+one row per ticket and flight segment. They identify the flight by the same
+natural key, and the ticket's booking is upserted alongside. Segments whose
+flight is unknown are rejected. Re-running a feed is safe: every statement
+is an upsert, so a load that stopped half way can simply be restarted.
+
+Nothing here goes through the ORM, so the response cache of every departure
+airport touched is invalidated explicitly.
+"""
+import csv
+from dataclasses import dataclass, field
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+import gzip
+import io
+import json
+import sys
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cache
+from .airports import airport_index
+from .network import flight_networks
+
+
+FLIGHT_STATUSES = ('Scheduled', 'On Time', 'Delayed', 'Departed', 'Arrived', 'Cancelled')
+FARE_CONDITIONS = ('Economy', 'Comfort', 'Business')
+
+
+class RowError(ValueError):
+    pass
+
+
+def copy_text(value):
+    """Escape a value for COPY's text format."""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_line(*values):
+    return '\t'.join(copy_text(value) for value in values) + '\n'
+
+
+def copy_into(cursor, table, columns, data):
+    """COPY lines built with copy_line() into table."""
+    if not data:
+        return
+    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        copy.write(data)
+
+
+def open_feed(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def feed_format(path):
+    name = str(path).removesuffix('.gz')
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return None
+
+
+def read_records(stream, fmt):
+    """Yield (line number, dict) from a CSV or NDJSON stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # Empty CSV fields are NULLs
+            yield reader.line_num, {key: (value if value != '' else None) for key, value in record.items()}
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, None
+                continue
+            yield line_no, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown feed format: {fmt}")
+
+
+def _required(record, name):
+    value = record.get(name)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise RowError(f"{name} is required")
+    return value
+
+
+def _string(record, name, max_length, required=True):
+    value = _required(record, name) if required else record.get(name)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if len(value) > max_length:
+        raise RowError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def _datetime(record, name, required=True):
+    value = _required(record, name) if required else record.get(name)
+    if value is None:
+        return None
+    parsed = parse_datetime(str(value).strip())
+    if parsed is None:
+        raise RowError(f"{name} is not a datetime: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def _amount(record, name):
+    try:
+        value = Decimal(str(_required(record, name)).strip())
+    except InvalidOperation:
+        raise RowError(f"{name} is not a number")
+    if not value.is_finite() or value < 0 or value >= 10 ** 8:
+        raise RowError(f"{name} is out of range")
+    return value.quantize(Decimal('0.01'))
+
+
+def _choice(record, name, choices):
+    value = _string(record, name, max(len(choice) for choice in choices))
+    if value not in choices:
+        raise RowError(f"{name} must be one of {', '.join(choices)}")
+    return value
+
+
+class Feed:
+    """One kind of feed: how to validate its rows and merge a staged batch."""
+    name = None
+    staging = None
+    staging_ddl = None
+    columns = ()
+
+    def prepare(self, cursor):
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {self.staging} ({self.staging_ddl})")
+
+    def validate(self, record):
+        raise NotImplementedError
+
+    def merge(self, cursor):
+        """Merge the staging table; returns (inserted, updated, rejected, departure airports)."""
+        raise NotImplementedError
+
+
+class FlightsFeed(Feed):
+    name = 'flights'
+    staging = 'ingest_flights'
+    staging_ddl = """
+        flight_no varchar(6) NOT NULL,
+        scheduled_departure timestamptz NOT NULL,
+        scheduled_arrival timestamptz NOT NULL,
+        departure_airport varchar(3) NOT NULL,
+        arrival_airport varchar(3) NOT NULL,
+        status varchar(20) NOT NULL,
+        aircraft_code varchar(3) NOT NULL,
+        actual_departure timestamptz,
+        actual_arrival timestamptz
+    """
+    columns = (
+        'flight_no', 'scheduled_departure', 'scheduled_arrival', 'departure_airport', 'arrival_airport',
+        'status', 'aircraft_code', 'actual_departure', 'actual_arrival',
+    )
+
+    def __init__(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT aircraft_code FROM bookings.aircrafts_data")
+            self.aircraft = {row[0] for row in cursor.fetchall()}
+
+    def validate(self, record):
+        flight_no = _string(record, 'flight_no', 6)
+        scheduled_departure = _datetime(record, 'scheduled_departure')
+        scheduled_arrival = _datetime(record, 'scheduled_arrival')
+        if scheduled_arrival <= scheduled_departure:
+            raise RowError("scheduled_arrival must be after scheduled_departure")
+        airports = []
+        for name in ('departure_airport', 'arrival_airport'):
+            code = _string(record, name, 3).upper()
+            # Checked here rather than by the foreign key, which would fail the whole batch
+            if airport_index.by_code(code) is None:
+                raise RowError(f"{name} {code} is not a known airport")
+            airports.append(code)
+        status = _choice(record, 'status', FLIGHT_STATUSES)
+        aircraft_code = _string(record, 'aircraft_code', 3).upper()
+        if aircraft_code not in self.aircraft:
+            raise RowError(f"aircraft_code {aircraft_code} is not a known aircraft")
+        actual_departure = _datetime(record, 'actual_departure', required=False)
+        actual_arrival = _datetime(record, 'actual_arrival', required=False)
+        if actual_arrival is not None and (actual_departure is None or actual_arrival <= actual_departure):
+            raise RowError("actual_arrival needs an earlier actual_departure")
+        return (flight_no, scheduled_departure, scheduled_arrival, *airports, status, aircraft_code,
+                actual_departure, actual_arrival)
+
+    def merge(self, cursor):
+        cursor.execute(f"""
+            WITH upserted AS (
+                INSERT INTO bookings.flights (
+                    flight_no, scheduled_departure, scheduled_arrival, departure_airport,
+                    arrival_airport, status, aircraft_code, actual_departure, actual_arrival
+                )
+                -- The last row wins when a batch repeats a flight
+                SELECT DISTINCT ON (flight_no, scheduled_departure) {', '.join(self.columns)}
+                FROM (SELECT *, ctid AS position FROM {self.staging}) s
+                ORDER BY flight_no, scheduled_departure, position DESC
+                ON CONFLICT (flight_no, scheduled_departure) DO UPDATE SET
+                    scheduled_arrival = EXCLUDED.scheduled_arrival,
+                    departure_airport = EXCLUDED.departure_airport,
+                    arrival_airport = EXCLUDED.arrival_airport,
+                    status = EXCLUDED.status,
+                    aircraft_code = EXCLUDED.aircraft_code,
+                    actual_departure = EXCLUDED.actual_departure,
+                    actual_arrival = EXCLUDED.actual_arrival
+                WHERE (flights.scheduled_arrival, flights.departure_airport, flights.arrival_airport,
+                       flights.status, flights.aircraft_code, flights.actual_departure, flights.actual_arrival)
+                    IS DISTINCT FROM
+                      (EXCLUDED.scheduled_arrival, EXCLUDED.departure_airport, EXCLUDED.arrival_airport,
+                       EXCLUDED.status, EXCLUDED.aircraft_code, EXCLUDED.actual_departure, EXCLUDED.actual_arrival)
+                RETURNING (xmax = 0) AS inserted, departure_airport
+            )
+            SELECT inserted, departure_airport, COUNT(*) FROM upserted GROUP BY 1, 2
+        """)
+        return _summarize(cursor.fetchall(), rejected=0)
+
+
+class TicketsFeed(Feed):
+    name = 'tickets'
+    staging = 'ingest_tickets'
+    staging_ddl = """
+        ticket_no varchar(13) NOT NULL,
+        book_ref varchar(6) NOT NULL,
+        book_date timestamptz NOT NULL,
+        total_amount numeric(10, 2) NOT NULL,
+        passenger_id varchar(20) NOT NULL,
+        passenger_name text NOT NULL,
+        contact_data jsonb,
+        flight_no varchar(6) NOT NULL,
+        scheduled_departure timestamptz NOT NULL,
+        fare_conditions varchar(10) NOT NULL,
+        amount numeric(10, 2) NOT NULL
+    """
+    columns = (
+        'ticket_no', 'book_ref', 'book_date', 'total_amount', 'passenger_id', 'passenger_name',
+        'contact_data', 'flight_no', 'scheduled_departure', 'fare_conditions', 'amount',
+    )
+
+    def validate(self, record):
+        contact_data = record.get('contact_data')
+        if isinstance(contact_data, str):
+            try:
+                contact_data = json.loads(contact_data)
+            except ValueError:
+                raise RowError("contact_data is not JSON")
+        if contact_data is not None and not isinstance(contact_data, dict):
+            raise RowError("contact_data must be a JSON object")
+        return (
+            _string(record, 'ticket_no', 13),
+            _string(record, 'book_ref', 6).upper(),
+            _datetime(record, 'book_date'),
+            _amount(record, 'total_amount'),
+            _string(record, 'passenger_id', 20),
+            _string(record, 'passenger_name', 200),
+            json.dumps(contact_data, ensure_ascii=False) if contact_data is not None else None,
+            _string(record, 'flight_no', 6),
+            _datetime(record, 'scheduled_departure'),
+            _choice(record, 'fare_conditions', FARE_CONDITIONS),
+            _amount(record, 'amount'),
+        )
+
+    def merge(self, cursor):
+        cursor.execute(f"""
+            INSERT INTO bookings.bookings (book_ref, book_date, total_amount)
+            SELECT DISTINCT ON (book_ref) book_ref, book_date, total_amount
+            FROM (SELECT *, ctid AS position FROM {self.staging}) s
+            ORDER BY book_ref, position DESC
+            ON CONFLICT (book_ref) DO UPDATE SET
+                book_date = EXCLUDED.book_date,
+                total_amount = EXCLUDED.total_amount
+            WHERE (bookings.book_date, bookings.total_amount)
+                IS DISTINCT FROM (EXCLUDED.book_date, EXCLUDED.total_amount)
+        """)
+        cursor.execute(f"""
+            INSERT INTO bookings.tickets (ticket_no, book_ref, passenger_id, passenger_name, contact_data)
+            SELECT DISTINCT ON (ticket_no) ticket_no, book_ref, passenger_id, passenger_name, contact_data
+            FROM (SELECT *, ctid AS position FROM {self.staging}) s
+            ORDER BY ticket_no, position DESC
+            ON CONFLICT (ticket_no) DO UPDATE SET
+                book_ref = EXCLUDED.book_ref,
+                passenger_id = EXCLUDED.passenger_id,
+                passenger_name = EXCLUDED.passenger_name,
+                contact_data = EXCLUDED.contact_data
+            WHERE (tickets.book_ref, tickets.passenger_id, tickets.passenger_name, tickets.contact_data)
+                IS DISTINCT FROM
+                  (EXCLUDED.book_ref, EXCLUDED.passenger_id, EXCLUDED.passenger_name, EXCLUDED.contact_data)
+        """)
+        cursor.execute(f"""
+            SELECT COUNT(*)
+            FROM {self.staging} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM bookings.flights f
+                WHERE f.flight_no = s.flight_no AND f.scheduled_departure = s.scheduled_departure
+            )
+        """)
+        rejected = cursor.fetchone()[0]
+        cursor.execute(f"""
+            WITH upserted AS (
+                INSERT INTO bookings.ticket_flights (ticket_no, flight_id, fare_conditions, amount)
+                SELECT DISTINCT ON (s.ticket_no, f.flight_id) s.ticket_no, f.flight_id, s.fare_conditions, s.amount
+                FROM (SELECT *, ctid AS position FROM {self.staging}) s
+                JOIN bookings.flights f
+                ON f.flight_no = s.flight_no AND f.scheduled_departure = s.scheduled_departure
+                ORDER BY s.ticket_no, f.flight_id, s.position DESC
+                ON CONFLICT (ticket_no, flight_id) DO UPDATE SET
+                    fare_conditions = EXCLUDED.fare_conditions,
+                    amount = EXCLUDED.amount
+                WHERE (ticket_flights.fare_conditions, ticket_flights.amount)
+                    IS DISTINCT FROM (EXCLUDED.fare_conditions, EXCLUDED.amount)
+                RETURNING (xmax = 0) AS inserted, flight_id
+            )
+            SELECT u.inserted, f.departure_airport, COUNT(*)
+            FROM upserted u
+            JOIN bookings.flights f ON f.flight_id = u.flight_id
+            GROUP BY 1, 2
+        """)
+        return _summarize(cursor.fetchall(), rejected)
+
+
+FEEDS = {feed.name: feed for feed in (FlightsFeed, TicketsFeed)}
+
+
+def _summarize(rows, rejected):
+    inserted = sum(count for was_inserted, _, count in rows if was_inserted)
+    updated = sum(count for was_inserted, _, count in rows if not was_inserted)
+    return inserted, updated, rejected, {airport for _, airport, _ in rows}
+
+
+@dataclass
+class IngestResult:
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    # (line number, message) of the first rejected rows
+    errors: list = field(default_factory=list)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class TooManyErrors(Exception):
+    pass
+
+
+def ingest(feed, records, batch_size=50000, max_errors=None, dry_run=False, progress=None, keep_errors=20):
+    """
+    Validate and load (line number, record) pairs in batches of batch_size
+    rows. Raises TooManyErrors once more than max_errors rows were rejected;
+    batches committed before that stay loaded.
+    """
+    result = IngestResult()
+    started = time.perf_counter()
+    batch = io.StringIO()
+    batch_rows = 0
+
+    def reject(line_no, message, count=1):
+        result.rejected += count
+        if len(result.errors) < keep_errors:
+            result.errors.append((line_no, message))
+        if max_errors is not None and result.rejected > max_errors:
+            raise TooManyErrors(f"More than {max_errors} rejected rows; last at line {line_no}: {message}")
+
+    def flush():
+        nonlocal batch, batch_rows
+        if batch_rows and not dry_run:
+            inserted, updated, rejected, airports = load_batch(feed, batch.getvalue())
+            result.inserted += inserted
+            result.updated += updated
+            if rejected:
+                reject(None, f"{rejected} rows of batch {result.batches + 1} reference unknown flights", rejected)
+            for airport in airports:
+                cache.invalidate_airport(airport)
+            if feed.name == 'flights':
+                flight_networks.invalidate()
+        result.batches += 1
+        result.elapsed = time.perf_counter() - started
+        if progress is not None:
+            progress(result)
+        batch = io.StringIO()
+        batch_rows = 0
+
+    for line_no, record in records:
+        if record is None:
+            reject(line_no, "not a JSON object")
+            continue
+        try:
+            values = feed.validate(record)
+        except RowError as exc:
+            reject(line_no, str(exc))
+            continue
+        batch.write(copy_line(*(value.isoformat() if hasattr(value, 'isoformat') else value for value in values)))
+        batch_rows += 1
+        result.rows += 1
+        if batch_rows >= batch_size:
+            flush()
+    if batch_rows:
+        flush()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def load_batch(feed, data):
+    """COPY one batch into the staging table and merge it, in one transaction."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        feed.prepare(cursor)
+        cursor.execute(f"TRUNCATE {feed.staging}")
+        copy_into(cursor, feed.staging, feed.columns, data)
+        return feed.merge(cursor)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from flightapp import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep route_daily_stats current between refreshes: apply the per-route deltas that the "
+        "flights and ticket_flights triggers log to route_stats_changelog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the changelog, then exit.")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Changelog rows per transaction.")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to wait once the changelog is empty.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            started = time.perf_counter()
+            total = 0
+            while True:
+                consumed = rollup.apply_changelog(batch_size)
+                total += consumed
+                if consumed < batch_size:
+                    break
+            if total and options['verbosity'] > 0:
+                self.stdout.write(
+                    f"Applied {total} changelog rows in {(time.perf_counter() - started) * 1000:.0f} ms"
+                )
+            if options['once']:
+                return
+            # Do not hold a connection open while sleeping
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flightapp.facts import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Build bookings.flight_facts, one month per transaction. A run over all months "
+        "makes /api/stats1/ and /api/stats2/ aggregate from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="First month to rebuild (YYYY-MM-DD, any day of it).")
+        parser.add_argument('--to', dest='end', help="Month after the last one to rebuild (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        if start and end and start >= end:
+            raise CommandError("--from must be before --to")
+
+        def progress(month, rows):
+            self.stdout.write(f"{month:%Y-%m}: {rows} flights")
+
+        months, rows = backfill(start, end, progress=progress)
+        if not months:
+            self.stdout.write("No flights found, nothing to do.")
+            return
+        self.stdout.write(self.style.SUCCESS(f"flight_facts rebuilt for {months} months, {rows} flights"))
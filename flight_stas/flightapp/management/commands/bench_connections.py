@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flightapp.async_db import conninfo_kwargs
+from flightapp.views import FlightStatisticsSQL
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of opening a new connection versus reusing a "
+        "persistent connection or checking one out of a psycopg pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--stats', metavar='AIRPORT_CODE',
+                            help="Run the /api/stats1/ query for this airport instead of SELECT 1.")
+        parser.add_argument('--from', dest='from_date', default='2017-08-01')
+        parser.add_argument('--to', dest='to_date', default='2017-08-02')
+
+    def handle(self, *args, **options):
+        try:
+            import psycopg
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise CommandError("bench_connections needs psycopg and psycopg-pool installed")
+
+        kwargs = conninfo_kwargs()
+        if options['stats']:
+            statement = FlightStatisticsSQL.live_query
+            params = [options['stats'], options['from_date'], options['to_date']]
+        else:
+            statement, params = 'SELECT 1', None
+
+        def run(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(statement, params)
+                cursor.fetchall()
+
+        def new_connection():
+            with psycopg.connect(**kwargs) as conn:
+                run(conn)
+
+        persistent = psycopg.connect(**kwargs, autocommit=True)
+
+        def persistent_connection():
+            run(persistent)
+
+        pool = ConnectionPool(kwargs=kwargs, min_size=1, max_size=4, open=True,
+                              check=ConnectionPool.check_connection)
+        pool.wait()
+
+        def pooled_connection():
+            with pool.connection() as conn:
+                run(conn)
+
+        results = {}
+        try:
+            for name, request in (('per-request', new_connection),
+                                  ('persistent', persistent_connection),
+                                  ('pool', pooled_connection)):
+                request()  # warm up
+                timings = []
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    request()
+                    timings.append((time.perf_counter() - started) * 1000)
+                results[name] = timings
+        finally:
+            persistent.close()
+            pool.close()
+
+        baseline = statistics.mean(results['per-request'])
+        self.stdout.write(f"{'mode':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'saved/request':>14}")
+        for name, timings in results.items():
+            mean = statistics.mean(timings)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else mean
+            self.stdout.write(
+                f"{name:<12} {mean:>9.3f} {statistics.median(timings):>9.3f} {p95:>9.3f} "
+                f"{baseline - mean:>11.3f} ms"
+            )
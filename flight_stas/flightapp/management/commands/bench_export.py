@@ -0,0 +1,66 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from flightapp import export, synthetic
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure export throughput and peak memory on synthetic data "
+        "(millions of ticket_flights rows). All generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', default='DME')
+        parser.add_argument('--flights', type=int, default=250000)
+        parser.add_argument('--passengers', type=int, default=20, help="Average tickets per flight.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def run(self, options):
+        with connection.cursor() as cursor:
+            arrivals = synthetic.destinations(cursor, options['hub'], 50)
+            if not arrivals:
+                raise CommandError("airports_data needs at least two airports")
+            synthetic.ensure_aircraft(cursor)
+
+            started = time.perf_counter()
+            synthetic.add_hub_flights(cursor, options['hub'], arrivals, 0, options['flights'], options['passengers'])
+            cursor.execute("ANALYZE bookings.flights")
+            cursor.execute("ANALYZE bookings.ticket_flights")
+            cursor.execute("SELECT COUNT(*) FROM bookings.ticket_flights tf JOIN bookings.flights f "
+                           "ON f.flight_id = tf.flight_id WHERE f.flight_no LIKE %s",
+                           [synthetic.FLIGHT_PREFIX + '%'])
+            tickets = cursor.fetchone()[0]
+        self.stderr.write(f"Generated {options['flights']} flights / {tickets} ticket_flights "
+                          f"in {time.perf_counter() - started:.1f}s")
+
+        from_date, to_date = synthetic.window_for(options['flights'])
+        for fmt in sorted(export.FORMATS):
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            rows = 0
+            size = 0
+            started = time.perf_counter()
+            for line in export.encode(export.iter_rows(from_date, to_date, chunk_size=options['chunk_size']), fmt):
+                rows += 1
+                size += len(line)
+            elapsed = time.perf_counter() - started
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.stdout.write(
+                f"{fmt:>6}: {rows:,} lines, {size / 2**20:,.1f} MiB in {elapsed:.2f}s "
+                f"({rows / elapsed:,.0f} rows/s), peak RSS growth {(rss_after - rss_before) / 1024:,.1f} MiB"
+            )
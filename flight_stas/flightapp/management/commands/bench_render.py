@@ -0,0 +1,82 @@
+from datetime import timedelta
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+from flightapp import renderers
+
+
+def make_rows(count, seed=0):
+    """Synthetic stats1/stats2 rows: names, distances, durations and counts."""
+    rng = random.Random(seed)
+    return [
+        {
+            'airport_name': f'Airport {i:05d}',
+            'distance_km': round(rng.uniform(50, 9000), 3),
+            'avg_flight_time': timedelta(seconds=rng.randint(1800, 50000), microseconds=rng.randint(0, 999999)),
+            'flight_count': rng.randint(1, 500),
+            'passenger_count': rng.randint(0, 90000),
+        }
+        for i in range(count)
+    ]
+
+
+def stdlib_str(rows):
+    # The original stats1 path: str() per duration, then JsonResponse's encoder
+    data = [{**row, 'avg_flight_time': str(row['avg_flight_time'])} for row in rows]
+    return json.dumps({'data': data}, cls=DjangoJSONEncoder).encode()
+
+
+def drf_renderer(rows):
+    return JSONRenderer().render({'data': rows})
+
+
+def stats_renderer(rows):
+    return renderers.dumps({'data': rows})
+
+
+ENCODERS = {
+    'stdlib_str': stdlib_str,
+    'drf_renderer': drf_renderer,
+    'stats_renderer': stats_renderer,
+}
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark JSON rendering of large statistics responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000', help="Comma separated row counts.")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        results = []
+        for count in (int(value) for value in options['rows'].split(',')):
+            rows = make_rows(count)
+            for name, encode in ENCODERS.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    body = encode(rows)
+                    timings.append((time.perf_counter() - started) * 1000)
+                results.append({
+                    'rows': count,
+                    'encoder': name,
+                    'p50_ms': statistics.median(timings),
+                    'min_ms': min(timings),
+                    'bytes': len(body),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"orjson: {'yes' if renderers.orjson is not None else 'no (stdlib fallback)'}")
+        self.stdout.write(f"{'rows':>7} {'encoder':>15} {'p50 ms':>9} {'min ms':>9} {'bytes':>10}")
+        for r in results:
+            self.stdout.write(f"{r['rows']:>7} {r['encoder']:>15} {r['p50_ms']:>9.2f} {r['min_ms']:>9.2f} {r['bytes']:>10}")
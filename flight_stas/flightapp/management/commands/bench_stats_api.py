@@ -0,0 +1,165 @@
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from flightapp import cache, datagen
+
+
+ENDPOINTS = {
+    'stats1': '/api/stats1/',
+    'stats2': '/api/stats2/',
+}
+
+HUBS_SQL = """
+    SELECT departure_airport, COUNT(*) AS flights
+    FROM bookings.flights
+    WHERE flight_no LIKE %s
+    GROUP BY departure_airport
+    ORDER BY flights DESC, departure_airport
+"""
+
+
+def pick_hubs(counts, number):
+    """`number` airports spread from the largest to the smallest hub."""
+    if number >= len(counts):
+        return counts
+    if number == 1:
+        return counts[:1]
+    step = (len(counts) - 1) / (number - 1)
+    return [counts[round(i * step)] for i in range(number)]
+
+
+def summarize(timings):
+    return {
+        'p50_ms': statistics.median(timings),
+        'p95_ms': statistics.quantiles(timings, n=20, method='inclusive')[-1] if len(timings) > 1 else timings[0],
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+    }
+
+
+def result_key(result):
+    return result['endpoint'], result['hub_rank'], result['window_days']
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark /api/stats1/ and /api/stats2/ on the synthetic dataset (see generate_dataset) "
+        "across window sizes and hub sizes, and write JSON results that can be compared between runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', default='1,7,30,90', help="Comma separated window sizes in days.")
+        parser.add_argument('--hubs', type=int, default=3,
+                            help="Number of departure airports, from the largest hub to the smallest.")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--engine', help="Passed as ?engine= (e.g. postgres, parquet).")
+        parser.add_argument('--cached', action='store_true',
+                            help="Keep the response cache warm instead of invalidating it before each request.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        try:
+            windows = [int(value) for value in options['windows'].split(',')]
+        except ValueError:
+            raise CommandError("--windows must be a comma separated list of integers")
+        endpoints = options['endpoints'].split(',')
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        if options['repeat'] < 1 or options['hubs'] < 1:
+            raise CommandError("--repeat and --hubs must be positive")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        window = datagen.dataset_window()
+        if window is None:
+            raise CommandError("No synthetic dataset loaded; run generate_dataset first")
+        start = datetime.combine(window[0].astimezone(dt_timezone.utc).date(), dt_time.min, tzinfo=dt_timezone.utc)
+        with connection.cursor() as cursor:
+            cursor.execute(HUBS_SQL, [datagen.PREFIX + '%'])
+            hubs = pick_hubs(cursor.fetchall(), options['hubs'])
+
+        results = []
+        # The test client talks to the full middleware stack in process
+        with override_settings(ALLOWED_HOSTS=['*']):
+            client = Client()
+            for rank, (code, flights) in enumerate(hubs):
+                for days in windows:
+                    params = {
+                        'departure_airport_name': code,
+                        'from_date': start.isoformat(),
+                        'to_date': (start + timedelta(days=days)).isoformat(),
+                    }
+                    if options['engine']:
+                        params['engine'] = options['engine']
+                    for endpoint in endpoints:
+                        result = self.measure(client, ENDPOINTS[endpoint], params, options)
+                        result.update(endpoint=endpoint, airport=code, hub_rank=rank,
+                                      hub_flights=flights, window_days=days)
+                        results.append(result)
+                        self.report(result, baseline)
+
+        document = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'postgres': connection.pg_version,
+                'stats_source': getattr(settings, 'STATS_SOURCE', 'rollup'),
+                'engine': options['engine'],
+                'cached': options['cached'],
+                'repeat': options['repeat'],
+                'dataset_from': window[0].isoformat(),
+                'dataset_to': window[1].isoformat(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def measure(self, client, url, params, options):
+        timings = []
+        for _ in range(options['repeat']):
+            if not options['cached']:
+                cache.invalidate_airport(params['departure_airport_name'])
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                content = response.content
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}: {content[:200]!r}")
+        return {
+            **summarize(timings),
+            'rows': len(json.loads(content)['data']),
+            'queries': len(queries.captured_queries),
+            'bytes': len(content),
+        }
+
+    def report(self, result, baseline):
+        line = (
+            f"{result['endpoint']:<7} {result['airport']} ({result['hub_flights']:>7} flights) "
+            f"{result['window_days']:>4}d  p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+            f"{result['queries']:>2} queries  {result['rows']:>4} rows"
+        )
+        if baseline is not None:
+            previous = {result_key(r): r for r in baseline['results']}.get(result_key(result))
+            if previous is not None and previous['p50_ms']:
+                change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100
+                line += f"  {change:+6.1f}% vs {previous['p50_ms']:.2f} ms"
+        self.stdout.write(line)
@@ -0,0 +1,147 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from flightapp import synthetic
+from flightapp.views import FlightStatisticsSQL
+
+
+# The /api/stats1/ query before the grouped-join rewrite, kept for comparison.
+ARRAY_AGG_QUERY = """
+    WITH depcity AS (
+        SELECT airport_code, coordinates
+        FROM bookings.airports_data a
+        WHERE airport_code = %s
+    ),
+    filtered_flights AS (
+        SELECT f.*
+        FROM bookings.flights f
+        JOIN depcity d ON f.departure_airport = d.airport_code
+        WHERE f.scheduled_departure >= %s::timestamp
+        AND f.scheduled_departure < %s::timestamp
+    ),
+    flights_list AS (
+        SELECT
+            arrival_airport,
+            ARRAY_AGG(flight_id) AS flight_ids,
+            AVG(actual_arrival - actual_departure) AS avg_flight_time,
+            COUNT(flight_id) AS flight_count
+        FROM filtered_flights
+        GROUP BY arrival_airport
+    )
+    SELECT
+        ad.airport_name ->> 'en' AS airport_name,
+        ROUND(ST_DistanceSphere(d.coordinates, ad.coordinates)::numeric / 1000,3) AS distance_km,
+        fl.avg_flight_time,
+        fl.flight_count,
+        (
+            SELECT COUNT(*)
+            FROM bookings.ticket_flights tf
+            WHERE tf.flight_id = ANY(fl.flight_ids)
+        ) AS passenger_count
+    FROM flights_list fl
+    JOIN bookings.airports_data ad
+    ON ad.airport_code = fl.arrival_airport
+    CROSS JOIN depcity d
+    ORDER BY distance_km ASC;
+"""
+
+QUERIES = {
+    'array_agg': ARRAY_AGG_QUERY,
+    'grouped_join': FlightStatisticsSQL.live_query,
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the ARRAY_AGG/ANY and grouped-join versions of the /api/stats1/ query "
+        "over synthetic fixtures of growing size. All generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', default='DME', help="Departure airport code used as the hub.")
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help="Comma separated flight counts to benchmark.")
+        parser.add_argument('--passengers', type=int, default=20, help="Average tickets per flight.")
+        parser.add_argument('--destinations', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of integers")
+
+        results = []
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    results = self.run(cursor, sizes, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'flights':>9} {'query':>13} {'p50 ms':>9} {'min ms':>9} "
+                          f"{'shared hit':>11} {'shared read':>12} {'rows':>5}")
+        for r in results:
+            self.stdout.write(f"{r['flights']:>9} {r['query']:>13} {r['p50_ms']:>9.2f} {r['min_ms']:>9.2f} "
+                              f"{r['shared_hit_blocks']:>11} {r['shared_read_blocks']:>12} {r['rows']:>5}")
+
+    def run(self, cursor, sizes, options):
+        hub = options['hub']
+        cursor.execute("SELECT 1 FROM bookings.airports_data WHERE airport_code = %s", [hub])
+        if cursor.fetchone() is None:
+            raise CommandError(f"Airport {hub} not found in airports_data")
+        arrivals = synthetic.destinations(cursor, hub, options['destinations'])
+        if not arrivals:
+            raise CommandError("airports_data needs at least two airports")
+        synthetic.ensure_aircraft(cursor)
+
+        results = []
+        loaded = 0
+        for size in sizes:
+            synthetic.add_hub_flights(cursor, hub, arrivals, loaded, size - loaded, options['passengers'])
+            loaded = size
+            cursor.execute("ANALYZE bookings.flights")
+            cursor.execute("ANALYZE bookings.ticket_flights")
+
+            from_date, to_date = synthetic.window_for(size)
+            params = [hub, from_date, to_date]
+            for name, query in QUERIES.items():
+                results.append({'flights': size, 'query': name, **self.measure(cursor, query, params, options['repeat'])})
+                self.stderr.write(f"{size} flights: {name} done")
+        return results
+
+    def measure(self, cursor, query, params, repeat):
+        timings = []
+        rows = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(query, params)
+            rows = len(cursor.fetchall())
+            timings.append((time.perf_counter() - started) * 1000)
+
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]['Plan']
+        return {
+            'p50_ms': statistics.median(timings),
+            'min_ms': min(timings),
+            'rows': rows,
+            'execution_ms': plan[0].get('Execution Time'),
+            'shared_hit_blocks': top.get('Shared Hit Blocks', 0),
+            'shared_read_blocks': top.get('Shared Read Blocks', 0),
+        }
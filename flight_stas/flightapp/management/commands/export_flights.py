@@ -0,0 +1,54 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flightapp import export
+from flightapp.airports import airport_index
+
+
+class Command(BaseCommand):
+    help = "Stream per-flight statistics (route, actual duration, passengers, revenue) as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', required=True)
+        parser.add_argument('--to', dest='to_date', required=True)
+        parser.add_argument('--airport', help="Departure airport code or name; all airports if omitted.")
+        parser.add_argument('--format', dest='fmt', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--output', default='-', help="Output file, '-' for stdout.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        airport_code = None
+        if options['airport']:
+            airport = airport_index.get(options['airport'])
+            if airport is None:
+                raise CommandError(f"Unknown departure airport: {options['airport']}")
+            airport_code = airport.code
+
+        out = sys.stdout if options['output'] == '-' else open(options['output'], 'w', newline='')
+        counted = CountingRows(export.iter_rows(
+            options['from_date'], options['to_date'], airport_code, options['chunk_size']
+        ))
+        started = time.perf_counter()
+        try:
+            for line in export.encode(counted, options['fmt']):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        elapsed = time.perf_counter() - started
+
+        rate = counted.count / elapsed if elapsed else 0
+        self.stderr.write(f"{counted.count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+
+class CountingRows:
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
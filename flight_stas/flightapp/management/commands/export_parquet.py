@@ -0,0 +1,195 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from flightapp import columnar, partitions
+
+
+FLIGHTS_SQL = """
+    SELECT
+        f.departure_airport,
+        f.flight_id,
+        f.flight_no,
+        f.arrival_airport,
+        f.scheduled_departure,
+        f.actual_departure,
+        f.actual_arrival,
+        f.status
+    FROM bookings.flights f
+    WHERE f.scheduled_departure >= %s
+    AND f.scheduled_departure < %s
+    ORDER BY f.departure_airport, f.flight_id
+"""
+
+TICKET_FLIGHTS_SQL = """
+    SELECT
+        f.departure_airport,
+        tf.flight_id,
+        tf.ticket_no,
+        tf.fare_conditions,
+        tf.amount
+    FROM bookings.ticket_flights tf
+    JOIN bookings.flights f ON f.flight_id = tf.flight_id
+    WHERE f.scheduled_departure >= %s
+    AND f.scheduled_departure < %s
+    ORDER BY f.departure_airport, tf.flight_id
+"""
+
+AIRPORTS_SQL = """
+    SELECT
+        airport_code,
+        airport_name ->> 'en' AS airport_name,
+        ST_X(coordinates::geometry) AS longitude,
+        ST_Y(coordinates::geometry) AS latitude,
+        timezone
+    FROM bookings.airports_data
+    ORDER BY airport_code
+"""
+
+
+def schemas():
+    import pyarrow as pa
+
+    timestamp = pa.timestamp('us', tz='UTC')
+    return {
+        'flights': pa.schema([
+            ('flight_id', pa.int32()),
+            ('flight_no', pa.string()),
+            ('arrival_airport', pa.string()),
+            ('scheduled_departure', timestamp),
+            ('actual_departure', timestamp),
+            ('actual_arrival', timestamp),
+            ('status', pa.string()),
+        ]),
+        'ticket_flights': pa.schema([
+            ('flight_id', pa.int32()),
+            ('ticket_no', pa.string()),
+            ('fare_conditions', pa.string()),
+            ('amount', pa.decimal128(10, 2)),
+        ]),
+        'airports': pa.schema([
+            ('airport_code', pa.string()),
+            ('airport_name', pa.string()),
+            ('longitude', pa.float64()),
+            ('latitude', pa.float64()),
+            ('timezone', pa.string()),
+        ]),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Export closed months of flights and ticket_flights to Parquet, partitioned by "
+        "month and departure airport, plus airports_data, for the columnar stats engine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_month', required=True, help="First month (YYYY-MM).")
+        parser.add_argument('--to', dest='to_month',
+                            help="Last month (YYYY-MM); defaults to the last complete month.")
+        parser.add_argument('--chunk-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        if columnar.root() is None:
+            raise CommandError("Set STATS_PARQUET['ROOT'] (or STATS_PARQUET_ROOT) first")
+        try:
+            first = partitions.parse_month(options['from_month'])
+            last_complete = partitions.add_months(partitions.month_start(timezone.now()), -1)
+            last = partitions.parse_month(options['to_month']) if options['to_month'] else last_complete
+        except ValueError:
+            raise CommandError("--from and --to must be months (YYYY-MM)")
+        if last > last_complete:
+            raise CommandError("Only closed months can be exported; --to must be before the current month")
+        if first > last:
+            raise CommandError("--from must not be after --to")
+
+        self.schemas = schemas()
+        started = time.perf_counter()
+        self.write_airports()
+        month = first
+        while month <= last:
+            next_month = partitions.add_months(month, 1)
+            params = [partitions.month_bound(month), partitions.month_bound(next_month)]
+            flights = self.write_partitions('flights', FLIGHTS_SQL, month, params, options['chunk_size'])
+            tickets = self.write_partitions('ticket_flights', TICKET_FLIGHTS_SQL, month, params, options['chunk_size'])
+            self.stdout.write(f"{month:%Y-%m}: {flights} flights, {tickets} ticket_flights")
+            month = next_month
+
+        # Merge with the previous coverage when the two ranges touch
+        coverage = columnar.read_manifest()
+        covered_from, covered_to = first, partitions.add_months(last, 1)
+        if coverage is not None and coverage[0] <= covered_to and covered_from <= coverage[1]:
+            covered_from, covered_to = min(covered_from, coverage[0]), max(covered_to, coverage[1])
+        columnar.write_manifest(covered_from, covered_to)
+        self.stdout.write(self.style.SUCCESS(
+            f"Parquet export covers {covered_from} .. {covered_to} ({time.perf_counter() - started:.1f}s)"
+        ))
+
+    def write_airports(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with connection.cursor() as cursor:
+            cursor.execute(AIRPORTS_SQL)
+            rows = cursor.fetchall()
+        schema = self.schemas['airports']
+        table = pa.Table.from_pylist([dict(zip(schema.names, row)) for row in rows], schema=schema)
+        path = columnar.root() / 'airports.parquet'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+
+    def write_partitions(self, table, query, month, params, chunk_size):
+        """Stream rows ordered by departure airport into one file per airport."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self.schemas[table]
+        writer = path = tmp = None
+        current = None
+        total = 0
+        written = set()
+
+        def close():
+            if writer is not None:
+                writer.close()
+                # Readers never see a half-written file
+                os.replace(tmp, path)
+
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                start = 0
+                while start < len(rows):
+                    departure_code = rows[start][0]
+                    end = start
+                    while end < len(rows) and rows[end][0] == departure_code:
+                        end += 1
+                    if departure_code != current:
+                        close()
+                        current = departure_code
+                        path = columnar.partition_path(table, month, departure_code)
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        tmp = path.with_suffix('.tmp')
+                        writer = pq.ParquetWriter(tmp, schema)
+                        written.add(path)
+                    batch = pa.Table.from_pylist(
+                        [dict(zip(schema.names, row[1:])) for row in rows[start:end]], schema=schema
+                    )
+                    writer.write_table(batch)
+                    total += end - start
+                    start = end
+        close()
+
+        # Airports that had flights in an earlier export of this month but not now
+        month_dir = columnar.root() / table / f'month={month:%Y-%m}'
+        for stale in set(month_dir.glob('departure_airport=*/part-0.parquet')) - written:
+            stale.unlink()
+        return total
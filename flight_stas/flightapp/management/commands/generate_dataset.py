@@ -0,0 +1,70 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flightapp import datagen
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic bookings dataset (airports, aircraft, flights, "
+        "bookings, tickets, ticket_flights) and bulk load it with COPY."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='10k',
+                            help="Number of ticket_flights rows, e.g. 10k, 1m, 50m.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--airports', type=int, default=100)
+        parser.add_argument('--start', default='2017-01-01', help="First departure day (YYYY-MM-DD).")
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--chunk-flights', type=int, default=5000,
+                            help="Flights generated and committed per COPY batch.")
+        parser.add_argument('--replace', action='store_true',
+                            help="Delete a previously generated dataset first.")
+
+    def handle(self, *args, **options):
+        try:
+            scale = datagen.parse_scale(options['scale'])
+            start = datetime.strptime(options['start'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            raise CommandError("--scale must be a row count (e.g. 10k, 1m) and --start a date (YYYY-MM-DD)")
+        if options['days'] < 1 or options['chunk_flights'] < 1:
+            raise CommandError("--days and --chunk-flights must be positive")
+        dataset = datagen.Dataset(
+            ticket_flights=scale,
+            seed=options['seed'],
+            airports=options['airports'],
+            start=start,
+            days=options['days'],
+            chunk_flights=options['chunk_flights'],
+        )
+        try:
+            generator = datagen.Generator(dataset)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if datagen.exists():
+            if not options['replace']:
+                raise CommandError("A synthetic dataset is already loaded; use --replace to regenerate it")
+            datagen.delete()
+            self.stdout.write("Deleted the previous synthetic dataset")
+
+        started = time.perf_counter()
+
+        def progress(flights, ticket_flights):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{flights} flights, {ticket_flights}/{scale} ticket_flights "
+                f"({ticket_flights / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+
+        counts = generator.generate(progress if options['verbosity'] > 1 else None)
+        elapsed = time.perf_counter() - started
+        for table, count in counts.items():
+            self.stdout.write(f"{table:<16} {count:>12}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated seed {dataset.seed} at {scale} ticket_flights in {elapsed:.1f}s; "
+            "run refresh_route_stats to include it in the rollup"
+        ))
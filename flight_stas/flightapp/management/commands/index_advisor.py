@@ -0,0 +1,142 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from flightapp import export, facts, matview, rollup
+from flightapp.partitions import parent_table
+from flightapp.views import (
+    FlightRevenueStatsSQL, FlightStatisticsAPIView, FlightStatisticsBatchSQL, FlightStatisticsSQL,
+)
+
+
+# Tables where a sequential scan on the hot path is worth flagging (partitions
+# are reported under their parent)
+LARGE_TABLES = {'flights', 'ticket_flights', 'route_daily_stats', 'route_stats_mv', 'flight_facts'}
+
+
+def endpoint_queries(airport_code, from_date, to_date):
+    """(label, sql, params) for every query the statistics endpoints run."""
+    from_day = rollup.parse_day(from_date) or from_date
+    to_day = rollup.parse_day(to_date) or to_date
+    queries = [
+        ('stats1 live', FlightStatisticsSQL.live_query, [airport_code, from_date, to_date]),
+        ('stats1 rollup', rollup.ROUTE_STATS_SQL, [airport_code, from_day, to_day]),
+        ('stats1 facts', facts.ROUTE_STATS_SQL, [airport_code, from_date, to_date]),
+    ]
+    # Reading a view that was never refreshed is an error
+    if matview.is_populated():
+        queries.append(('stats1 matview', matview.ROUTE_STATS_SQL, [airport_code, from_day, to_day]))
+    queries.append(('revenue live', FlightRevenueStatsSQL.live_query, [airport_code, from_date, to_date]))
+    queries.append(('batch live', FlightStatisticsBatchSQL.live_query.format(
+        airport_filter='AND f.departure_airport = ANY(%s)'), [from_date, to_date, [airport_code]]))
+    for label, queryset in (
+        ('stats2 flights', FlightStatisticsAPIView.flights_queryset(airport_code, from_date, to_date)),
+        ('stats2 passengers', FlightStatisticsAPIView.passengers_queryset(airport_code, from_date, to_date)),
+        ('stats2 facts', FlightStatisticsAPIView.facts_queryset(airport_code, from_date, to_date)),
+    ):
+        sql, params = queryset.query.sql_with_params()
+        queries.append((label, sql, list(params)))
+    queries.append((
+        'export',
+        export.EXPORT_SQL.format(
+            ticket_airport_filter='AND f2.departure_airport = %(airport)s',
+            airport_filter='AND f.departure_airport = %(airport)s',
+        ),
+        {'from_date': from_date, 'to_date': to_date, 'airport': airport_code},
+    ))
+    return queries
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+
+def scans(plan):
+    """Relation scans in a JSON plan: node type, relation, index, heap fetches."""
+    found = []
+    for node in walk(plan['Plan']):
+        if 'Relation Name' in node:
+            found.append({
+                'node': node['Node Type'],
+                'relation': node['Relation Name'],
+                'index': node.get('Index Name'),
+                'heap_fetches': node.get('Heap Fetches'),
+                'rows': node.get('Actual Rows'),
+            })
+    return found
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN (ANALYZE, BUFFERS) every statistics endpoint query and report which "
+        "relations are read with index-only scans, index scans or sequential scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--airport', default='DME', help="Departure airport code.")
+        parser.add_argument('--from', dest='from_date', default='2017-08-01')
+        parser.add_argument('--to', dest='to_date', default='2017-08-15')
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        if rollup.parse_day(options['from_date']) is None or rollup.parse_day(options['to_date']) is None:
+            raise CommandError("--from and --to must be dates (YYYY-MM-DD)")
+        results = self.advise(options['airport'], options['from_date'], options['to_date'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            verdict = 'index-only' if result['index_only'] else 'NOT index-only'
+            self.stdout.write(f"{result['query']:<18} {result['execution_ms']:>9.2f} ms  "
+                              f"hit {result['shared_hit_blocks']:>7} read {result['shared_read_blocks']:>7}  {verdict}")
+            for scan in result['scans']:
+                index = f" using {scan['index']}" if scan['index'] else ''
+                heap = f" (heap fetches {scan['heap_fetches']})" if scan['heap_fetches'] else ''
+                self.stdout.write(f"    {scan['node']} on {scan['relation']}{index}{heap}")
+            for warning in result['warnings']:
+                self.stdout.write(self.style.WARNING(f"    ! {warning}"))
+
+    def advise(self, airport_code, from_date, to_date):
+        results = []
+        # EXPLAIN ANALYZE executes the statement; keep it read-only
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for label, sql, params in endpoint_queries(airport_code, from_date, to_date):
+                        results.append(self.explain(cursor, label, sql, params))
+                raise _Rollback
+        except _Rollback:
+            pass
+        return results
+
+    def explain(self, cursor, label, sql, params):
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql.strip().rstrip(';'), params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plan = plan[0]
+        found = scans(plan)
+        warnings = []
+        for scan in found:
+            if scan['node'] == 'Seq Scan' and parent_table(scan['relation']) in LARGE_TABLES:
+                warnings.append(f"sequential scan on {scan['relation']}")
+            if scan['node'] == 'Index Only Scan' and scan['heap_fetches']:
+                warnings.append(f"{scan['index']} needs heap fetches; VACUUM {scan['relation']} to update the visibility map")
+        hot = [scan for scan in found if parent_table(scan['relation']) in LARGE_TABLES]
+        return {
+            'query': label,
+            'execution_ms': plan.get('Execution Time', 0.0),
+            'shared_hit_blocks': plan['Plan'].get('Shared Hit Blocks', 0),
+            'shared_read_blocks': plan['Plan'].get('Shared Read Blocks', 0),
+            'index_only': bool(hot) and all(scan['node'] == 'Index Only Scan' for scan in hot),
+            'scans': found,
+            'warnings': warnings,
+        }
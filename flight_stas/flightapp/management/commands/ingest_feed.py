@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flightapp import ingest
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a flights or tickets feed (CSV or NDJSON, optionally gzipped) with COPY into "
+        "staging tables and upsert it in batched transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed', choices=sorted(ingest.FEEDS))
+        parser.add_argument('path', help="Feed file, or - for stdin.")
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help="Defaults to the file extension (.csv, .ndjson, .jsonl, optionally .gz).")
+        parser.add_argument('--batch-size', type=int, default=50000, help="Rows per COPY and transaction.")
+        parser.add_argument('--max-errors', type=int, default=1000,
+                            help="Stop once more rows than this were rejected.")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the feed.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ingest.feed_format(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot tell the feed format from the file name; pass --format")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        feed = ingest.FEEDS[options['feed']]()
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"batch {result.batches}: {result.rows} rows, {result.rejected} rejected "
+                    f"({result.rows_per_second:.0f} rows/s)"
+                )
+
+        try:
+            with ingest.open_feed(options['path']) as stream:
+                result = ingest.ingest(
+                    feed,
+                    ingest.read_records(stream, fmt),
+                    batch_size=options['batch_size'],
+                    max_errors=options['max_errors'],
+                    dry_run=options['dry_run'],
+                    progress=progress,
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ingest.TooManyErrors as exc:
+            raise CommandError(f"{exc}. Batches loaded before this are committed; the feed can be re-run.")
+
+        for line_no, message in result.errors:
+            self.stderr.write(f"line {line_no}: {message}" if line_no is not None else message)
+        verb = 'Validated' if options['dry_run'] else 'Loaded'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.rows} rows in {result.batches} batches, {result.elapsed:.1f}s "
+            f"({result.rows_per_second:.0f} rows/s): {result.inserted} inserted, {result.updated} updated, "
+            f"{result.rejected} rejected"
+        ))
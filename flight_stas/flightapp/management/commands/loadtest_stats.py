@@ -0,0 +1,157 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class HttpClient:
+    """Minimal keep-alive HTTP/1.1 GET client on asyncio streams (no extra dependencies)."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            await self.close()
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.read()
+            await self.close()
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+
+async def run_load(url, params, concurrency, duration):
+    parts = urlsplit(url)
+    path = (parts.path or '/') + '?' + urlencode(params)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        client = HttpClient(parts.hostname, parts.port or 80)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = await client.get(path)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    errors += 1
+                    await client.close()
+                    continue
+                if status == 200:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': statistics.median(latencies) if latencies else None,
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test statistics endpoints at several concurrency levels and compare "
+        "deployments, e.g. WSGI /api/stats1/ against ASGI /api/async/stats1/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+',
+                            help="Endpoint URLs, e.g. http://127.0.0.1:8000/api/stats1/ "
+                                 "http://127.0.0.1:8001/api/async/stats1/")
+        parser.add_argument('--airport', default='Domodedovo International Airport')
+        parser.add_argument('--from', dest='from_date', default='2017-08-01')
+        parser.add_argument('--to', dest='to_date', default='2017-08-15')
+        parser.add_argument('--concurrency', default='50,100,250,500')
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run.")
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma separated list of integers")
+        for url in options['urls']:
+            if urlsplit(url).scheme != 'http':
+                raise CommandError(f"Only http:// URLs are supported: {url}")
+
+        params = {
+            'departure_airport_name': options['airport'],
+            'from_date': options['from_date'],
+            'to_date': options['to_date'],
+        }
+        results = []
+        for level in levels:
+            for url in options['urls']:
+                result = asyncio.run(run_load(url, params, level, options['duration']))
+                results.append(result)
+                if not options['json']:
+                    p50 = f"{result['p50_ms']:.1f}" if result['p50_ms'] is not None else '-'
+                    p99 = f"{result['p99_ms']:.1f}" if result['p99_ms'] is not None else '-'
+                    self.stdout.write(
+                        f"c={level:<4} {url:<50} {result['rps']:>8.1f} req/s  "
+                        f"p50 {p50:>8} ms  p99 {p99:>8} ms  errors {result['errors']}"
+                    )
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from flightapp import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly partitions of bookings.flights: create partitions for "
+        "upcoming months and detach months older than the retention period, "
+        "archiving (or dropping) them together with their ticket_flights rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help="Months after the current one to create partitions for.")
+        parser.add_argument('--from', dest='from_month',
+                            help="Also create partitions from this month (YYYY-MM), e.g. for a backfill.")
+        parser.add_argument('--to', dest='to_month',
+                            help="Last month (YYYY-MM) to create with --from.")
+        parser.add_argument('--retain', type=int, default=None,
+                            help="Detach partitions whose month ended more than this many months ago.")
+        parser.add_argument('--archive-schema', default='archive',
+                            help="Schema that detached partitions are moved to.")
+        parser.add_argument('--drop', action='store_true',
+                            help="Drop detached partitions and their ticket_flights rows instead of archiving.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        current = partitions.month_start(timezone.now())
+        existing = partitions.month_partitions()
+
+        wanted = [partitions.add_months(current, i) for i in range(options['ahead'] + 1)]
+        if options['from_month']:
+            try:
+                first = partitions.parse_month(options['from_month'])
+                last = partitions.parse_month(options['to_month']) if options['to_month'] else current
+            except ValueError:
+                raise CommandError("--from and --to must be months (YYYY-MM)")
+            if first > last:
+                raise CommandError("--from must not be after --to")
+            month = first
+            while month <= last:
+                wanted.append(month)
+                month = partitions.add_months(month, 1)
+
+        for month in sorted(set(wanted) - set(existing)):
+            if options['dry_run']:
+                self.stdout.write(f"Would create {partitions.partition_name(month)}")
+                continue
+            name, moved = partitions.create_month(month)
+            self.stdout.write(self.style.SUCCESS(f"Created {name} ({moved} rows moved from flights_default)"))
+
+        if options['retain'] is None:
+            return
+        if options['retain'] < 0:
+            raise CommandError("--retain must not be negative")
+        # A month is kept while it ended less than `retain` months ago
+        cutoff = partitions.add_months(current, -options['retain'])
+        for month in sorted(existing):
+            if partitions.add_months(month, 1) > cutoff:
+                continue
+            if options['dry_run']:
+                action = 'drop' if options['drop'] else f"archive to {options['archive_schema']}"
+                self.stdout.write(f"Would {action} {existing[month]}")
+                continue
+            archived, tickets = partitions.archive_month(month, options['archive_schema'], options['drop'])
+            if archived is None:
+                self.stdout.write(self.style.WARNING(f"Dropped {existing[month]} and {tickets} ticket_flights rows"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Archived {existing[month]} to {archived} with {tickets} ticket_flights rows"))
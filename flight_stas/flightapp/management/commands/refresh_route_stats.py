@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flightapp.rollup import refresh_route_stats
+
+
+class Command(BaseCommand):
+    help = "Build or incrementally refresh the route_daily_stats rollup used by /api/stats1/ and /api/stats2/."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="First day to recompute (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='end', help="Day after the last day to recompute (YYYY-MM-DD).")
+        parser.add_argument('--full', action='store_true', help="Drop the rollup and rebuild it from scratch.")
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        if start and end and start >= end:
+            raise CommandError("--from must be before --to")
+
+        refreshed = refresh_route_stats(start, end, full=options['full'])
+        if refreshed is None:
+            self.stdout.write("No flights found, nothing to do.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"route_daily_stats refreshed for {refreshed[0]} .. {refreshed[1]}"
+        ))
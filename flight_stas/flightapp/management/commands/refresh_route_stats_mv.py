@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from flightapp import matview
+
+
+# pg_advisory_lock key, so only one scheduler refreshes at a time
+LOCK_KEY = 0x66737473  # 'fsts'
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep bookings.route_stats_mv current: refresh it CONCURRENTLY whenever it is "
+        "older than STATS_MATVIEW['MAX_STALENESS'] seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Refresh if stale, then exit.")
+        parser.add_argument('--force', action='store_true', help="Refresh even if not stale.")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between staleness checks (default STATS_MATVIEW['CHECK_INTERVAL']).")
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or matview.conf('CHECK_INTERVAL')
+        force = options['force']
+        while True:
+            if force or matview.is_stale():
+                self.refresh()
+                force = False
+            if options['once']:
+                return
+            # Do not hold a connection open while sleeping
+            connection.close()
+            time.sleep(interval)
+
+    def refresh(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [LOCK_KEY])
+            if not cursor.fetchone()[0]:
+                self.stdout.write("Another scheduler is refreshing route_stats_mv, skipping.")
+                return
+        try:
+            started = time.perf_counter()
+            refreshed_at = matview.refresh()
+            self.stdout.write(self.style.SUCCESS(
+                f"route_stats_mv refreshed as of {refreshed_at:%Y-%m-%d %H:%M:%S} "
+                f"in {time.perf_counter() - started:.1f}s"
+            ))
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [LOCK_KEY])
@@ -0,0 +1,105 @@
+"""
+Optional materialized view source for /api/stats1/ (STATS_SOURCE = 'matview').
+
+bookings.route_stats_mv holds the same per-route, per-day aggregates as
+route_daily_stats but is rebuilt wholesale with REFRESH MATERIALIZED VIEW
+CONCURRENTLY by the refresh_route_stats_mv scheduler. A window is answered
+from it only if it is day aligned and ended before the last refresh started;
+anything newer falls back to the rollup or the live query.
+"""
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from functools import partial
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache
+from .airports import airport_index
+from .models import StatsRefresh
+from .rollup import parse_day
+
+
+MATVIEW_NAME = 'route_stats_mv'
+
+DEFAULTS = {
+    # Seconds after which the scheduler refreshes the view
+    'MAX_STALENESS': 300,
+    # Seconds between scheduler checks
+    'CHECK_INTERVAL': 30,
+}
+
+ROUTE_STATS_SQL = """
+SELECT
+    r.arrival_airport,
+    SUM(r.total_flight_time) / NULLIF(SUM(r.actual_count), 0) AS avg_flight_time,
+    SUM(r.flight_count) AS flight_count,
+    SUM(r.passenger_count) AS passenger_count
+FROM bookings.route_stats_mv r
+WHERE r.departure_airport = %s
+AND r.day >= %s::date
+AND r.day < %s::date
+GROUP BY r.arrival_airport;
+"""
+
+
+def conf(name):
+    return getattr(settings, 'STATS_MATVIEW', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return getattr(settings, 'STATS_SOURCE', 'rollup') == 'matview'
+
+
+def last_refresh():
+    state = StatsRefresh.objects.filter(name=MATVIEW_NAME).first()
+    return state.refreshed_at if state is not None else None
+
+
+def is_stale(now=None):
+    refreshed_at = last_refresh()
+    if refreshed_at is None:
+        return True
+    now = now or timezone.now()
+    return now - refreshed_at >= timedelta(seconds=conf('MAX_STALENESS'))
+
+
+def covered_window(from_date, to_date):
+    """(from_day, to_day) if the view can answer the window, otherwise None."""
+    from_day = parse_day(from_date)
+    to_day = parse_day(to_date)
+    if from_day is None or to_day is None or from_day >= to_day:
+        return None
+    refreshed_at = last_refresh()
+    if refreshed_at is None:
+        return None
+    if datetime.combine(to_day, dt_time.min, tzinfo=dt_timezone.utc) > refreshed_at:
+        return None
+    return from_day, to_day
+
+
+def is_populated():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relispopulated FROM pg_class WHERE oid = 'bookings.route_stats_mv'::regclass")
+        return cursor.fetchone()[0]
+
+
+def refresh(concurrently=True):
+    """Refresh the view; the first refresh of an empty view cannot be concurrent."""
+    populated = is_populated()
+    with connection.cursor() as cursor:
+        # The refresh sees the data committed when it starts
+        started = timezone.now()
+        if populated and concurrently:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY bookings.route_stats_mv")
+        else:
+            cursor.execute("REFRESH MATERIALIZED VIEW bookings.route_stats_mv")
+    StatsRefresh.objects.update_or_create(
+        name=MATVIEW_NAME,
+        defaults={'refreshed_at': started, 'covered_from': None, 'covered_to': None},
+    )
+    # The whole view was rebuilt, so every airport's cached responses may be stale
+    for airport in airport_index.all():
+        transaction.on_commit(partial(cache.invalidate_airport, airport.code))
+    return started
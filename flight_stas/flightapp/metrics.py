@@ -0,0 +1,179 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+ProfilingMiddleware (middleware.py) fills a RequestProfile per request: SQL
+query count and time (through an execute wrapper on every connection, plus
+async_db for the ASGI views), JSON serialization time (renderers.dumps) and
+response size. At the end of the request, or once a streamed response has
+been consumed, the profile is folded into fixed-bucket
+histograms labelled by URL route. Everything is a few additions under a
+lock, so profiling stays on in production. Each worker process keeps its
+own numbers; Prometheus scrapes each one.
+"""
+import bisect
+from contextvars import ContextVar
+import threading
+import time
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestProfile:
+    __slots__ = ('started', 'queries', 'db_time', 'serialize_time', 'slow_queries')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.slow_queries = []
+
+
+_profile = ContextVar('flightapp_request_profile', default=None)
+
+
+def start_profile():
+    profile = RequestProfile()
+    return profile, _profile.set(profile)
+
+
+def use_profile(profile):
+    """Make an existing profile current again, e.g. while a streamed response is consumed."""
+    return _profile.set(profile)
+
+
+def end_profile(token):
+    _profile.reset(token)
+
+
+def current_profile():
+    return _profile.get()
+
+
+def record_query(duration):
+    """Count a query run outside Django's connections (async_db)."""
+    profile = _profile.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.db_time += duration
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            label_text = _labels(labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{_labels(labels)}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+
+
+_lock = threading.Lock()
+
+REQUESTS = Counter('flightapp_http_requests_total', 'Requests by route and status code.')
+SLOW_QUERIES = Counter('flightapp_slow_queries_total', 'Queries slower than the slow query threshold.')
+REQUEST_TIME = Histogram('flightapp_request_duration_seconds', 'Total request time.', DURATION_BUCKETS)
+DB_TIME = Histogram('flightapp_db_time_seconds', 'Time spent in SQL per request.', DURATION_BUCKETS)
+DB_QUERIES = Histogram('flightapp_db_queries', 'SQL queries per request.', COUNT_BUCKETS)
+SERIALIZE_TIME = Histogram('flightapp_serialization_seconds', 'JSON encoding time per request.', DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram('flightapp_response_bytes', 'Response body size.', SIZE_BUCKETS)
+STATS_READS = Counter('flightapp_stats_reads_total', 'Statistics reads by database alias.')
+REPLICA_ERRORS = Counter('flightapp_replica_errors_total', 'Replica failures that moved reads to the next database.')
+COALESCED = Counter(
+    'flightapp_coalesced_requests_total',
+    'Cache misses answered by an identical in-flight computation, in this process or another worker.',
+)
+
+METRICS = (
+    REQUESTS, SLOW_QUERIES, REQUEST_TIME, DB_TIME, DB_QUERIES, SERIALIZE_TIME, RESPONSE_SIZE,
+    STATS_READS, REPLICA_ERRORS, COALESCED,
+)
+
+
+def observe_request(route, status, profile, size):
+    labels = (('route', route),)
+    elapsed = time.perf_counter() - profile.started
+    with _lock:
+        REQUESTS.inc((('route', route), ('status', str(status))))
+        REQUEST_TIME.observe(labels, elapsed)
+        DB_TIME.observe(labels, profile.db_time)
+        DB_QUERIES.observe(labels, profile.queries)
+        SERIALIZE_TIME.observe(labels, profile.serialize_time)
+        if size is not None:
+            RESPONSE_SIZE.observe(labels, size)
+        if profile.slow_queries:
+            SLOW_QUERIES.inc(labels, len(profile.slow_queries))
+
+
+def count_read(alias):
+    with _lock:
+        STATS_READS.inc((('alias', alias),))
+
+
+def count_replica_error(alias):
+    with _lock:
+        REPLICA_ERRORS.inc((('alias', alias),))
+
+
+def count_coalesced(endpoint, scope):
+    with _lock:
+        COALESCED.inc((('endpoint', endpoint), ('scope', scope)))
+
+
+def render():
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        for metric in METRICS:
+            metric.series.clear()
@@ -0,0 +1,160 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+
+logger = logging.getLogger('flightapp.slow_queries')
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Queries at least this slow are counted (and explained, see below)
+    'SLOW_QUERY_MS': 500,
+    # Log EXPLAIN for slow queries once the response is ready
+    'EXPLAIN_SLOW': False,
+}
+
+
+def conf(name):
+    return getattr(settings, 'STATS_PROFILING', {}).get(name, DEFAULTS[name])
+
+
+class QueryProfiler:
+    """
+    Execute wrapper that adds every query to the current request profile.
+    Installed once per connection (install_profiler), so it also sees
+    queries of sync views run under ASGI and of streamed responses.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        profile = metrics.current_profile()
+        if profile is None:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            profile.queries += 1
+            profile.db_time += duration
+            if duration >= conf('SLOW_QUERY_MS') / 1000:
+                profile.slow_queries.append((self.alias, sql, None if many else params, duration))
+
+
+def install_profiler(connection):
+    """Called for every new database connection (signals.py)."""
+    if not any(isinstance(wrapper, QueryProfiler) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(QueryProfiler(connection.alias))
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return '/' + match.route if match is not None and match.route else 'unmatched'
+
+
+def _explain(alias, sql, params, duration):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        logger.warning("Slow query (%.0f ms) on %s: %s", duration * 1000, alias, sql)
+        return
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+    except Exception:
+        logger.exception("Could not EXPLAIN slow query on %s: %s", alias, sql)
+        return
+    logger.warning("Slow query (%.0f ms) on %s: %s\n%s", duration * 1000, alias, sql, plan)
+
+
+class ProfilingMiddleware:
+    """
+    Per-request SQL count and time, serialization time and response size,
+    exported at /api/_metrics. Works for sync and async views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = conf('ENABLED')
+        self.explain_slow = conf('EXPLAIN_SLOW')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile, token = metrics.start_profile()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_profile(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        # Sync views run in a thread that inherits the profile; async views
+        # query through async_db, which reports to it as well
+        profile, token = metrics.start_profile()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_profile(token)
+        if self.explain_slow:
+            # EXPLAIN goes through the sync ORM connections
+            return await sync_to_async(self.finish)(request, response, profile)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        route, status = _route(request), response.status_code
+        if not response.streaming:
+            self.close(route, status, profile, len(response.content))
+        elif getattr(response, 'is_async', False):
+            response.streaming_content = self.acount_bytes(route, status, response.streaming_content, profile)
+        else:
+            # The queries of a streamed response run while it is consumed,
+            # after the view returned, so the profile is closed only then
+            response.streaming_content = self.count_bytes(route, status, response.streaming_content, profile)
+        return response
+
+    def close(self, route, status, profile, size):
+        metrics.observe_request(route, status, profile, size)
+        if self.explain_slow:
+            for slow_query in profile.slow_queries:
+                _explain(*slow_query)
+
+    def count_bytes(self, route, status, content, profile):
+        size = 0
+        token = metrics.use_profile(profile)
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            metrics.end_profile(token)
+            self.close(route, status, profile, size)
+
+    async def acount_bytes(self, route, status, content, profile):
+        size = 0
+        token = metrics.use_profile(profile)
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            metrics.end_profile(token)
+            if self.explain_slow:
+                await sync_to_async(self.close)(route, status, profile, size)
+            else:
+                self.close(route, status, profile, size)
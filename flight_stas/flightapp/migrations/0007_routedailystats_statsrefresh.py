@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flightapp', '0006_alter_airportsdata_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRefresh',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('covered_from', models.DateField(blank=True, null=True)),
+                ('covered_to', models.DateField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'stats_refresh',
+            },
+        ),
+        migrations.CreateModel(
+            name='RouteDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('flight_count', models.PositiveIntegerField(default=0)),
+                ('actual_count', models.PositiveIntegerField(default=0)),
+                ('total_flight_time', models.DurationField()),
+                ('passenger_count', models.PositiveIntegerField(default=0)),
+                ('arrival_airport', models.ForeignKey(db_column='arrival_airport', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flightapp.airportsdata')),
+                ('departure_airport', models.ForeignKey(db_column='departure_airport', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flightapp.airportsdata')),
+            ],
+            options={
+                'db_table': 'route_daily_stats',
+                'indexes': [models.Index(fields=['departure_airport', 'day'], name='route_daily_dep_day_idx')],
+                'unique_together': {('departure_airport', 'arrival_airport', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flightapp', '0007_routedailystats_statsrefresh'),
+    ]
+
+    operations = [
+        # Same rows as route_daily_stats, maintained by REFRESH MATERIALIZED VIEW.
+        # Created empty; the first refresh_route_stats_mv run populates it.
+        migrations.RunSQL(
+            sql="""
+                CREATE MATERIALIZED VIEW bookings.route_stats_mv AS
+                SELECT
+                    f.departure_airport,
+                    f.arrival_airport,
+                    (f.scheduled_departure AT TIME ZONE 'UTC')::date AS day,
+                    COUNT(*)::integer AS flight_count,
+                    COUNT(f.actual_arrival - f.actual_departure)::integer AS actual_count,
+                    COALESCE(SUM(f.actual_arrival - f.actual_departure), INTERVAL '0') AS total_flight_time,
+                    COALESCE(SUM(p.passenger_count), 0)::integer AS passenger_count
+                FROM bookings.flights f
+                LEFT JOIN (
+                    SELECT flight_id, COUNT(*) AS passenger_count
+                    FROM bookings.ticket_flights
+                    GROUP BY flight_id
+                ) p ON p.flight_id = f.flight_id
+                GROUP BY 1, 2, 3
+                WITH NO DATA;
+
+                -- Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+                CREATE UNIQUE INDEX route_stats_mv_route_day_uniq
+                ON bookings.route_stats_mv (departure_airport, arrival_airport, day);
+            """,
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS bookings.route_stats_mv;",
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:40
+
+import django.db.models.fields.json
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction; the
+    # tables stay writable while the indexes are built
+    atomic = False
+
+    dependencies = [
+        ('flightapp', '0008_route_stats_mv'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='airportsdata',
+            index=models.Index(django.db.models.fields.json.KT('airport_name__en'), name='airports_name_en_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='flights',
+            index=models.Index(fields=['departure_airport', 'scheduled_departure'], include=['arrival_airport', 'flight_id', 'actual_departure', 'actual_arrival'], name='flights_dep_sched_cover_idx'),
+        ),
+        # Same key columns as the covering index above, which replaces it
+        RemoveIndexConcurrently(
+            model_name='flights',
+            name='flights_departu_6d6aa6_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='flights',
+            index=models.Index(condition=models.Q(('actual_arrival__isnull', False), ('actual_departure__isnull', False)), fields=['departure_airport', 'arrival_airport', 'scheduled_departure'], include=['actual_departure', 'actual_arrival'], name='flights_arrived_route_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ticketflights',
+            index=models.Index(fields=['flight_id'], include=['amount'], name='ticket_flights_flight_idx'),
+        ),
+    ]
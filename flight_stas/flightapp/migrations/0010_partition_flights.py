@@ -0,0 +1,176 @@
+# Convert flights to monthly range partitions on scheduled_departure and
+# ticket_flights to hash partitions on flight_id.
+#
+# A unique constraint on a partitioned table must include the partition key,
+# so flight_id alone (and ticket_flights.id alone) can no longer be the
+# target of a foreign key: ticket_flights.flight_id and
+# boarding_passes.ticket_no lose their database constraints first. Django
+# still enforces on_delete for them.
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+TICKET_FLIGHTS_PARTITIONS = 16
+
+MATVIEW_SQL = """
+CREATE MATERIALIZED VIEW bookings.route_stats_mv AS
+SELECT
+    f.departure_airport,
+    f.arrival_airport,
+    (f.scheduled_departure AT TIME ZONE 'UTC')::date AS day,
+    COUNT(*)::integer AS flight_count,
+    COUNT(f.actual_arrival - f.actual_departure)::integer AS actual_count,
+    COALESCE(SUM(f.actual_arrival - f.actual_departure), INTERVAL '0') AS total_flight_time,
+    COALESCE(SUM(p.passenger_count), 0)::integer AS passenger_count
+FROM bookings.flights f
+LEFT JOIN (
+    SELECT flight_id, COUNT(*) AS passenger_count
+    FROM bookings.ticket_flights
+    GROUP BY flight_id
+) p ON p.flight_id = f.flight_id
+GROUP BY 1, 2, 3;
+
+CREATE UNIQUE INDEX route_stats_mv_route_day_uniq
+ON bookings.route_stats_mv (departure_airport, arrival_airport, day);
+"""
+
+# Constraint and index names would collide with the renamed tables' ones,
+# so they are added only after the old tables are dropped
+FLIGHTS_CONSTRAINTS_SQL = """
+ALTER TABLE bookings.flights
+    ADD CONSTRAINT flights_pkey PRIMARY KEY ({flights_key}),
+    ADD CONSTRAINT flights_flight_no_scheduled_departure_uniq UNIQUE (flight_no, scheduled_departure),
+    ADD CONSTRAINT flights_aircraft_code_fk FOREIGN KEY (aircraft_code)
+        REFERENCES bookings.aircrafts_data (aircraft_code) DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT flights_departure_airport_fk FOREIGN KEY (departure_airport)
+        REFERENCES bookings.airports_data (airport_code) DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT flights_arrival_airport_fk FOREIGN KEY (arrival_airport)
+        REFERENCES bookings.airports_data (airport_code) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE bookings.ticket_flights
+    ADD CONSTRAINT ticket_flights_pkey PRIMARY KEY ({ticket_flights_key}),
+    ADD CONSTRAINT ticket_flights_ticket_no_flight_id_uniq UNIQUE (ticket_no, flight_id),
+    ADD CONSTRAINT ticket_flights_ticket_no_fk FOREIGN KEY (ticket_no)
+        REFERENCES bookings.tickets (ticket_no) DEFERRABLE INITIALLY DEFERRED;
+
+CREATE INDEX flights_dep_sched_cover_idx ON bookings.flights (departure_airport, scheduled_departure)
+    INCLUDE (arrival_airport, flight_id, actual_departure, actual_arrival);
+CREATE INDEX flights_arrived_route_idx ON bookings.flights (departure_airport, arrival_airport, scheduled_departure)
+    INCLUDE (actual_departure, actual_arrival)
+    WHERE actual_arrival IS NOT NULL AND actual_departure IS NOT NULL;
+CREATE INDEX flights_aircraft_code_idx ON bookings.flights (aircraft_code);
+CREATE INDEX flights_arrival_airport_idx ON bookings.flights (arrival_airport);
+CREATE INDEX ticket_flights_flight_idx ON bookings.ticket_flights (flight_id) INCLUDE (amount);
+"""
+
+PARTITION_SQL = """
+-- route_stats_mv reads both tables; rebuilt (populated) at the end
+DROP MATERIALIZED VIEW IF EXISTS bookings.route_stats_mv;
+
+ALTER TABLE bookings.flights RENAME TO flights_unpartitioned;
+ALTER TABLE bookings.ticket_flights RENAME TO ticket_flights_unpartitioned;
+
+-- flights: one partition per month of existing data, plus a default
+CREATE SEQUENCE bookings.flights_flight_id_seq_new AS integer;
+CREATE TABLE bookings.flights (
+    LIKE bookings.flights_unpartitioned INCLUDING STORAGE
+) PARTITION BY RANGE (scheduled_departure);
+ALTER TABLE bookings.flights ALTER COLUMN flight_id SET DEFAULT nextval('bookings.flights_flight_id_seq_new');
+ALTER SEQUENCE bookings.flights_flight_id_seq_new OWNED BY bookings.flights.flight_id;
+
+CREATE TABLE bookings.flights_default PARTITION OF bookings.flights DEFAULT;
+DO $$
+DECLARE
+    part_start timestamptz;
+    part_last timestamptz;
+BEGIN
+    SELECT date_trunc('month', MIN(scheduled_departure) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           date_trunc('month', MAX(scheduled_departure) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+    INTO part_start, part_last
+    FROM bookings.flights_unpartitioned;
+    WHILE part_start <= part_last LOOP
+        EXECUTE format(
+            'CREATE TABLE bookings.%I PARTITION OF bookings.flights FOR VALUES FROM (%L) TO (%L)',
+            'flights_p' || to_char(part_start AT TIME ZONE 'UTC', 'YYYY_MM'),
+            part_start,
+            part_start + INTERVAL '1 month'
+        );
+        part_start := part_start + INTERVAL '1 month';
+    END LOOP;
+END
+$$;
+
+INSERT INTO bookings.flights SELECT * FROM bookings.flights_unpartitioned;
+SELECT setval('bookings.flights_flight_id_seq_new', COALESCE(MAX(flight_id), 0) + 1, false) FROM bookings.flights;
+
+-- ticket_flights: fixed hash partitions on flight_id
+CREATE SEQUENCE bookings.ticket_flights_id_seq_new AS bigint;
+CREATE TABLE bookings.ticket_flights (
+    LIKE bookings.ticket_flights_unpartitioned INCLUDING STORAGE
+) PARTITION BY HASH (flight_id);
+ALTER TABLE bookings.ticket_flights ALTER COLUMN id SET DEFAULT nextval('bookings.ticket_flights_id_seq_new');
+ALTER SEQUENCE bookings.ticket_flights_id_seq_new OWNED BY bookings.ticket_flights.id;
+
+DO $$
+BEGIN
+    FOR remainder IN 0..{partitions} - 1 LOOP
+        EXECUTE format(
+            'CREATE TABLE bookings.%I PARTITION OF bookings.ticket_flights FOR VALUES WITH (MODULUS {partitions}, REMAINDER %s)',
+            'ticket_flights_p' || lpad(remainder::text, 2, '0'),
+            remainder
+        );
+    END LOOP;
+END
+$$;
+
+INSERT INTO bookings.ticket_flights SELECT * FROM bookings.ticket_flights_unpartitioned;
+SELECT setval('bookings.ticket_flights_id_seq_new', COALESCE(MAX(id), 0) + 1, false) FROM bookings.ticket_flights;
+
+DROP TABLE bookings.ticket_flights_unpartitioned;
+DROP TABLE bookings.flights_unpartitioned;
+ALTER SEQUENCE bookings.flights_flight_id_seq_new RENAME TO flights_flight_id_seq;
+ALTER SEQUENCE bookings.ticket_flights_id_seq_new RENAME TO ticket_flights_id_seq;
+""".format(partitions=TICKET_FLIGHTS_PARTITIONS) + FLIGHTS_CONSTRAINTS_SQL.format(
+    flights_key='flight_id, scheduled_departure', ticket_flights_key='id, flight_id',
+) + MATVIEW_SQL
+
+UNPARTITION_SQL = """
+DROP MATERIALIZED VIEW IF EXISTS bookings.route_stats_mv;
+
+ALTER TABLE bookings.flights RENAME TO flights_partitioned;
+ALTER TABLE bookings.ticket_flights RENAME TO ticket_flights_partitioned;
+ALTER SEQUENCE bookings.flights_flight_id_seq OWNED BY NONE;
+ALTER SEQUENCE bookings.ticket_flights_id_seq OWNED BY NONE;
+
+CREATE TABLE bookings.flights (LIKE bookings.flights_partitioned INCLUDING DEFAULTS INCLUDING STORAGE);
+ALTER SEQUENCE bookings.flights_flight_id_seq OWNED BY bookings.flights.flight_id;
+INSERT INTO bookings.flights SELECT * FROM bookings.flights_partitioned;
+
+CREATE TABLE bookings.ticket_flights (LIKE bookings.ticket_flights_partitioned INCLUDING DEFAULTS INCLUDING STORAGE);
+ALTER SEQUENCE bookings.ticket_flights_id_seq OWNED BY bookings.ticket_flights.id;
+INSERT INTO bookings.ticket_flights SELECT * FROM bookings.ticket_flights_partitioned;
+
+DROP TABLE bookings.ticket_flights_partitioned;
+DROP TABLE bookings.flights_partitioned;
+""" + FLIGHTS_CONSTRAINTS_SQL.format(flights_key='flight_id', ticket_flights_key='id') + MATVIEW_SQL
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flightapp', '0009_stats_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticketflights',
+            name='flight_id',
+            field=models.ForeignKey(db_column='flight_id', db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='flightapp.flights'),
+        ),
+        migrations.AlterField(
+            model_name='boardingpasses',
+            name='ticket_no',
+            field=models.ForeignKey(db_column='ticket_no', db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='flightapp.ticketflights'),
+        ),
+        migrations.RunSQL(sql=PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+    ]
@@ -0,0 +1,134 @@
+# Change capture for route_daily_stats.
+#
+# Statement-level triggers on flights and ticket_flights append the change
+# each statement makes to the rollup's counters, one row per route and day,
+# to route_stats_changelog. apply_route_stats_changelog folds these deltas
+# into route_daily_stats (see rollup.apply_changelog). The triggers sit on
+# the partitioned parents, so they see every INSERT/UPDATE/DELETE, COPY
+# included, but not DML run directly against a partition: rows moved by
+# partitions.create_month are not logged. archive_month detaches the month
+# before removing its ticket_flights, so archived days keep their counters.
+#
+# Transition tables cannot be shared by a trigger on several events, hence
+# one trigger per event.
+
+from django.db import migrations
+
+
+FLIGHT_ROWS = """
+        SELECT
+            {sign} AS sign,
+            1 AS flights,
+            r.departure_airport,
+            r.arrival_airport,
+            (r.scheduled_departure AT TIME ZONE 'UTC')::date AS day,
+            r.actual_arrival - r.actual_departure AS flight_time,
+            -- Passengers move with the flight when its route or day changes
+            (SELECT COUNT(*) FROM bookings.ticket_flights tf WHERE tf.flight_id = r.flight_id) AS passengers
+        FROM {table} r
+"""
+
+TICKET_ROWS = """
+        SELECT
+            {sign} AS sign,
+            0 AS flights,
+            f.departure_airport,
+            f.arrival_airport,
+            (f.scheduled_departure AT TIME ZONE 'UTC')::date AS day,
+            NULL::interval AS flight_time,
+            1 AS passengers
+        FROM {table} t
+        JOIN bookings.flights f ON f.flight_id = t.flight_id
+"""
+
+LOG_SQL = """
+    INSERT INTO bookings.route_stats_changelog (
+        departure_airport, arrival_airport, day, flight_delta, actual_delta, time_delta, passenger_delta
+    )
+    SELECT *
+    FROM (
+        SELECT
+            departure_airport,
+            arrival_airport,
+            day,
+            SUM(sign * flights) AS flight_delta,
+            SUM(sign * (flight_time IS NOT NULL)::integer) AS actual_delta,
+            COALESCE(SUM(sign * flight_time), INTERVAL '0') AS time_delta,
+            SUM(sign * passengers) AS passenger_delta
+        FROM ({rows}) c
+        GROUP BY departure_airport, arrival_airport, day
+    ) d
+    -- Updates that do not move anything cancel out
+    WHERE (flight_delta, actual_delta, time_delta, passenger_delta) <> (0, 0, INTERVAL '0', 0);
+"""
+
+
+def log_function(name, rows):
+    def log(rows_sql):
+        return LOG_SQL.format(rows=rows_sql)
+
+    return f"""
+CREATE FUNCTION bookings.{name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {log(rows.format(sign=1, table='new_rows'))}
+    ELSIF TG_OP = 'DELETE' THEN
+        {log(rows.format(sign=-1, table='old_rows'))}
+    ELSE
+        {log(rows.format(sign=1, table='new_rows') + '        UNION ALL' + rows.format(sign=-1, table='old_rows'))}
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+
+
+def triggers(table, function):
+    return f"""
+CREATE TRIGGER {table}_changelog_insert AFTER INSERT ON bookings.{table}
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bookings.{function}();
+CREATE TRIGGER {table}_changelog_update AFTER UPDATE ON bookings.{table}
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bookings.{function}();
+CREATE TRIGGER {table}_changelog_delete AFTER DELETE ON bookings.{table}
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bookings.{function}();
+"""
+
+
+CHANGELOG_SQL = """
+CREATE TABLE bookings.route_stats_changelog (
+    id bigserial PRIMARY KEY,
+    departure_airport varchar(3) NOT NULL,
+    arrival_airport varchar(3) NOT NULL,
+    day date NOT NULL,
+    flight_delta integer NOT NULL,
+    actual_delta integer NOT NULL,
+    time_delta interval NOT NULL,
+    passenger_delta integer NOT NULL,
+    logged_at timestamptz NOT NULL DEFAULT now()
+);
+""" + log_function('flights_changelog', FLIGHT_ROWS) + log_function(
+    'ticket_flights_changelog', TICKET_ROWS
+) + triggers('flights', 'flights_changelog') + triggers('ticket_flights', 'ticket_flights_changelog')
+
+DROP_CHANGELOG_SQL = """
+DROP TRIGGER flights_changelog_insert ON bookings.flights;
+DROP TRIGGER flights_changelog_update ON bookings.flights;
+DROP TRIGGER flights_changelog_delete ON bookings.flights;
+DROP TRIGGER ticket_flights_changelog_insert ON bookings.ticket_flights;
+DROP TRIGGER ticket_flights_changelog_update ON bookings.ticket_flights;
+DROP TRIGGER ticket_flights_changelog_delete ON bookings.ticket_flights;
+DROP FUNCTION bookings.flights_changelog();
+DROP FUNCTION bookings.ticket_flights_changelog();
+DROP TABLE bookings.route_stats_changelog;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flightapp', '0010_partition_flights'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CHANGELOG_SQL, reverse_sql=DROP_CHANGELOG_SQL),
+    ]
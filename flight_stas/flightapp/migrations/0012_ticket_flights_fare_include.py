@@ -0,0 +1,78 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+# ticket_flights is partitioned (0010) and CREATE INDEX CONCURRENTLY does not
+# support partitioned tables. Dropping and recreating the index in one
+# transaction would hold ACCESS EXCLUSIVE on the parent and every partition,
+# blocking reads too, for the whole build. Instead the new index is created
+# empty ON ONLY the parent, built CONCURRENTLY on each partition and attached
+# partition by partition; the old index is dropped last.
+
+TABLE = 'ticket_flights'
+OLD_INDEX = ('ticket_flights_flight_idx', 'flight_id', 'amount')
+NEW_INDEX = ('ticket_flights_flight_fare_idx', 'flight_id', 'amount, fare_conditions')
+
+
+def partitions(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'bookings.ticket_flights'::regclass
+            ORDER BY c.relname
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def replace_index(schema_editor, old, new):
+    name, columns, include = new
+    # Invalid until every partition's index is attached
+    schema_editor.execute(
+        f"CREATE INDEX {name} ON ONLY bookings.{TABLE} ({columns}) INCLUDE ({include})"
+    )
+    for partition in partitions(schema_editor):
+        partition_index = f"{partition}_{name[len(TABLE) + 1:]}"
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY {partition_index} ON bookings.{partition} ({columns}) INCLUDE ({include})"
+        )
+        schema_editor.execute(f"ALTER INDEX bookings.{name} ATTACH PARTITION bookings.{partition_index}")
+    # Also drops the partitions' indexes attached to it; brief, nothing to build
+    schema_editor.execute(f"DROP INDEX bookings.{old[0]}")
+
+
+def add_fare_conditions(apps, schema_editor):
+    replace_index(schema_editor, OLD_INDEX, NEW_INDEX)
+
+
+def remove_fare_conditions(apps, schema_editor):
+    replace_index(schema_editor, NEW_INDEX, OLD_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('flightapp', '0011_route_stats_changelog'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='ticketflights',
+                    name='ticket_flights_flight_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='ticketflights',
+                    index=models.Index(fields=['flight_id'], include=['amount', 'fare_conditions'], name='ticket_flights_flight_fare_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_fare_conditions, remove_fare_conditions),
+            ],
+        ),
+    ]
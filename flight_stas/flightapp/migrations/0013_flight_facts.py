@@ -0,0 +1,161 @@
+# Per-flight fact table (flightapp.FlightFacts) and the triggers that keep it
+# current.
+#
+# Like the route_stats_changelog triggers (0011) these are statement-level
+# triggers on the partitioned parents, so ORM writes, feeds and COPY loads
+# are all seen. flights rows are upserted into flight_facts with their
+# route and duration. ticket_flights changes add their passenger
+# and revenue deltas to the flight's row. Tickets of flights that are no
+# longer attached to flights (archive_month) are ignored, so archived
+# flights keep their facts. The table starts empty:
+# manage.py backfill_flight_facts fills it.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FACT_COLUMNS = """
+    flight_id, departure_airport, arrival_airport, scheduled_departure,
+    duration_seconds, passenger_count, revenue
+"""
+
+FLIGHTS_FUNCTION = f"""
+CREATE FUNCTION bookings.flight_facts_flights() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM bookings.flight_facts ff USING old_rows o WHERE ff.flight_id = o.flight_id;
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM bookings.flight_facts ff
+        USING old_rows o
+        WHERE ff.flight_id = o.flight_id
+        AND NOT EXISTS (SELECT 1 FROM new_rows n WHERE n.flight_id = o.flight_id);
+    END IF;
+    INSERT INTO bookings.flight_facts ({FACT_COLUMNS})
+    SELECT
+        f.flight_id,
+        f.departure_airport,
+        f.arrival_airport,
+        f.scheduled_departure,
+        EXTRACT(EPOCH FROM f.actual_arrival - f.actual_departure)::integer,
+        COALESCE(t.passenger_count, 0),
+        COALESCE(t.revenue, 0)
+    FROM new_rows f
+    LEFT JOIN (
+        SELECT tf.flight_id, COUNT(*) AS passenger_count, SUM(tf.amount) AS revenue
+        FROM bookings.ticket_flights tf
+        WHERE tf.flight_id IN (SELECT flight_id FROM new_rows)
+        GROUP BY tf.flight_id
+    ) t ON t.flight_id = f.flight_id
+    -- Passengers and revenue are the ticket_flights trigger's business
+    ON CONFLICT (flight_id) DO UPDATE SET
+        departure_airport = EXCLUDED.departure_airport,
+        arrival_airport = EXCLUDED.arrival_airport,
+        scheduled_departure = EXCLUDED.scheduled_departure,
+        duration_seconds = EXCLUDED.duration_seconds;
+    RETURN NULL;
+END
+$$;
+"""
+
+TICKET_ROWS = """
+        SELECT {sign} AS sign, t.flight_id, t.amount
+        FROM {table} t
+        JOIN bookings.flights f ON f.flight_id = t.flight_id
+"""
+
+APPLY_TICKETS = """
+    UPDATE bookings.flight_facts ff SET
+        passenger_count = ff.passenger_count + d.passengers,
+        revenue = ff.revenue + d.revenue
+    FROM (
+        SELECT flight_id, SUM(sign) AS passengers, SUM(sign * amount) AS revenue
+        FROM ({rows}) c
+        GROUP BY flight_id
+    ) d
+    WHERE ff.flight_id = d.flight_id
+    -- Updates that do not move anything cancel out
+    AND (d.passengers, d.revenue) <> (0, 0);
+"""
+
+
+def apply_tickets(rows):
+    return APPLY_TICKETS.format(rows=rows)
+
+
+TICKETS_FUNCTION = f"""
+CREATE FUNCTION bookings.flight_facts_ticket_flights() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {apply_tickets(TICKET_ROWS.format(sign=1, table='new_rows'))}
+    ELSIF TG_OP = 'DELETE' THEN
+        {apply_tickets(TICKET_ROWS.format(sign=-1, table='old_rows'))}
+    ELSE
+        {apply_tickets(TICKET_ROWS.format(sign=1, table='new_rows') + '        UNION ALL'
+                       + TICKET_ROWS.format(sign=-1, table='old_rows'))}
+    END IF;
+    RETURN NULL;
+END
+$$;
+"""
+
+
+def triggers(table, function):
+    # Transition tables cannot be shared by a trigger on several events
+    return f"""
+CREATE TRIGGER {table}_facts_insert AFTER INSERT ON bookings.{table}
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bookings.{function}();
+CREATE TRIGGER {table}_facts_update AFTER UPDATE ON bookings.{table}
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bookings.{function}();
+CREATE TRIGGER {table}_facts_delete AFTER DELETE ON bookings.{table}
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bookings.{function}();
+"""
+
+
+FACTS_SQL = (
+    FLIGHTS_FUNCTION + TICKETS_FUNCTION
+    + triggers('flights', 'flight_facts_flights')
+    + triggers('ticket_flights', 'flight_facts_ticket_flights')
+)
+
+DROP_FACTS_SQL = """
+DROP TRIGGER flights_facts_insert ON bookings.flights;
+DROP TRIGGER flights_facts_update ON bookings.flights;
+DROP TRIGGER flights_facts_delete ON bookings.flights;
+DROP TRIGGER ticket_flights_facts_insert ON bookings.ticket_flights;
+DROP TRIGGER ticket_flights_facts_update ON bookings.ticket_flights;
+DROP TRIGGER ticket_flights_facts_delete ON bookings.ticket_flights;
+DROP FUNCTION bookings.flight_facts_flights();
+DROP FUNCTION bookings.flight_facts_ticket_flights();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flightapp', '0012_ticket_flights_fare_include'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightFacts',
+            fields=[
+                ('flight_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('scheduled_departure', models.DateTimeField()),
+                ('duration_seconds', models.IntegerField(blank=True, null=True)),
+                ('passenger_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('arrival_airport', models.ForeignKey(db_column='arrival_airport', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='flightapp.airportsdata')),
+                ('departure_airport', models.ForeignKey(db_column='departure_airport', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='flightapp.airportsdata')),
+            ],
+            options={
+                'db_table': 'flight_facts',
+                'indexes': [
+                    models.Index(fields=['departure_airport', 'scheduled_departure'], include=['arrival_airport', 'duration_seconds', 'passenger_count'], name='flight_facts_dep_sched_idx'),
+                    models.Index(fields=['scheduled_departure'], name='flight_facts_sched_idx'),
+                ],
+            },
+        ),
+        migrations.RunSQL(sql=FACTS_SQL, reverse_sql=DROP_FACTS_SQL),
+    ]
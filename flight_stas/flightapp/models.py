@@ -1,6 +1,8 @@
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.geos import Point
 from django.db import models
+from django.db.models import Q
+from django.db.models.fields.json import KT
 
 class AircraftsData(models.Model):
     aircraft_code = models.CharField(max_length=3, primary_key=True)
@@ -24,6 +26,10 @@ class AirportsData(models.Model):
 
     class Meta:
         db_table = 'airports_data'
+        indexes = [
+            # airport_name->>'en' lookups (departure_airport_name filters)
+            models.Index(KT('airport_name__en'), name='airports_name_en_idx'),
+        ]
 
     def __str__(self):
         return self.airport_code
@@ -91,7 +97,20 @@ class Flights(models.Model):
         db_table = 'flights'
         unique_together = ('flight_no', 'scheduled_departure')
         indexes = [
-            models.Index(fields=['departure_airport', 'scheduled_departure']),
+            # Covers the per-route stats queries: flight_id, arrival_airport and
+            # the actual times come from the index, so no heap visits
+            models.Index(
+                fields=['departure_airport', 'scheduled_departure'],
+                include=['arrival_airport', 'flight_id', 'actual_departure', 'actual_arrival'],
+                name='flights_dep_sched_cover_idx',
+            ),
+            # Only flights with a flight time; serves AVG(actual_arrival - actual_departure)
+            models.Index(
+                fields=['departure_airport', 'arrival_airport', 'scheduled_departure'],
+                include=['actual_departure', 'actual_arrival'],
+                condition=Q(actual_arrival__isnull=False, actual_departure__isnull=False),
+                name='flights_arrived_route_idx',
+            ),
         ]
 
     def __str__(self):
@@ -113,17 +132,25 @@ class Seats(models.Model):
 
 class TicketFlights(models.Model):
     ticket_no = models.ForeignKey(Tickets, on_delete=models.CASCADE, db_column='ticket_no')
-    flight_id = models.ForeignKey(Flights, on_delete=models.CASCADE, db_column='flight_id')
+    # flights is partitioned (see migration 0010): flight_id alone is not
+    # unique there, so the database cannot enforce this foreign key
+    flight_id = models.ForeignKey(Flights, on_delete=models.CASCADE, db_column='flight_id', db_constraint=False)
     fare_conditions = models.CharField(max_length=10, choices=[('Economy', 'Economy'), ('Comfort', 'Comfort'), ('Business', 'Business')])
     amount = models.DecimalField(max_digits=10, decimal_places=2)
 
     class Meta:
         db_table = 'ticket_flights'
         unique_together = ('ticket_no', 'flight_id')
+        indexes = [
+            # (ticket_no, flight_id) leads with ticket_no; passenger counts and
+            # revenue per flight and fare class are index-only scans on this one
+            models.Index(fields=['flight_id'], include=['amount', 'fare_conditions'], name='ticket_flights_flight_fare_idx'),
+        ]
 
 
 class BoardingPasses(models.Model):
-    ticket_no = models.ForeignKey(TicketFlights, on_delete=models.CASCADE, db_column='ticket_no')
+    # Not enforced by the database: ticket_flights is partitioned too
+    ticket_no = models.ForeignKey(TicketFlights, on_delete=models.CASCADE, db_column='ticket_no', db_constraint=False)
     flight_id = models.IntegerField()
     boarding_no = models.IntegerField()
     seat_no = models.CharField(max_length=4)
@@ -131,3 +158,94 @@ class BoardingPasses(models.Model):
     class Meta:
         db_table = 'boarding_passes'
         unique_together = ('flight_id', 'boarding_no')
+
+
+class RouteDailyStats(models.Model):
+    departure_airport = models.ForeignKey(
+        AirportsData,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_column='departure_airport'
+    )
+    arrival_airport = models.ForeignKey(
+        AirportsData,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_column='arrival_airport'
+    )
+    day = models.DateField()
+    flight_count = models.PositiveIntegerField(default=0)
+    # Flights that have both actual_departure and actual_arrival
+    actual_count = models.PositiveIntegerField(default=0)
+    total_flight_time = models.DurationField()
+    passenger_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'route_daily_stats'
+        unique_together = ('departure_airport', 'arrival_airport', 'day')
+        indexes = [
+            models.Index(fields=['departure_airport', 'day'], name='route_daily_dep_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.departure_airport_id}-{self.arrival_airport_id} {self.day}"
+
+
+class FlightFacts(models.Model):
+    """
+    One row per flight with its passenger count and revenue already summed,
+    kept current by triggers on flights and ticket_flights (migration 0013)
+    and rebuilt by manage.py backfill_flight_facts.
+    """
+    # Not a foreign key: flights is partitioned (see TicketFlights.flight_id).
+    # Facts of archived months outlive their flights, so the airports are
+    # not enforced either.
+    flight_id = models.IntegerField(primary_key=True)
+    departure_airport = models.ForeignKey(
+        AirportsData,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_column='departure_airport',
+        db_constraint=False,
+    )
+    arrival_airport = models.ForeignKey(
+        AirportsData,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_column='arrival_airport',
+        db_constraint=False,
+    )
+    scheduled_departure = models.DateTimeField()
+    # actual_arrival - actual_departure; NULL until the flight has landed
+    duration_seconds = models.IntegerField(null=True, blank=True)
+    # Plain integers: a CHECK failing inside the triggers would reject the booking itself
+    passenger_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'flight_facts'
+        indexes = [
+            # Covers the per-route aggregates: no heap visits for a window
+            models.Index(
+                fields=['departure_airport', 'scheduled_departure'],
+                include=['arrival_airport', 'duration_seconds', 'passenger_count'],
+                name='flight_facts_dep_sched_idx',
+            ),
+            models.Index(fields=['scheduled_departure'], name='flight_facts_sched_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.flight_id} {self.departure_airport_id}-{self.arrival_airport_id}"
+
+
+class StatsRefresh(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    covered_from = models.DateField(null=True, blank=True)
+    covered_to = models.DateField(null=True, blank=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'stats_refresh'
+
+    def __str__(self):
+        return self.name
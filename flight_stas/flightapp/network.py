@@ -0,0 +1,251 @@
+"""
+In-memory route network for itinerary queries.
+
+The scheduled flights of a date window form a time-dependent graph between
+airports. A Timetable keeps it as NumPy arrays in CSR form: per airport a
+range of links (one per destination it flies to), per link a range of
+flights sorted by departure. Flights are keyed by link * KEY_SPAN + departure
+time, so one searchsorted finds, for every link leaving a set of airports at
+once, the first flight that can still be caught. A reverse running minimum
+of the arrival times, keyed the same way, then gives the earliest arrival on
+each link from that flight on.
+
+fastest() is a round-based (RAPTOR-style) earliest-arrival search: round k
+extends the airports improved in round k - 1 by one flight, so itineraries
+with at most max_connections connections take max_connections + 1 rounds.
+Each round is a handful of vectorized NumPy operations. The same search on
+the reversed timetable (times negated) then finds the latest departure that
+still makes that arrival, so the itinerary does not start earlier than
+needed.
+
+Networks are built once per window and kept in a small LRU. They are dropped
+when Flights rows are saved or deleted (signals.py) or loaded in bulk, and
+expire after TTL seconds in any case.
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import replicas
+
+
+DEFAULTS = {
+    # Windows kept in memory per process
+    'MAX_WINDOWS': 8,
+    # Seconds a network is used before it is rebuilt
+    'TTL': 300,
+    # Longest window a network is built for, in days
+    'MAX_DAYS': 92,
+}
+
+# Link index and shifted time share one int64 key; times are seconds from
+# the window start and must stay within +-TIME_OFFSET
+TIME_OFFSET = 1 << 31
+KEY_SPAN = 1 << 32
+UNREACHED = np.iinfo(np.int64).max
+
+NETWORK_SQL = """
+SELECT
+    f.flight_id,
+    f.flight_no,
+    f.departure_airport,
+    f.arrival_airport,
+    EXTRACT(EPOCH FROM f.scheduled_departure)::bigint,
+    EXTRACT(EPOCH FROM f.scheduled_arrival)::bigint
+FROM bookings.flights f
+WHERE f.scheduled_departure >= %s
+AND f.scheduled_departure < %s
+AND f.status <> 'Cancelled'
+"""
+
+
+def conf(name):
+    return getattr(settings, 'STATS_NETWORK', {}).get(name, DEFAULTS[name])
+
+
+class Timetable:
+    """CSR adjacency over (origin, destination, departure, arrival) flight arrays."""
+
+    def __init__(self, origin, destination, departure, arrival, airport_count):
+        route = origin.astype(np.int64) * airport_count + destination
+        order = np.lexsort((departure, route))
+        route = route[order]
+        # Position in the flight table of each timetable entry
+        self.flight = order
+        self.departure = departure[order]
+        self.arrival = arrival[order]
+
+        routes, link_start = np.unique(route, return_index=True)
+        self.link_origin = routes // airport_count
+        self.link_destination = routes % airport_count
+        self.link_end = np.append(link_start[1:], len(route))
+        # Links of airport a are link_offsets[a]:link_offsets[a + 1]
+        self.link_offsets = np.searchsorted(self.link_origin, np.arange(airport_count + 1))
+
+        link = np.repeat(np.arange(len(routes), dtype=np.int64), self.link_end - link_start)
+        self.keys = link * KEY_SPAN + self.departure + TIME_OFFSET
+        # Earliest arrival among a flight and the later ones on its link:
+        # later links have larger keys, so the running minimum stays inside
+        arrival_keys = link * KEY_SPAN + self.arrival + TIME_OFFSET
+        self.earliest = np.minimum.accumulate(arrival_keys[::-1])[::-1]
+
+    def search(self, source, target, start, max_legs, min_layover):
+        """
+        Flight table positions of the earliest arriving itinerary from source
+        (leaving at start or later) to target, in travel order; None if there
+        is none within max_legs flights.
+        """
+        best = np.full(len(self.link_offsets) - 1, UNREACHED, dtype=np.int64)
+        best[source] = start
+        marked = np.array([source])
+        ready = np.array([start], dtype=np.int64)
+        rounds = []
+        for _ in range(max_legs):
+            first_link = self.link_offsets[marked]
+            counts = self.link_offsets[marked + 1] - first_link
+            total = int(counts.sum())
+            if not total:
+                break
+            # All links leaving the marked airports, with the time each can be caught from
+            links = np.repeat(first_link - np.cumsum(counts) + counts, counts) + np.arange(total)
+            link_ready = np.repeat(ready, counts)
+            position = np.searchsorted(self.keys, links * KEY_SPAN + link_ready + TIME_OFFSET)
+            caught = position < self.link_end[links]
+            links, position = links[caught], position[caught]
+            arrival = self.earliest[position] - links * KEY_SPAN - TIME_OFFSET
+            destination = self.link_destination[links]
+
+            # Earliest arrival per destination, kept if it beats both the best
+            # arrival there so far and the best arrival at the target
+            order = np.argsort(destination * KEY_SPAN + arrival + TIME_OFFSET)
+            destination, arrival = destination[order], arrival[order]
+            links, position = links[order], position[order]
+            first = np.ones(len(destination), dtype=bool)
+            first[1:] = destination[1:] != destination[:-1]
+            improved = first & (arrival < np.minimum(best[destination], best[target]))
+            destination, arrival = destination[improved], arrival[improved]
+            links, position = links[improved], position[improved]
+            if not len(destination):
+                break
+            best[destination] = arrival
+            rounds.append(dict(zip(destination.tolist(), zip(arrival.tolist(), links.tolist(), position.tolist()))))
+
+            onward = destination != target
+            marked = destination[onward]
+            ready = arrival[onward] + min_layover
+            if not len(marked):
+                break
+
+        if best[target] == UNREACHED:
+            return None
+        # The last round that reached the target has the earliest arrival
+        last = max(k for k, labels in enumerate(rounds) if target in labels)
+        legs = []
+        airport = target
+        for labels in reversed(rounds[:last + 1]):
+            arrival, link, position = labels[airport]
+            end = self.link_end[link]
+            position += int(np.flatnonzero(self.arrival[position:end] == arrival)[0])
+            legs.append(int(self.flight[position]))
+            airport = int(self.link_origin[link])
+        legs.reverse()
+        return legs
+
+
+class FlightNetwork:
+
+    def __init__(self, start, rows):
+        self.start = start
+        codes = sorted({row[2] for row in rows} | {row[3] for row in rows})
+        self.codes = codes
+        self.positions = {code: i for i, code in enumerate(codes)}
+        self.flight_id = np.array([row[0] for row in rows], dtype=np.int64)
+        self.flight_no = [row[1] for row in rows]
+        origin = np.array([self.positions[row[2]] for row in rows], dtype=np.int64)
+        destination = np.array([self.positions[row[3]] for row in rows], dtype=np.int64)
+        self.departure = np.array([row[4] for row in rows], dtype=np.int64) - start
+        self.arrival = np.array([row[5] for row in rows], dtype=np.int64) - start
+        self.origin, self.destination = origin, destination
+
+        self.forward = Timetable(origin, destination, self.departure, self.arrival, len(codes))
+        # Walking backwards in time: arrivals become departures and vice versa
+        self.backward = Timetable(destination, origin, -self.arrival, -self.departure, len(codes))
+
+    def fastest(self, from_code, to_code, depart_after, max_connections, min_layover):
+        """
+        Legs of the itinerary that arrives first and, among those, leaves
+        last; None if there is none. depart_after is epoch seconds,
+        min_layover seconds.
+        """
+        source = self.positions.get(from_code)
+        target = self.positions.get(to_code)
+        if source is None or target is None or source == target:
+            return None
+        max_legs = max_connections + 1
+        legs = self.forward.search(source, target, depart_after - self.start, max_legs, min_layover)
+        if legs is None:
+            return None
+        arrival = int(self.arrival[legs[-1]])
+        latest = self.backward.search(target, source, -arrival, max_legs, min_layover)
+        if latest is not None:
+            legs = latest[::-1]
+        return [
+            {
+                'flight_id': int(self.flight_id[i]),
+                'flight_no': self.flight_no[i],
+                'departure_airport': self.codes[self.origin[i]],
+                'arrival_airport': self.codes[self.destination[i]],
+                'departure': int(self.departure[i]) + self.start,
+                'arrival': int(self.arrival[i]) + self.start,
+            }
+            for i in legs
+        ]
+
+
+class FlightNetworks:
+    """Networks by (start, end) epoch seconds, least recently used dropped first."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._networks = OrderedDict()
+
+    def invalidate(self):
+        with self._lock:
+            self._networks.clear()
+
+    def get(self, start, end):
+        key = (start, end)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._networks.get(key)
+            if entry is not None and now - entry[0] < conf('TTL'):
+                self._networks.move_to_end(key)
+                return entry[1]
+        network = FlightNetwork(start, self._load(start, end))
+        with self._lock:
+            self._networks[key] = (now, network)
+            self._networks.move_to_end(key)
+            while len(self._networks) > conf('MAX_WINDOWS'):
+                self._networks.popitem(last=False)
+        return network
+
+    @staticmethod
+    def _load(start, end):
+        from_date, to_date = _isoformat(start), _isoformat(end)
+
+        def load():
+            with replicas.cursor() as cursor:
+                cursor.execute(NETWORK_SQL, [from_date, to_date])
+                return cursor.fetchall()
+        return replicas.run(from_date, to_date, load)
+
+
+def _isoformat(epoch):
+    return datetime.fromtimestamp(epoch, dt_timezone.utc).isoformat()
+
+
+flight_networks = FlightNetworks()
@@ -0,0 +1,129 @@
+"""
+Monthly partitions of bookings.flights.
+
+flights is range partitioned by month on scheduled_departure (flights_pYYYY_MM)
+with a flights_default partition catching anything outside them.
+ticket_flights is hash partitioned on flight_id into a fixed set of
+partitions and needs no maintenance. Old months are detached and either
+moved to an archive schema, together with their ticket_flights rows, or
+dropped. The rollup and the materialized view keep their aggregates.
+"""
+from datetime import date, datetime, time as dt_time, timezone as dt_timezone
+import re
+
+from django.db import connection, transaction
+
+
+SCHEMA = 'bookings'
+DEFAULT_PARTITION = 'flights_default'
+
+_PARTITION_SUFFIX = re.compile(r'_(p\d{4}_\d{2}|p\d{2}|default)$')
+
+
+def parent_table(relation):
+    """flights_p2017_08 -> flights, ticket_flights_p03 -> ticket_flights."""
+    return _PARTITION_SUFFIX.sub('', relation)
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(value):
+    """'YYYY-MM' -> first day of that month."""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def partition_name(month):
+    return f'flights_p{month:%Y_%m}'
+
+
+def month_bound(month):
+    return datetime.combine(month, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def month_partitions():
+    """{month: partition name} for the monthly partitions attached to flights."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'bookings.flights'::regclass
+        """)
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = re.fullmatch(r'flights_p(\d{4})_(\d{2})', name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+@transaction.atomic
+def create_month(month):
+    """
+    Create the partition for one month. Rows for that month already sitting
+    in flights_default are moved into it first, otherwise ATTACH would fail.
+    """
+    name = partition_name(month)
+    lower, upper = month_bound(month), month_bound(add_months(month, 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {SCHEMA}.{name} (LIKE {SCHEMA}.flights INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {SCHEMA}.{DEFAULT_PARTITION}
+                WHERE scheduled_departure >= %s AND scheduled_departure < %s
+                RETURNING *
+            )
+            INSERT INTO {SCHEMA}.{name} SELECT * FROM moved
+        """, [lower, upper])
+        moved = cursor.rowcount
+        # Bounds are our own datetimes; DDL cannot take bind parameters
+        cursor.execute(
+            f"ALTER TABLE {SCHEMA}.flights ATTACH PARTITION {SCHEMA}.{name} "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+    return name, moved
+
+
+@transaction.atomic
+def archive_month(month, archive_schema='archive', drop=False):
+    """
+    Detach one month. Its ticket_flights rows are moved to
+    archive_schema.ticket_flights_pYYYY_MM next to the detached partition,
+    or deleted together with it when drop is set.
+    """
+    name = partition_name(month)
+    ticket_table = f'ticket_flights_p{month:%Y_%m}'
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {SCHEMA}.flights DETACH PARTITION {SCHEMA}.{name}")
+        if drop:
+            cursor.execute(f"""
+                DELETE FROM {SCHEMA}.ticket_flights tf
+                USING {SCHEMA}.{name} f
+                WHERE tf.flight_id = f.flight_id
+            """)
+            tickets = cursor.rowcount
+            cursor.execute(f"DROP TABLE {SCHEMA}.{name}")
+            return None, tickets
+
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+        cursor.execute(f"ALTER TABLE {SCHEMA}.{name} SET SCHEMA {archive_schema}")
+        cursor.execute(f"CREATE TABLE {archive_schema}.{ticket_table} (LIKE {SCHEMA}.ticket_flights INCLUDING DEFAULTS)")
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {SCHEMA}.ticket_flights tf
+                USING {archive_schema}.{name} f
+                WHERE tf.flight_id = f.flight_id
+                RETURNING tf.*
+            )
+            INSERT INTO {archive_schema}.{ticket_table} SELECT * FROM moved
+        """)
+        tickets = cursor.rowcount
+    return f'{archive_schema}.{name}', tickets
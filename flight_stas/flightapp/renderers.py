@@ -0,0 +1,70 @@
+"""
+Fast JSON encoding for the statistics endpoints.
+
+orjson serializes the row dicts several times faster than json with
+DjangoJSONEncoder or DRF's JSONRenderer. Durations are encoded as numeric
+seconds and Decimals as strings (DRF's default). Falls back to the standard
+library encoder when orjson is not installed.
+"""
+from datetime import timedelta
+from decimal import Decimal
+import json
+import time
+
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'tolist'):
+        # NumPy scalars and arrays for the stdlib fallback
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def dumps(data):
+    """Encode data to JSON bytes, timed into the request profile if there is one."""
+    profile = metrics.current_profile()
+    if profile is None:
+        return _dumps(data)
+    started = time.perf_counter()
+    try:
+        return _dumps(data)
+    finally:
+        profile.serialize_time += time.perf_counter() - started
+
+
+class StatsJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class StatsJsonResponse(HttpResponse):
+    """JsonResponse counterpart using dumps()."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,274 @@
+"""
+Read replicas for the statistics endpoints.
+
+Statistics reads run inside replicas.run() (or the replica_reads decorator),
+which points ReplicaRouter and replicas.cursor() at one of the aliases in
+STATS_REPLICAS['ALIASES'] for the duration of the call. Everything else,
+writes included, stays on the primary.
+
+Replicas are tried in round-robin or least-latency order. Each one is probed
+at most every CHECK_INTERVAL seconds with a query that measures its replay
+lag, timed for the latency estimate. Reads only go to replicas at most
+MAX_LAG seconds behind. Without a stats response cache, closed windows go to
+any replica that answers. A replica whose connection fails is skipped for
+RETRY_AFTER seconds and the call is retried on the next candidate, the
+primary last. A query that fails on a healthy replica (cancelled by a
+recovery conflict, a statement timeout) only sends that call to the primary.
+
+The rollup/matview bookkeeping (StatsRefresh) is read through the router
+too, so a replica answers a window from its own copy of the rollup state.
+"""
+from contextlib import suppress
+from contextvars import ContextVar
+from functools import wraps
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, InterfaceError, OperationalError, connections
+
+from . import cache, metrics
+
+
+DEFAULTS = {
+    # DATABASES aliases of the replicas; none means every read uses the primary
+    'ALIASES': [],
+    # 'round_robin' or 'least_latency'
+    'STRATEGY': 'round_robin',
+    # Seconds a replica may lag behind (closed windows are exempt without a stats cache)
+    'MAX_LAG': 5.0,
+    # Seconds between lag/latency probes of one replica
+    'CHECK_INTERVAL': 5.0,
+    # Seconds a failed replica is skipped
+    'RETRY_AFTER': 30.0,
+}
+
+# 0 on an idle replica that has replayed everything it received; NULL if it
+# has not replayed a transaction yet
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# Weight of the newest probe in the latency moving average
+LATENCY_SMOOTHING = 0.3
+
+
+def conf(name):
+    return getattr(settings, 'STATS_REPLICAS', {}).get(name, DEFAULTS[name])
+
+
+_current = ContextVar('flightapp_read_alias', default=DEFAULT_DB_ALIAS)
+
+
+def current():
+    """Alias the statistics reads of this call go to."""
+    return _current.get()
+
+
+def cursor():
+    return connections[current()].cursor()
+
+
+def run_on(alias, func, *args, **kwargs):
+    """Call func with reads routed to alias, without failover."""
+    token = _current.set(alias)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current.reset(token)
+
+
+class ReplicaStatus:
+    __slots__ = ('checked_at', 'lag', 'latency', 'down_until')
+
+    def __init__(self):
+        self.checked_at = None
+        self.lag = None
+        self.latency = None
+        self.down_until = 0.0
+
+
+class ReplicaSet:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {}
+        self._turn = itertools.count()
+
+    def aliases(self):
+        return list(conf('ALIASES'))
+
+    def status(self, alias):
+        with self._lock:
+            return self._status.setdefault(alias, ReplicaStatus())
+
+    def probe(self, alias):
+        """(lag seconds or None, round trip seconds) of one replica."""
+        started = time.perf_counter()
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = cursor.fetchone()[0]
+        return (float(lag) if lag is not None else None), time.perf_counter() - started
+
+    def check(self, alias, now):
+        """Refresh lag and latency if the last probe is older than CHECK_INTERVAL; False if it is down."""
+        status = self.status(alias)
+        if status.down_until > now:
+            return False
+        if status.checked_at is not None and now - status.checked_at < conf('CHECK_INTERVAL'):
+            return True
+        try:
+            lag, latency = self.probe(alias)
+        except (OperationalError, InterfaceError):
+            self.mark_down(alias)
+            return False
+        with self._lock:
+            status.checked_at = now
+            status.lag = lag
+            status.latency = latency if status.latency is None else (
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * status.latency
+            )
+        return True
+
+    def mark_down(self, alias):
+        status = self.status(alias)
+        with self._lock:
+            status.down_until = time.monotonic() + conf('RETRY_AFTER')
+            status.checked_at = None
+        metrics.count_replica_error(alias)
+        # Do not hand the broken connection to the next request
+        if alias in settings.DATABASES:
+            with suppress(DatabaseError):
+                connections[alias].close()
+
+    def candidates(self, from_date, to_date):
+        """Aliases to try for a window, in order; always ends with the primary."""
+        aliases = self.aliases()
+        if not aliases:
+            return [DEFAULT_DB_ALIAS]
+        now = time.monotonic()
+        # A closed window's rows could come from any replica, but a write to
+        # a past day invalidates the response cache as soon as it commits on
+        # the primary. A lagging replica would then hand the pre-write rows
+        # to the next miss, which caches them under the new generation.
+        bounded = cache.enabled() or not cache.is_historical(to_date)
+        usable = []
+        for alias in aliases:
+            if not self.check(alias, now):
+                continue
+            lag = self.status(alias).lag
+            if bounded and (lag is None or lag > conf('MAX_LAG')):
+                continue
+            usable.append(alias)
+
+        if conf('STRATEGY') == 'least_latency':
+            usable.sort(key=lambda alias: self.status(alias).latency)
+        elif usable:
+            shift = next(self._turn) % len(usable)
+            usable = usable[shift:] + usable[:shift]
+        return usable + [DEFAULT_DB_ALIAS]
+
+    def run(self, from_date, to_date, func, *args, **kwargs):
+        """
+        Call func with reads routed to the first candidate that answers. A
+        replica whose connection broke is marked down and the next one is
+        tried; a query that failed on a working replica (a recovery conflict,
+        a statement timeout) is retried on the primary only.
+        """
+        candidates = self.candidates(from_date, to_date)
+        while candidates:
+            alias = candidates.pop(0)
+            token = _current.set(alias)
+            try:
+                result = func(*args, **kwargs)
+            except (OperationalError, InterfaceError) as exc:
+                if alias == DEFAULT_DB_ALIAS:
+                    raise
+                if self.connection_failed(alias, exc):
+                    self.mark_down(alias)
+                else:
+                    metrics.count_replica_error(alias)
+                    candidates = [DEFAULT_DB_ALIAS]
+                continue
+            finally:
+                _current.reset(token)
+            metrics.count_read(alias)
+            return result
+
+    def connection_failed(self, alias, exc):
+        """True if exc broke the connection itself rather than one query."""
+        if isinstance(exc, InterfaceError):
+            return True
+        connection = connections[alias]
+        return connection.connection is None or not connection.is_usable()
+
+    def choose(self, from_date, to_date):
+        """
+        A connected alias for reads that outlive the call, like a streamed
+        response. Only connecting is retried: a replica that fails once rows
+        were sent breaks the response.
+        """
+        for alias in self.candidates(from_date, to_date):
+            if alias == DEFAULT_DB_ALIAS:
+                break
+            try:
+                connections[alias].ensure_connection()
+            except (OperationalError, InterfaceError):
+                self.mark_down(alias)
+                continue
+            metrics.count_read(alias)
+            return alias
+        metrics.count_read(DEFAULT_DB_ALIAS)
+        return DEFAULT_DB_ALIAS
+
+    def info(self):
+        now = time.monotonic()
+        replicas = {}
+        for alias in self.aliases():
+            status = self.status(alias)
+            replicas[alias] = {
+                'up': status.down_until <= now,
+                'lag': status.lag,
+                'latency_ms': round(status.latency * 1000, 3) if status.latency is not None else None,
+            }
+        return {'strategy': conf('STRATEGY'), 'max_lag': conf('MAX_LAG'), 'replicas': replicas}
+
+
+replica_set = ReplicaSet()
+
+
+def run(from_date, to_date, func, *args, **kwargs):
+    return replica_set.run(from_date, to_date, func, *args, **kwargs)
+
+
+def replica_reads(method):
+    """
+    Run a view's stats(departure_airport_name, from_date, to_date, *extra)
+    on a replica. Goes under cached_stats, so cache hits never connect.
+    """
+    @wraps(method)
+    def wrapper(self, departure_airport_name, from_date, to_date, *extra):
+        return run(from_date, to_date, method, self, departure_airport_name, from_date, to_date, *extra)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Sends ORM reads inside replicas.run() to its alias; writes and migrations to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return current()
+
+    def db_for_write(self, model, **hints):
+        # Explicit, otherwise objects read from a replica would be saved there
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in conf('ALIASES')
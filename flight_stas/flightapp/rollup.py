@@ -0,0 +1,323 @@
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache
+from .models import StatsRefresh
+
+
+ROLLUP_NAME = 'route_daily_stats'
+CHANGELOG = 'bookings.route_stats_changelog'
+
+
+# One row per (departure_airport, arrival_airport, day). Days are UTC days,
+# the same clock the views compare scheduled_departure against (USE_TZ=True).
+REFRESH_SQL = """
+WITH filtered_flights AS (
+    SELECT
+        flight_id,
+        departure_airport,
+        arrival_airport,
+        (scheduled_departure AT TIME ZONE 'UTC')::date AS day,
+        actual_arrival - actual_departure AS flight_time
+    FROM bookings.flights
+    WHERE scheduled_departure >= %s::timestamp
+    AND scheduled_departure < %s::timestamp
+),
+passengers AS (
+    SELECT tf.flight_id, COUNT(*) AS passenger_count
+    FROM bookings.ticket_flights tf
+    JOIN filtered_flights ff ON ff.flight_id = tf.flight_id
+    GROUP BY tf.flight_id
+)
+INSERT INTO bookings.route_daily_stats (
+    departure_airport, arrival_airport, day,
+    flight_count, actual_count, total_flight_time, passenger_count
+)
+SELECT
+    ff.departure_airport,
+    ff.arrival_airport,
+    ff.day,
+    COUNT(*),
+    COUNT(ff.flight_time),
+    COALESCE(SUM(ff.flight_time), INTERVAL '0'),
+    COALESCE(SUM(p.passenger_count), 0)
+FROM filtered_flights ff
+LEFT JOIN passengers p ON p.flight_id = ff.flight_id
+GROUP BY ff.departure_airport, ff.arrival_airport, ff.day;
+"""
+
+
+# Same shape as the /api/stats1/ query, answered from the daily rollup.
+# SUM(interval) / SUM(count) is exactly what AVG(interval) computes.
+ROUTE_STATS_SQL = """
+SELECT
+    r.arrival_airport,
+    SUM(r.total_flight_time) / NULLIF(SUM(r.actual_count), 0) AS avg_flight_time,
+    SUM(r.flight_count) AS flight_count,
+    SUM(r.passenger_count) AS passenger_count
+FROM bookings.route_daily_stats r
+WHERE r.departure_airport = %s
+AND r.day >= %s::date
+AND r.day < %s::date
+GROUP BY r.arrival_airport;
+"""
+
+# Per destination and date_trunc bucket (day, week or month) for /api/stats1/trend/
+ROUTE_TREND_SQL = """
+SELECT
+    r.arrival_airport,
+    date_trunc(%s, r.day::timestamp) AS bucket,
+    SUM(r.total_flight_time) / NULLIF(SUM(r.actual_count), 0) AS avg_flight_time,
+    SUM(r.flight_count) AS flight_count,
+    SUM(r.passenger_count) AS passenger_count
+FROM bookings.route_daily_stats r
+WHERE r.departure_airport = %s
+AND r.day >= %s::date
+AND r.day < %s::date
+GROUP BY r.arrival_airport, bucket
+ORDER BY r.arrival_airport, bucket;
+"""
+
+BATCH_ROUTE_STATS_SQL = """
+SELECT
+    r.departure_airport,
+    r.arrival_airport,
+    SUM(r.total_flight_time) / NULLIF(SUM(r.actual_count), 0) AS avg_flight_time,
+    SUM(r.flight_count) AS flight_count,
+    SUM(r.passenger_count) AS passenger_count
+FROM bookings.route_daily_stats r
+WHERE r.day >= %s::date
+AND r.day < %s::date
+{airport_filter}
+GROUP BY r.departure_airport, r.arrival_airport
+ORDER BY r.departure_airport;
+"""
+
+# Folds one batch of route_stats_changelog (migration 0011) into the rollup.
+# Consuming the rows and applying them happen in one statement, so a delta
+# is applied exactly once however often the worker is interrupted. Days
+# outside the covered window are dropped: the refresh that extends the
+# window recomputes them anyway.
+APPLY_CHANGELOG_SQL = """
+WITH consumed AS (
+    DELETE FROM bookings.route_stats_changelog
+    WHERE id IN (SELECT id FROM bookings.route_stats_changelog ORDER BY id LIMIT %(limit)s)
+    RETURNING departure_airport, arrival_airport, day,
+              flight_delta, actual_delta, time_delta, passenger_delta
+),
+deltas AS (
+    SELECT
+        departure_airport,
+        arrival_airport,
+        day,
+        SUM(flight_delta) AS flight_delta,
+        SUM(actual_delta) AS actual_delta,
+        SUM(time_delta) AS time_delta,
+        SUM(passenger_delta) AS passenger_delta
+    FROM consumed
+    WHERE day >= %(covered_from)s AND day < %(covered_to)s
+    GROUP BY departure_airport, arrival_airport, day
+),
+updated AS (
+    UPDATE bookings.route_daily_stats r SET
+        flight_count = GREATEST(r.flight_count + d.flight_delta, 0),
+        actual_count = GREATEST(r.actual_count + d.actual_delta, 0),
+        total_flight_time = GREATEST(r.total_flight_time + d.time_delta, INTERVAL '0'),
+        passenger_count = GREATEST(r.passenger_count + d.passenger_delta, 0)
+    FROM deltas d
+    WHERE r.departure_airport = d.departure_airport
+    AND r.arrival_airport = d.arrival_airport
+    AND r.day = d.day
+    RETURNING r.departure_airport, r.arrival_airport, r.day
+),
+inserted AS (
+    INSERT INTO bookings.route_daily_stats (
+        departure_airport, arrival_airport, day,
+        flight_count, actual_count, total_flight_time, passenger_count
+    )
+    SELECT
+        d.departure_airport, d.arrival_airport, d.day,
+        GREATEST(d.flight_delta, 0), GREATEST(d.actual_delta, 0),
+        GREATEST(d.time_delta, INTERVAL '0'), GREATEST(d.passenger_delta, 0)
+    FROM deltas d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM updated u
+        WHERE u.departure_airport = d.departure_airport
+        AND u.arrival_airport = d.arrival_airport
+        AND u.day = d.day
+    )
+    RETURNING departure_airport
+)
+SELECT
+    (SELECT COUNT(*) FROM consumed),
+    ARRAY(SELECT departure_airport FROM updated UNION SELECT departure_airport FROM inserted);
+"""
+
+
+def parse_day(value):
+    """Return the date if value is a midnight (UTC) timestamp, otherwise None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None and parsed.utcoffset() != timedelta(0):
+        return None
+    if parsed.time() != datetime.min.time():
+        return None
+    return parsed.date()
+
+
+def covered_window(from_date, to_date):
+    """
+    Return (from_day, to_day) if the window can be answered from the rollup,
+    otherwise None and the view falls back to the live query.
+    """
+    from_day = parse_day(from_date)
+    to_day = parse_day(to_date)
+    if from_day is None or to_day is None or from_day >= to_day:
+        return None
+
+    state = StatsRefresh.objects.filter(name=ROLLUP_NAME).first()
+    if state is None or state.covered_from is None or state.covered_to is None:
+        return None
+    if from_day < state.covered_from or to_day > state.covered_to:
+        return None
+    return from_day, to_day
+
+
+def _rollup_airports(cursor, start, end):
+    cursor.execute(
+        "SELECT DISTINCT departure_airport FROM bookings.route_daily_stats WHERE day >= %s AND day < %s",
+        [start, end]
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _flight_days(cursor):
+    cursor.execute("""
+        SELECT
+            MIN((scheduled_departure AT TIME ZONE 'UTC')::date),
+            MAX((scheduled_departure AT TIME ZONE 'UTC')::date)
+        FROM bookings.flights
+    """)
+    first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return None
+    return first_day, last_day + timedelta(days=1)
+
+
+@transaction.atomic
+def refresh_route_stats(start=None, end=None, full=False):
+    """
+    Recompute route_daily_stats for the days in [start, end).
+
+    Without bounds the refresh is incremental: from the last covered day (or
+    yesterday, whichever is earlier) up to the last scheduled flight. The first
+    run builds everything. The range is widened so the covered window never has
+    gaps. Returns the refreshed (start, end), or None if there are no flights.
+    """
+    state = StatsRefresh.objects.select_for_update().filter(name=ROLLUP_NAME).first()
+    if full:
+        state = None
+
+    with connection.cursor() as cursor:
+        # Waits for writers that already logged changes to commit and holds
+        # new ones back until the refresh commits. Everything logged so far
+        # for the refreshed days is then included in the recomputation and
+        # is discarded below instead of being applied a second time.
+        cursor.execute(f"LOCK TABLE {CHANGELOG} IN SHARE ROW EXCLUSIVE MODE")
+        if start is None or end is None:
+            bounds = _flight_days(cursor)
+            if bounds is None:
+                return None
+            if start is None:
+                start = bounds[0]
+                if state is not None and state.covered_to is not None:
+                    # Flights from yesterday on can still change (actual times,
+                    # new tickets), so they are always recomputed. The response
+                    # cache shares this horizon (cache.MUTABLE_DAYS).
+                    yesterday = timezone.now().date() - timedelta(days=cache.MUTABLE_DAYS)
+                    start = max(start, min(state.covered_to - timedelta(days=1), yesterday))
+            if end is None:
+                end = max(bounds[1], start + timedelta(days=1))
+
+        if state is not None and state.covered_from is not None:
+            start = min(start, state.covered_to)
+            end = max(end, state.covered_from)
+
+        # Airports whose rollup rows are replaced, before and after, so their
+        # cached responses are dropped once the refresh commits
+        if full:
+            cursor.execute("SELECT DISTINCT departure_airport FROM bookings.route_daily_stats")
+            airports = {row[0] for row in cursor.fetchall()}
+            cursor.execute("TRUNCATE bookings.route_daily_stats")
+        else:
+            airports = _rollup_airports(cursor, start, end)
+            cursor.execute(
+                "DELETE FROM bookings.route_daily_stats WHERE day >= %s AND day < %s",
+                [start, end]
+            )
+        cursor.execute(REFRESH_SQL, [start, end])
+        airports |= _rollup_airports(cursor, start, end)
+        if full:
+            cursor.execute(f"DELETE FROM {CHANGELOG}")
+        else:
+            cursor.execute(f"DELETE FROM {CHANGELOG} WHERE day >= %s AND day < %s", [start, end])
+
+    covered_from, covered_to = start, end
+    if state is not None and state.covered_from is not None:
+        covered_from = min(covered_from, state.covered_from)
+        covered_to = max(covered_to, state.covered_to)
+
+    StatsRefresh.objects.update_or_create(
+        name=ROLLUP_NAME,
+        defaults={
+            'covered_from': covered_from,
+            'covered_to': covered_to,
+            'refreshed_at': timezone.now(),
+        }
+    )
+    for airport in airports:
+        transaction.on_commit(partial(cache.invalidate_airport, airport))
+    return start, end
+
+
+@transaction.atomic
+def apply_changelog(limit=10000):
+    """
+    Apply up to `limit` logged changes to route_daily_stats. Returns the
+    number of changelog rows consumed; 0 means the log is empty.
+    """
+    with connection.cursor() as cursor:
+        # One worker at a time, and never during a refresh. Writers adding
+        # to the log are not blocked.
+        cursor.execute(f"LOCK TABLE {CHANGELOG} IN SHARE UPDATE EXCLUSIVE MODE")
+        state = StatsRefresh.objects.filter(name=ROLLUP_NAME).first()
+        if state is None or state.covered_from is None:
+            # No rollup yet: the first refresh builds everything
+            cursor.execute(f"""
+                DELETE FROM {CHANGELOG}
+                WHERE id IN (SELECT id FROM {CHANGELOG} ORDER BY id LIMIT %s)
+            """, [limit])
+            return cursor.rowcount
+        cursor.execute(APPLY_CHANGELOG_SQL, {
+            'limit': limit,
+            'covered_from': state.covered_from,
+            'covered_to': state.covered_to,
+        })
+        consumed, airports = cursor.fetchone()
+        if airports:
+            # Flights cancelled or moved away leave empty routes behind
+            cursor.execute("""
+                DELETE FROM bookings.route_daily_stats
+                WHERE departure_airport = ANY(%s) AND flight_count = 0
+            """, [airports])
+        for airport in airports or ():
+            transaction.on_commit(partial(cache.invalidate_airport, airport))
+    return consumed
+
@@ -0,0 +1,77 @@
+from functools import partial
+
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache, dbpool
+from .middleware import install_profiler
+from .airports import airport_index
+from .capacity import seat_capacity
+from .distances import distance_matrix
+from .network import flight_networks
+from .models import AircraftsData, AirportsData, Flights, Seats, TicketFlights
+
+
+@receiver([post_save, post_delete], sender=AirportsData)
+def airports_changed(sender, instance, **kwargs):
+    airport_index.invalidate()
+    # Coordinates may have changed
+    distance_matrix.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Seats)
+@receiver([post_save, post_delete], sender=AircraftsData)
+def seats_changed(sender, instance, **kwargs):
+    seat_capacity.invalidate()
+
+
+@receiver(pre_save, sender=Flights)
+def remember_departure_airport(sender, instance, **kwargs):
+    # A flight moved to another departure airport changes both airports' stats
+    if instance.pk is None:
+        return
+    instance._previous_departure_airport = Flights.objects.filter(
+        pk=instance.pk
+    ).values_list('departure_airport', flat=True).first()
+
+
+def invalidate_on_commit(airport_code):
+    # Not before the write commits: a request in between would recompute from
+    # the old snapshot and store it under the new generation
+    transaction.on_commit(partial(cache.invalidate_airport, airport_code), using=DEFAULT_DB_ALIAS)
+
+
+@receiver([post_save, post_delete], sender=Flights)
+def flights_changed(sender, instance, **kwargs):
+    invalidate_on_commit(instance.departure_airport_id)
+    flight_networks.invalidate()
+    previous = getattr(instance, '_previous_departure_airport', None)
+    if previous is not None and previous != instance.departure_airport_id:
+        invalidate_on_commit(previous)
+
+
+@receiver([post_save, post_delete], sender=TicketFlights)
+def ticket_flights_changed(sender, instance, **kwargs):
+    departure_airport = Flights.objects.filter(
+        pk=instance.flight_id_id
+    ).values_list('departure_airport', flat=True).first()
+    invalidate_on_commit(departure_airport)
+
+
+@receiver(request_started)
+def count_request(sender, **kwargs):
+    dbpool.count('requests')
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    if connection.alias == 'default':
+        dbpool.count('connections_created')
+
+
+@receiver(connection_created)
+def profile_connection(sender, connection, **kwargs):
+    install_profiler(connection)
@@ -0,0 +1,166 @@
+"""
+Single-flight execution of identical statistics computations.
+
+A dashboard refresh sends many identical requests at once. All of them miss
+the response cache and, without coordination, each runs the same query.
+SingleFlight lets the first caller for a key (the leader) compute the result
+while callers that arrive meanwhile wait for it and share it. The waiters
+get the leader's result, or its exception.
+
+That covers the threads of one worker. With ADVISORY_LOCK the leaders of
+different workers also serialize on a PostgreSQL advisory lock derived from
+the key. The first one computes and stores the result in the response
+cache. The others find it there once the lock is released. This only helps
+when the stats cache is shared between workers (Redis, Memcached).
+
+AsyncSingleFlight does the same for coroutines on one event loop (the ASGI
+views), without a thread per waiting caller.
+"""
+import asyncio
+import hashlib
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ADVISORY_LOCK': False,
+    # Seconds a caller waits for another one's result before computing it itself
+    'TIMEOUT': 30,
+}
+
+
+def conf(name):
+    return getattr(settings, 'STATS_SINGLE_FLIGHT', {}).get(name, DEFAULTS[name])
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """(func(), shared): shared is True if another caller's result was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(conf('TIMEOUT')):
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            # The leader is stuck; do not wait any longer than a cache miss would
+            return func(), False
+
+        try:
+            call.result = func()
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+
+    def __init__(self):
+        # (event loop, key) -> the leader's future
+        self._calls = {}
+
+    async def do(self, key, func):
+        """(await func(), shared): shared is True if another caller's result was reused."""
+        loop = asyncio.get_running_loop()
+        future = self._calls.get((loop, key))
+
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), conf('TIMEOUT')), True
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Only the leader was cancelled (its client went away)
+                if not future.cancelled():
+                    raise
+            return await func(), False
+
+        future = self._calls[loop, key] = loop.create_future()
+        try:
+            result = await func()
+        except Exception as exc:
+            future.set_exception(exc)
+            # Retrieved, so a call without waiters does not log it again
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[loop, key]
+            if not future.done():
+                future.cancel()
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+
+
+def lock_id(key):
+    """Signed 64-bit advisory lock id for a key."""
+    return int.from_bytes(hashlib.md5(key.encode(), usedforsecurity=False).digest()[:8], 'big', signed=True)
+
+
+def across_workers(key, lookup, compute):
+    """
+    Compute under the advisory lock for key, unless lookup() finds the result
+    another worker stored while this one waited for the lock. Returns
+    (result, shared). Without the lock within TIMEOUT, computes anyway.
+    """
+    lock_timed_out = False
+    try:
+        # The lock lasts until this transaction ends; the computation itself
+        # may read elsewhere (a replica)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = %s", [f"{int(conf('TIMEOUT') * 1000)}ms"])
+                try:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", [lock_id(key)])
+                except OperationalError as exc:
+                    lock_timed_out = getattr(exc.__cause__, 'sqlstate', None) == '55P03'
+                    raise
+                # Only the wait for the advisory lock is bounded, not the
+                # computation's own queries on this connection
+                cursor.execute("SET LOCAL lock_timeout = DEFAULT")
+            result = lookup()
+            if result is not None:
+                return result, True
+            return compute(), False
+    except OperationalError:
+        if not lock_timed_out:
+            raise
+    # lock_not_available: another worker holds it for too long
+    return compute(), False
@@ -0,0 +1,112 @@
+"""
+Synthetic bookings data for benchmarks.
+
+Everything is generated in SQL with generate_series, so it is deterministic and
+cheap to load. Synthetic flights are scheduled from BASE_DEPARTURE on (year
+2100), so they never overlap with real data; call the helpers inside a
+transaction that is rolled back afterwards.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+
+FLIGHT_PREFIX = 'BX'
+AIRCRAFT_CODE = 'BX1'
+BASE_DEPARTURE = datetime(2100, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def ensure_aircraft(cursor):
+    cursor.execute("""
+        INSERT INTO bookings.aircrafts_data (aircraft_code, model, range)
+        VALUES (%s, '{"en": "Synthetic"}', 5000)
+        ON CONFLICT (aircraft_code) DO NOTHING
+    """, [AIRCRAFT_CODE])
+
+
+def destinations(cursor, hub_code, limit=None):
+    cursor.execute("""
+        SELECT airport_code FROM bookings.airports_data
+        WHERE airport_code <> %s
+        ORDER BY airport_code
+        LIMIT %s
+    """, [hub_code, limit])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def window_for(count):
+    """[from, to) covering the first `count` synthetic flights (one per minute)."""
+    return BASE_DEPARTURE, BASE_DEPARTURE + timedelta(minutes=count)
+
+
+def add_hub_flights(cursor, hub_code, arrival_codes, first, count, passengers=20):
+    """
+    Insert flights first .. first+count-1 departing from hub_code, spread over
+    arrival_codes, with on average `passengers` tickets each.
+    """
+    if not count:
+        return
+    params = {
+        'prefix': FLIGHT_PREFIX,
+        'base': BASE_DEPARTURE,
+        'hub': hub_code,
+        'arrivals': list(arrival_codes),
+        'aircraft': AIRCRAFT_CODE,
+        'first': first,
+        'last': first + count - 1,
+        'spread': 2 * passengers + 1,
+    }
+    cursor.execute("""
+        INSERT INTO bookings.flights (
+            flight_no, scheduled_departure, scheduled_arrival,
+            departure_airport, arrival_airport, status, aircraft_code,
+            actual_departure, actual_arrival
+        )
+        SELECT
+            %(prefix)s || lpad((n %% 10000)::text, 4, '0'),
+            %(base)s + n * INTERVAL '1 minute',
+            %(base)s + n * INTERVAL '1 minute' + (60 + n %% 180) * INTERVAL '1 minute',
+            %(hub)s,
+            (%(arrivals)s::text[])[1 + n %% cardinality(%(arrivals)s::text[])],
+            CASE WHEN n %% 10 = 0 THEN 'Scheduled' ELSE 'Arrived' END,
+            %(aircraft)s,
+            CASE WHEN n %% 10 = 0 THEN NULL
+                 ELSE %(base)s + n * INTERVAL '1 minute' + (n %% 17) * INTERVAL '1 minute' END,
+            CASE WHEN n %% 10 = 0 THEN NULL
+                 ELSE %(base)s + n * INTERVAL '1 minute' + (60 + n %% 180 + n %% 23) * INTERVAL '1 minute' END
+        FROM generate_series(%(first)s, %(last)s) AS n
+    """, params)
+
+    cursor.execute("""
+        CREATE TEMP TABLE synthetic_seats ON COMMIT DROP AS
+        SELECT
+            f.flight_id,
+            %(prefix)s || lpad(s.n::text, 8, '0') || lpad(s.k::text, 3, '0') AS ticket_no,
+            'B' || lpad((s.n %% 100000)::text, 5, '0') AS book_ref
+        FROM (
+            SELECT n, generate_series(1, ((n::bigint * 7919) %% %(spread)s)::int) AS k
+            FROM generate_series(%(first)s, %(last)s) AS n
+        ) s
+        JOIN bookings.flights f
+        ON f.flight_no = %(prefix)s || lpad((s.n %% 10000)::text, 4, '0')
+        AND f.scheduled_departure = %(base)s + s.n * INTERVAL '1 minute'
+    """, params)
+    cursor.execute("""
+        INSERT INTO bookings.bookings (book_ref, book_date, total_amount)
+        SELECT DISTINCT book_ref, %(base)s - INTERVAL '30 days', 0
+        FROM synthetic_seats
+        ON CONFLICT (book_ref) DO NOTHING
+    """, params)
+    cursor.execute("""
+        INSERT INTO bookings.tickets (ticket_no, book_ref, passenger_id, passenger_name)
+        SELECT ticket_no, book_ref, right(ticket_no, 10), 'SYNTHETIC PASSENGER'
+        FROM synthetic_seats
+    """)
+    cursor.execute("""
+        INSERT INTO bookings.ticket_flights (ticket_no, flight_id, fare_conditions, amount)
+        SELECT
+            ticket_no,
+            flight_id,
+            CASE WHEN right(ticket_no, 1) = '0' THEN 'Business' ELSE 'Economy' END,
+            CASE WHEN right(ticket_no, 1) = '0' THEN 30000 ELSE 6000 END
+        FROM synthetic_seats
+    """)
+    cursor.execute("DROP TABLE synthetic_seats")
@@ -1,3 +1,1546 @@
-from django.test import TestCase
+import asyncio
+from dataclasses import replace
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import json
+from decimal import Decimal
+from io import StringIO
+import os
+import tempfile
+import threading
 
-# Create your tests here.
+from django.contrib.gis.geos import Point
+import time
+
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import cache, columnar, datagen, facts, ingest, matview, metrics, replicas, rollup, singleflight, synthetic
+from .airports import airport_index
+from .cache import cached_stats
+from .distances import distance_matrix
+from .partitions import parent_table
+from .capacity import seat_capacity
+from .network import flight_networks
+from .singleflight import single_flight
+from .models import (
+    AircraftsData, AirportsData, Bookings, FlightFacts, Flights, RouteDailyStats, Seats, TicketFlights, Tickets
+)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+# Most tests look at which queries a request runs, so responses must not be cached
+no_stats_cache = override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'stats': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+)
+
+
+class StatsFixtureMixin:
+    """Small bookings dataset: one hub (DME) with three destinations over three days."""
+
+    @classmethod
+    def setUpTestData(cls):
+        airports = [
+            ('DME', 'Domodedovo International Airport', 'Moscow', 37.906111, 55.408611),
+            ('LED', 'Pulkovo Airport', 'St. Petersburg', 30.262503, 59.800292),
+            ('KZN', 'Kazan International Airport', 'Kazan', 49.278728, 55.606186),
+            ('SVX', 'Koltsovo Airport', 'Yekaterinburg', 60.802700, 56.743099),
+        ]
+        for code, name, city, lon, lat in airports:
+            AirportsData.objects.create(
+                airport_code=code,
+                airport_name={'en': name, 'ru': name},
+                city={'en': city, 'ru': city},
+                coordinates=Point(lon, lat, srid=4326),
+                timezone='Europe/Moscow',
+            )
+        cls.aircraft = AircraftsData.objects.create(
+            aircraft_code='321', model={'en': 'Airbus A321-200'}, range=5600
+        )
+        cls.booking = Bookings.objects.create(
+            book_ref='000001', book_date=utc(2017, 7, 1), total_amount=Decimal('0')
+        )
+
+        cls.ticket_seq = 0
+        flight_no = 0
+        for day in range(3):
+            for arrival, minutes, passengers in (('LED', 85, 3), ('KZN', 95, 2), ('SVX', 140, 0)):
+                for hour in (6, 18):
+                    flight_no += 1
+                    departure = utc(2017, 8, 1 + day, hour)
+                    arrived = not (arrival == 'KZN' and hour == 18)
+                    flight = Flights.objects.create(
+                        flight_no=f'PG{flight_no:04d}',
+                        scheduled_departure=departure,
+                        scheduled_arrival=departure + timedelta(minutes=minutes),
+                        departure_airport_id='DME',
+                        arrival_airport_id=arrival,
+                        status='Arrived' if arrived else 'Scheduled',
+                        aircraft_code=cls.aircraft,
+                        actual_departure=departure + timedelta(minutes=day) if arrived else None,
+                        actual_arrival=departure + timedelta(minutes=minutes + 2 * day + hour) if arrived else None,
+                    )
+                    for _ in range(passengers + day):
+                        cls.add_passenger(flight)
+
+    @classmethod
+    def add_passenger(cls, flight, amount=Decimal('6000.00')):
+        cls.ticket_seq += 1
+        ticket = Tickets.objects.create(
+            ticket_no=f'{cls.ticket_seq:013d}',
+            book_ref=cls.booking,
+            passenger_id=f'{cls.ticket_seq:010d}',
+            passenger_name='TEST PASSENGER',
+        )
+        return TicketFlights.objects.create(
+            ticket_no=ticket, flight_id=flight, fare_conditions='Economy', amount=amount
+        )
+
+    def get_stats(self, url, from_date='2017-08-01', to_date='2017-08-04'):
+        response = self.client.get(url, {
+            'departure_airport_name': 'Domodedovo International Airport',
+            'from_date': from_date,
+            'to_date': to_date,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+
+@no_stats_cache
+class RouteDailyStatsTests(StatsFixtureMixin, TestCase):
+
+    def assertAnsweredFromRollup(self, url, expected, **window):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_stats(url, **window)
+        self.assertTrue(any('route_daily_stats' in q['sql'] for q in ctx.captured_queries))
+        self.assertFalse(any('ticket_flights' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(data, expected)
+
+    def test_sql_endpoint_matches_raw_query(self):
+        windows = [
+            {},
+            {'from_date': '2017-08-02', 'to_date': '2017-08-03'},
+            {'from_date': '2017-08-02T00:00:00', 'to_date': '2017-08-04'},
+        ]
+        expected = [self.get_stats('/api/stats1/', **w) for w in windows]
+        self.assertTrue(expected[0])
+
+        call_command('refresh_route_stats')
+
+        for window, live in zip(windows, expected):
+            self.assertAnsweredFromRollup('/api/stats1/', live, **window)
+
+    def test_orm_endpoint_matches_raw_query(self):
+        live = self.get_stats('/api/stats2/')
+        call_command('refresh_route_stats')
+        self.assertAnsweredFromRollup('/api/stats2/', live)
+
+    def test_uncovered_window_falls_back_to_raw_query(self):
+        call_command('refresh_route_stats')
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_stats('/api/stats1/', from_date='2017-08-01 12:00', to_date='2017-08-03')
+            self.get_stats('/api/stats1/', from_date='2017-08-01', to_date='2017-09-01')
+        self.assertFalse(any('route_daily_stats' in q['sql'] for q in ctx.captured_queries))
+
+    def test_incremental_refresh(self):
+        call_command('refresh_route_stats')
+        rows = RouteDailyStats.objects.count()
+
+        flight = Flights.objects.get(flight_no='PG0014')
+        self.add_passenger(flight)
+        self.add_passenger(flight)
+        flight.actual_departure = flight.scheduled_departure
+        flight.actual_arrival = flight.scheduled_departure + timedelta(minutes=99)
+        flight.save()
+        stale = self.get_stats('/api/stats1/')
+
+        call_command('refresh_route_stats', '--from', '2017-08-03', '--to', '2017-08-04')
+        fresh = self.get_stats('/api/stats1/')
+        self.assertNotEqual(stale, fresh)
+        self.assertEqual(RouteDailyStats.objects.count(), rows)
+
+        # A window that is not day aligned is always answered by the raw query
+        self.assertEqual(self.get_stats('/api/stats1/', to_date='2017-08-04 00:00:01'), fresh)
+
+
+@no_stats_cache
+class RouteStatsChangelogTests(StatsFixtureMixin, TestCase):
+
+    def setUp(self):
+        call_command('refresh_route_stats')
+
+    def rollup_rows(self):
+        return list(RouteDailyStats.objects.order_by('departure_airport', 'arrival_airport', 'day').values_list(
+            'departure_airport', 'arrival_airport', 'day',
+            'flight_count', 'actual_count', 'total_flight_time', 'passenger_count',
+        ))
+
+    def pending(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM bookings.route_stats_changelog")
+            return cursor.fetchone()[0]
+
+    def test_deltas_match_a_full_rebuild(self):
+        self.assertEqual(self.pending(), 0)
+        before = sum(row['passenger_count'] for row in self.get_stats('/api/stats1/'))
+
+        self.add_passenger(Flights.objects.get(flight_no='PG0001'))
+        flight = Flights.objects.create(
+            flight_no='PG0100', scheduled_departure=utc(2017, 8, 2, 9),
+            scheduled_arrival=utc(2017, 8, 2, 10, 25), departure_airport_id='DME', arrival_airport_id='LED',
+            status='Arrived', aircraft_code=self.aircraft,
+            actual_departure=utc(2017, 8, 2, 9, 5), actual_arrival=utc(2017, 8, 2, 10, 31),
+        )
+        self.add_passenger(flight)
+        moved = Flights.objects.get(flight_no='PG0003')
+        moved.arrival_airport_id = 'SVX'
+        moved.save()
+        # Every flight of one route and day: the rollup row goes away
+        Flights.objects.filter(flight_no__in=['PG0017', 'PG0018']).delete()
+        self.assertGreater(self.pending(), 0)
+
+        self.assertGreater(rollup.apply_changelog(), 0)
+        self.assertEqual(rollup.apply_changelog(), 0)
+        incremental = self.rollup_rows()
+        self.assertNotIn(('DME', 'SVX', utc(2017, 8, 3).date()), [row[:3] for row in incremental])
+        after = sum(row['passenger_count'] for row in self.get_stats('/api/stats1/'))
+        self.assertEqual(after, before + 2 - 2 * 2)
+
+        call_command('refresh_route_stats', '--full')
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_refresh_discards_changes_it_recomputed(self):
+        self.add_passenger(Flights.objects.get(flight_no='PG0014'))
+        call_command('refresh_route_stats')
+        refreshed = self.rollup_rows()
+        self.assertEqual(rollup.apply_changelog(), 0)
+        self.assertEqual(self.rollup_rows(), refreshed)
+
+    def test_bulk_copy_is_captured(self):
+        datagen.generate(datagen.Dataset(ticket_flights=300, seed=1, airports=4, start=utc(2017, 8, 1), days=3))
+        call_command('apply_route_stats_changelog', '--once', stdout=StringIO())
+        incremental = self.rollup_rows()
+        call_command('refresh_route_stats', '--full')
+        self.assertEqual(incremental, self.rollup_rows())
+        self.assertEqual(sum(row[6] for row in incremental if row[0].startswith('Z')), 300)
+
+
+@no_stats_cache
+class FlightFactsTests(StatsFixtureMixin, TestCase):
+
+    def setUp(self):
+        # available() is remembered per process; the backfills here are rolled back
+        facts.invalidate()
+        self.addCleanup(facts.invalidate)
+
+    def fact_rows(self):
+        return list(FlightFacts.objects.order_by('flight_id').values_list(
+            'flight_id', 'departure_airport', 'arrival_airport', 'scheduled_departure',
+            'duration_seconds', 'passenger_count', 'revenue',
+        ))
+
+    def assertAnsweredFromFacts(self, url, expected, **window):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_stats(url, **window)
+        self.assertTrue(any('flight_facts' in q['sql'] for q in ctx.captured_queries))
+        self.assertFalse(any('ticket_flights' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(data, expected)
+
+    def test_triggers_match_a_backfill(self):
+        # The fixture was loaded through the triggers
+        self.assertFalse(facts.available())
+        self.assertEqual(FlightFacts.objects.count(), Flights.objects.count())
+
+        self.add_passenger(Flights.objects.get(flight_no='PG0001'), amount=Decimal('7500.00'))
+        TicketFlights.objects.filter(flight_id__flight_no='PG0002').update(amount=Decimal('100.00'))
+        moved = Flights.objects.get(flight_no='PG0003')
+        moved.arrival_airport_id = 'SVX'
+        moved.actual_arrival = moved.actual_departure + timedelta(minutes=150)
+        moved.save()
+        TicketFlights.objects.filter(flight_id__flight_no='PG0004').delete()
+        Flights.objects.filter(flight_no='PG0005').delete()
+        incremental = self.fact_rows()
+
+        call_command('backfill_flight_facts', stdout=StringIO())
+        self.assertTrue(facts.available())
+        self.assertEqual(incremental, self.fact_rows())
+
+    def test_partial_backfill_is_not_used(self):
+        out = StringIO()
+        call_command('backfill_flight_facts', '--from', '2017-08-01', '--to', '2017-09-01', stdout=out)
+        self.assertIn('2017-08: 18 flights', out.getvalue())
+        self.assertFalse(facts.available())
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_stats('/api/stats1/', from_date='2017-08-01 12:00')
+        self.assertFalse(any('flight_facts' in q['sql'] for q in ctx.captured_queries))
+
+    def test_endpoints_match_raw_queries(self):
+        # Not day aligned, so the rollup could not answer them either
+        windows = [
+            {'from_date': '2017-08-01 12:00'},
+            {'from_date': '2017-08-02', 'to_date': '2017-08-03 06:00:01'},
+        ]
+        stats1 = [self.get_stats('/api/stats1/', **w) for w in windows]
+        stats2 = [self.get_stats('/api/stats2/', **w) for w in windows]
+        self.assertTrue(stats1[0])
+
+        facts.backfill()
+        for window, live in zip(windows, stats1):
+            self.assertAnsweredFromFacts('/api/stats1/', live, **window)
+        for window, live in zip(windows, stats2):
+            self.assertAnsweredFromFacts('/api/stats2/', live, **window)
+
+    def test_availability_is_checked_once_per_interval(self):
+        self.assertFalse(facts.available())
+        with self.assertNumQueries(0):
+            self.assertFalse(facts.available())
+        facts.backfill()
+        with self.assertNumQueries(0):
+            self.assertTrue(facts.available())
+
+    def test_bulk_copy_is_captured(self):
+        facts.backfill()
+        datagen.generate(datagen.Dataset(ticket_flights=300, seed=1, airports=4, start=utc(2017, 8, 1), days=3))
+        incremental = self.fact_rows()
+        facts.backfill()
+        self.assertEqual(incremental, self.fact_rows())
+        self.assertEqual(
+            sum(row[5] for row in incremental),
+            TicketFlights.objects.filter(flight_id__in=Flights.objects.values('flight_id')).count(),
+        )
+
+
+@no_stats_cache
+@override_settings(STATS_SOURCE='matview')
+class RouteStatsMatviewTests(StatsFixtureMixin, TestCase):
+
+    def answered_from_matview(self, **window):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_stats('/api/stats1/', **window)
+        return data, any('route_stats_mv' in q['sql'] for q in ctx.captured_queries)
+
+    def test_matches_live_query_after_refresh(self):
+        live = self.get_stats('/api/stats1/')
+        call_command('refresh_route_stats_mv', '--once')
+
+        data, from_matview = self.answered_from_matview()
+        self.assertTrue(from_matview)
+        self.assertEqual(data, live)
+
+        # Concurrent refresh once the view is populated
+        call_command('refresh_route_stats_mv', '--once', '--force')
+        self.assertEqual(self.answered_from_matview(), (live, True))
+
+    def test_window_newer_than_refresh_falls_back(self):
+        _, from_matview = self.answered_from_matview()
+        self.assertFalse(from_matview)
+
+        call_command('refresh_route_stats_mv', '--once')
+        data, from_matview = self.answered_from_matview(to_date='2999-01-01')
+        self.assertFalse(from_matview)
+        self.assertEqual(data, self.get_stats('/api/stats1/', to_date='2999-01-01'))
+
+    def test_scheduler_skips_fresh_view(self):
+        from .matview import MATVIEW_NAME
+        from .models import StatsRefresh
+
+        call_command('refresh_route_stats_mv', '--once')
+        refreshed_at = StatsRefresh.objects.get(name=MATVIEW_NAME).refreshed_at
+        call_command('refresh_route_stats_mv', '--once')
+        self.assertEqual(StatsRefresh.objects.get(name=MATVIEW_NAME).refreshed_at, refreshed_at)
+
+        with override_settings(STATS_MATVIEW={'MAX_STALENESS': 0}):
+            call_command('refresh_route_stats_mv', '--once')
+        self.assertGreater(StatsRefresh.objects.get(name=MATVIEW_NAME).refreshed_at, refreshed_at)
+
+
+@no_stats_cache
+class StatsSQLQueryTests(StatsFixtureMixin, TestCase):
+
+    def test_grouped_join_matches_array_agg_query(self):
+        from .management.commands.bench_stats_sql import QUERIES
+
+        params = ['DME', '2017-08-01', '2017-08-04']
+        with connection.cursor() as cursor:
+            cursor.execute(QUERIES['array_agg'], params)
+            expected = sorted(row[2:] for row in cursor.fetchall())
+            cursor.execute(QUERIES['grouped_join'], params)
+            self.assertEqual(sorted(row[1:] for row in cursor.fetchall()), expected)
+        self.assertEqual(len(expected), 3)
+
+
+class IndexAdvisorTests(StatsFixtureMixin, TestCase):
+
+    def test_stats_indexes_exist(self):
+        with connection.cursor() as cursor:
+            flights = connection.introspection.get_constraints(cursor, 'flights')
+            ticket_flights = connection.introspection.get_constraints(cursor, 'ticket_flights')
+            airports = connection.introspection.get_constraints(cursor, 'airports_data')
+        self.assertIn('flights_dep_sched_cover_idx', flights)
+        self.assertIn('flights_arrived_route_idx', flights)
+        self.assertIn('ticket_flights_flight_fare_idx', ticket_flights)
+        self.assertNotIn('ticket_flights_flight_idx', ticket_flights)
+        self.assertIn('airports_name_en_idx', airports)
+
+    def test_reports_every_endpoint_query(self):
+        from .management.commands.index_advisor import Command
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            results = Command().advise('DME', '2017-08-01', '2017-08-04')
+        labels = [result['query'] for result in results]
+        self.assertEqual(labels, [
+            'stats1 live', 'stats1 rollup', 'stats1 facts', 'revenue live', 'batch live', 'stats2 flights',
+            'stats2 passengers', 'stats2 facts', 'export',
+        ])
+        # Scans are on partitions, whose indexes are named after the partition
+        index_scans = {
+            parent_table(scan['relation']) for scan in results[0]['scans']
+            if scan['node'] in ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+        }
+        self.assertEqual(index_scans, {'flights', 'ticket_flights'})
+
+
+@no_stats_cache
+class FlightStatisticsAPIViewQueryTests(StatsFixtureMixin, TestCase):
+    """Guards against the per-flight passenger Subquery coming back."""
+
+    def get_synthetic_stats(self, flights):
+        with connection.cursor() as cursor:
+            synthetic.ensure_aircraft(cursor)
+            synthetic.add_hub_flights(cursor, 'DME', ['LED', 'KZN', 'SVX'], 0, flights)
+        from_date, to_date = synthetic.window_for(flights)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_stats('/api/stats2/', from_date.isoformat(), to_date.isoformat())
+        return data, ctx.captured_queries
+
+    def test_query_count_does_not_grow_with_flights(self):
+        small, small_queries = self.get_synthetic_stats(10)
+        self.assertEqual(sum(row['flight_count'] for row in small), 10)
+
+        large, large_queries = self.get_synthetic_stats(2000)
+        self.assertEqual(sum(row['flight_count'] for row in large), 2000)
+        self.assertEqual(len(large_queries), len(small_queries))
+
+    def test_no_correlated_passenger_subquery(self):
+        data, queries = self.get_synthetic_stats(2000)
+        self.assertTrue(all(row['total_passengers'] > 0 for row in data))
+
+        for query in queries:
+            if 'ticket_flights' in query['sql']:
+                self.assertNotIn('(SELECT', query['sql'].upper())
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN (FORMAT JSON) ' + query['sql'])
+                    plan = cursor.fetchone()[0]
+                self.assertNotIn('SubPlan', str(plan))
+
+    def test_matches_raw_query(self):
+        self.assertEqual(
+            [(r['airport_name'], r['flight_count'], r['passenger_count']) for r in self.get_stats('/api/stats1/')],
+            [(r['arrival_airport__airport_name__en'], r['flight_count'], r['total_passengers'])
+             for r in self.get_stats('/api/stats2/')],
+        )
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'stats': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+    },
+    STATS_CACHE={'ALIAS': 'stats', 'TIMEOUT': 60, 'HISTORICAL_TIMEOUT': 3600},
+)
+class StatsCacheTests(StatsFixtureMixin, TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def test_repeated_request_is_served_from_cache(self):
+        for url in ('/api/stats1/', '/api/stats2/'):
+            before = cache.cache_info()
+            first = self.get_stats(url)
+            with CaptureQueriesContext(connection) as ctx:
+                second = self.get_stats(url)
+            self.assertEqual(first, second)
+            self.assertFalse(any('flights' in q['sql'] for q in ctx.captured_queries))
+
+            after = cache.cache_info()
+            self.assertEqual(after['misses'] - before['misses'], 1)
+            self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_ticket_flights_change_invalidates_airport(self):
+        before = self.get_stats('/api/stats1/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_passenger(Flights.objects.get(flight_no='PG0001'))
+        after = self.get_stats('/api/stats1/')
+        self.assertEqual(
+            sum(row['passenger_count'] for row in after),
+            sum(row['passenger_count'] for row in before) + 1,
+        )
+
+    def test_flights_change_invalidates_airport(self):
+        before = self.get_stats('/api/stats2/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Flights.objects.filter(flight_no='PG0001').get().delete()
+        after = self.get_stats('/api/stats2/')
+        self.assertEqual(
+            sum(row['flight_count'] for row in after),
+            sum(row['flight_count'] for row in before) - 1,
+        )
+
+    def test_invalidation_waits_for_commit(self):
+        self.get_stats('/api/stats1/')
+        generation = cache.get_cache().get(cache._generation_key('DME'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.add_passenger(Flights.objects.get(flight_no='PG0001'))
+            self.assertEqual(cache.get_cache().get(cache._generation_key('DME')), generation)
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get_cache().get(cache._generation_key('DME')), generation)
+
+    def test_source_refresh_invalidates_airport(self):
+        for refresh in (lambda: call_command('refresh_route_stats'), matview.refresh):
+            self.get_stats('/api/stats1/')
+            generation = cache.get_cache().get(cache._generation_key('DME'))
+            with self.captureOnCommitCallbacks(execute=True):
+                refresh()
+            self.assertNotEqual(cache.get_cache().get(cache._generation_key('DME')), generation)
+
+    def test_historical_windows_are_kept_longer(self):
+        self.assertEqual(cache.timeout_for('2017-08-04'), 3600)
+        self.assertEqual(cache.timeout_for('2999-01-01'), 60)
+        # Yesterday's flights can still change
+        self.assertEqual(cache.timeout_for(timezone.now().date().isoformat()), 60)
+        self.assertEqual(cache.timeout_for('not a date'), 60)
+
+    def test_cache_info_endpoint(self):
+        self.get_stats('/api/stats1/')
+        response = self.client.get('/api/stats/cache/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json()['misses'], 1)
+
+
+@no_stats_cache
+class SingleFlightTests(StatsFixtureMixin, TestCase):
+
+    def run_concurrently(self, func, count=5):
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(func())
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        # Let every thread reach the in-flight call before the leader finishes
+        time.sleep(0.2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def test_identical_misses_share_one_computation(self):
+        test = self
+
+        class View:
+            @cached_stats('stats1')
+            def stats(self, departure_airport_name, from_date, to_date):
+                test.calls.append(departure_airport_name)
+                test.release.wait()
+                return {'data': [departure_airport_name]}
+
+        airport_index.get('DME')
+        before = cache.cache_info()['coalesced']
+        results, errors = self.run_concurrently(lambda: View().stats('DME', '2017-08-01', '2017-08-04'))
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results, [{'data': ['DME']}] * 5)
+        self.assertEqual(cache.cache_info()['coalesced'] - before, 4)
+        self.assertIn('flightapp_coalesced_requests_total{endpoint="stats1",scope="process"}', metrics.render())
+
+    def test_waiters_get_the_leader_exception(self):
+        def fail():
+            self.calls.append(1)
+            self.release.wait()
+            raise ValueError('boom')
+
+        results, errors = self.run_concurrently(lambda: single_flight.do('key', fail))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results, [])
+        self.assertEqual([str(exc) for exc in errors], ['boom'] * 5)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    async def test_async_misses_share_one_computation(self):
+        release = asyncio.Event()
+
+        async def compute():
+            self.calls.append(1)
+            await release.wait()
+            return 'result'
+
+        calls = [asyncio.create_task(singleflight.async_single_flight.do('key', compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*calls)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(sorted(results), [('result', False)] + [('result', True)] * 4)
+        self.assertEqual(singleflight.async_single_flight.in_flight(), 0)
+
+    def test_lock_id_is_stable_and_signed_64_bit(self):
+        self.assertEqual(singleflight.lock_id('a'), singleflight.lock_id('a'))
+        self.assertNotEqual(singleflight.lock_id('a'), singleflight.lock_id('b'))
+        self.assertTrue(-2 ** 63 <= singleflight.lock_id('a') < 2 ** 63)
+
+    @override_settings(STATS_SINGLE_FLIGHT={'ADVISORY_LOCK': True})
+    def test_advisory_lock(self):
+        self.assertEqual(len(self.get_stats('/api/stats1/')), 3)
+        self.assertEqual(singleflight.across_workers('key', lambda: 'stored', lambda: 'computed'), ('stored', True))
+        self.assertEqual(singleflight.across_workers('key', lambda: None, lambda: 'computed'), ('computed', False))
+
+    def test_lock_timeout_only_covers_the_lock(self):
+        def show_lock_timeout():
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW lock_timeout")
+                return cursor.fetchone()[0]
+
+        default = show_lock_timeout()
+        self.assertEqual(singleflight.across_workers('key', lambda: None, show_lock_timeout), (default, False))
+
+        class LockNotAvailable(Exception):
+            sqlstate = '55P03'
+
+        calls = []
+
+        def compute():
+            # A read of the computation that timed out waiting for a lock
+            calls.append(1)
+            raise OperationalError('canceling statement due to lock timeout') from LockNotAvailable()
+
+        with self.assertRaises(OperationalError):
+            singleflight.across_workers('key', lambda: None, compute)
+        self.assertEqual(len(calls), 1)
+
+
+@no_stats_cache
+class AirportIndexTests(StatsFixtureMixin, TestCase):
+
+    def test_lookup_by_code_and_any_language_name(self):
+        self.assertEqual(airport_index.get('LED').code, 'LED')
+        self.assertEqual(airport_index.get('pulkovo airport').code, 'LED')
+        self.assertEqual(airport_index.get('  Pulkovo   AIRPORT ').code, 'LED')
+        self.assertIsNone(airport_index.get('Pulkovo'))
+
+    def test_prefix_search(self):
+        self.assertEqual([a.code for a in airport_index.search('k')], ['KZN', 'SVX'])
+        self.assertEqual([a.code for a in airport_index.search('do')], ['DME'])
+
+    def test_refreshed_on_save(self):
+        airport = AirportsData.objects.get(pk='KZN')
+        airport.airport_name = {'en': 'Kazan Gabdulla Tukay Airport'}
+        airport.save()
+        self.assertEqual(airport_index.get('Kazan Gabdulla Tukay Airport').code, 'KZN')
+        self.assertIsNone(airport_index.get('Kazan International Airport'))
+
+    def test_stats_filter_on_airport_code(self):
+        airport_index.get('DME')
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_stats('/api/stats1/')
+            self.get_stats('/api/stats2/')
+        # The name is resolved in memory; only the airport code reaches SQL
+        self.assertTrue(ctx.captured_queries)
+        self.assertFalse(any('Domodedovo' in q['sql'] for q in ctx.captured_queries))
+
+    def test_unknown_airport(self):
+        response = self.client.get('/api/stats1/', {'departure_airport_name': 'Nowhere'})
+        self.assertEqual(response.json(), {'data': []})
+        response = self.client.get('/api/stats2/', {'departure_airport_name': 'Nowhere'})
+        self.assertEqual(response.status_code, 404)
+
+
+@no_stats_cache
+class DistanceMatrixTests(StatsFixtureMixin, TestCase):
+
+    def postgis_distance_km(self, from_code, to_code):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT ST_DistanceSphere(a.coordinates::geometry, b.coordinates::geometry) / 1000
+                FROM bookings.airports_data a, bookings.airports_data b
+                WHERE a.airport_code = %s AND b.airport_code = %s
+            """, [from_code, to_code])
+            return cursor.fetchone()[0]
+
+    def test_matches_st_distance_sphere(self):
+        for from_code in ('DME', 'LED', 'KZN', 'SVX'):
+            for to_code in ('DME', 'LED', 'KZN', 'SVX'):
+                self.assertAlmostEqual(
+                    distance_matrix.distance_km(from_code, to_code),
+                    self.postgis_distance_km(from_code, to_code),
+                    places=6,
+                )
+        self.assertIsNone(distance_matrix.distance_km('DME', 'XXX'))
+
+    def test_rebuilt_when_coordinates_change(self):
+        before = distance_matrix.distance_km('DME', 'SVX')
+        airport = AirportsData.objects.get(pk='SVX')
+        airport.coordinates = Point(65.0, 57.0, srid=4326)
+        airport.save()
+        after = distance_matrix.distance_km('DME', 'SVX')
+        self.assertGreater(after, before)
+        self.assertAlmostEqual(after, self.postgis_distance_km('DME', 'SVX'), places=6)
+
+    def test_stats_do_not_call_postgis(self):
+        distance_matrix.distance_km('DME', 'LED')
+        with CaptureQueriesContext(connection) as ctx:
+            stats1 = self.get_stats('/api/stats1/')
+            stats2 = self.get_stats('/api/stats2/')
+        self.assertFalse(any('ST_' in q['sql'].upper() for q in ctx.captured_queries))
+        self.assertEqual([r['airport_name'] for r in stats1], ['Pulkovo Airport', 'Kazan International Airport', 'Koltsovo Airport'])
+        self.assertEqual([r['arrival_airport__airport_name__en'] for r in stats2], [r['airport_name'] for r in stats1])
+
+
+@no_stats_cache
+class PartitioningTests(StatsFixtureMixin, TestCase):
+
+    def scanned_relations(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        from .management.commands.index_advisor import scans
+        return {scan['relation'] for scan in scans(plan[0])}
+
+    def test_creating_partition_moves_rows_out_of_default(self):
+        call_command('manage_partitions', '--from', '2017-07', '--to', '2017-09', '--ahead', '0')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM bookings.flights_p2017_08")
+            self.assertEqual(cursor.fetchone()[0], 18)
+            cursor.execute("SELECT COUNT(*) FROM bookings.flights_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(len(self.get_stats('/api/stats1/')), 3)
+
+    def test_stats_queries_are_pruned_to_one_month(self):
+        from .views import FlightStatisticsAPIView, FlightStatisticsSQL
+
+        call_command('manage_partitions', '--from', '2017-07', '--to', '2017-09', '--ahead', '0')
+        params = ['DME', '2017-08-01', '2017-08-04']
+        flights = {r for r in self.scanned_relations(FlightStatisticsSQL.live_query, params)
+                   if parent_table(r) == 'flights'}
+        self.assertEqual(flights, {'flights_p2017_08'})
+
+        sql, orm_params = FlightStatisticsAPIView.flights_queryset(*params).query.sql_with_params()
+        flights = {r for r in self.scanned_relations(sql, orm_params) if parent_table(r) == 'flights'}
+        self.assertEqual(flights, {'flights_p2017_08'})
+
+    def ticket_flights_loops(self, sql, params):
+        """Actual Loops of each ticket_flights partition scan on the inner side of a nested loop."""
+        with connection.cursor() as cursor:
+            # The plan a large table gets: flights from the index, then a
+            # parameterized probe into ticket_flights per flight
+            cursor.execute("SET LOCAL enable_hashjoin = off")
+            cursor.execute("SET LOCAL enable_mergejoin = off")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        loops = {}
+
+        def walk(node, inner_of_nested_loop):
+            relation = node.get('Relation Name')
+            if relation is not None and parent_table(relation) == 'ticket_flights' and relation != 'ticket_flights':
+                self.assertTrue(inner_of_nested_loop, f"{relation} is not probed from a nested loop")
+                loops[relation] = node['Actual Loops']
+            for child in node.get('Plans', []):
+                inner = inner_of_nested_loop or (
+                    node['Node Type'] == 'Nested Loop' and child.get('Parent Relationship') == 'Inner'
+                )
+                walk(child, inner)
+
+        walk(plan[0]['Plan'], False)
+        return loops
+
+    def test_ticket_flights_partitions_are_pruned_at_run_time(self):
+        from .views import FlightStatisticsAPIView, FlightStatisticsSQL
+
+        # The three DME departures at 06:00 on Aug 1: at most three of the
+        # sixteen hash partitions can hold their tickets
+        params = ['DME', '2017-08-01 06:00', '2017-08-01 06:00:01']
+        sql, orm_params = FlightStatisticsAPIView.passengers_queryset(*params).query.sql_with_params()
+        for query, query_params in ((FlightStatisticsSQL.live_query, params), (sql, orm_params)):
+            loops = self.ticket_flights_loops(query, query_params)
+            self.assertTrue(loops)
+            # Pruned partitions show no loops (or are missing altogether
+            # when pruned before execution, "Subplans Removed")
+            probed = [relation for relation, count in loops.items() if count]
+            self.assertLessEqual(len(probed), 3)
+
+    def test_archive_old_months(self):
+        tickets = TicketFlights.objects.count()
+        call_command('manage_partitions', '--from', '2017-08', '--to', '2017-08', '--ahead', '0')
+        call_command('manage_partitions', '--ahead', '0', '--retain', '12')
+        self.assertFalse(Flights.objects.exists())
+        self.assertFalse(TicketFlights.objects.exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM archive.flights_p2017_08")
+            self.assertEqual(cursor.fetchone()[0], 18)
+            cursor.execute("SELECT COUNT(*) FROM archive.ticket_flights_p2017_08")
+            self.assertEqual(cursor.fetchone()[0], tickets)
+
+
+@no_stats_cache
+class FlightStatisticsTrendTests(StatsFixtureMixin, TestCase):
+
+    def get_trend(self, granularity, from_date='2017-08-01', to_date='2017-08-04'):
+        response = self.client.get('/api/stats1/trend/', {
+            'departure_airport_name': 'DME',
+            'from_date': from_date,
+            'to_date': to_date,
+            'granularity': granularity,
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['granularity'], granularity)
+        return body['data']
+
+    def test_daily_series(self):
+        data = self.get_trend('day')
+        self.assertEqual([series['airport_name'] for series in data],
+                         ['Pulkovo Airport', 'Kazan International Airport', 'Koltsovo Airport'])
+        led = data[0]
+        self.assertEqual(led['bucket'], ['2017-08-01', '2017-08-02', '2017-08-03'])
+        self.assertEqual(led['flight_count'], [2, 2, 2])
+        self.assertEqual(led['passenger_count'], [6, 8, 10])
+        self.assertEqual(len(led['avg_flight_seconds']), 3)
+
+        # Buckets add up to the /api/stats1/ totals
+        totals = {row['airport_name']: row for row in self.get_stats('/api/stats1/')}
+        for series in data:
+            self.assertEqual(sum(series['flight_count']), totals[series['airport_name']]['flight_count'])
+            self.assertEqual(sum(series['passenger_count']), totals[series['airport_name']]['passenger_count'])
+
+    def test_rollup_matches_live_query(self):
+        expected = {granularity: self.get_trend(granularity) for granularity in ('day', 'week', 'month')}
+        call_command('refresh_route_stats')
+        for granularity, live in expected.items():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.get_trend(granularity), live)
+            self.assertTrue(any('route_daily_stats' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(expected['month'][0]['bucket'], ['2017-08-01'])
+
+    def test_hourly_buckets(self):
+        led = self.get_trend('hour', to_date='2017-08-02')[0]
+        self.assertEqual(led['bucket'], ['2017-08-01T06:00:00', '2017-08-01T18:00:00'])
+        self.assertEqual(led['flight_count'], [1, 1])
+
+    def test_rejects_unknown_granularity(self):
+        response = self.client.get('/api/stats1/trend/', {'departure_airport_name': 'DME', 'granularity': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+
+@no_stats_cache
+class StatsRenderingTests(StatsFixtureMixin, TestCase):
+
+    def test_durations_are_numeric_seconds(self):
+        # LED flights take 85 + day + hour minutes: 98 minutes on average
+        stats1 = self.get_stats('/api/stats1/')
+        stats2 = self.get_stats('/api/stats2/')
+        self.assertEqual(stats1[0]['avg_flight_time'], 98 * 60.0)
+        self.assertEqual(stats2[0]['avg_flight_time'], 98 * 60.0)
+        # KZN evening flights never arrived: only the morning ones count
+        self.assertEqual(stats1[1]['avg_flight_time'], (95 + 1 + 6) * 60.0)
+
+    def test_rows_ordered_by_precomputed_distance_rank(self):
+        ranks = distance_matrix.ranks('DME')
+        self.assertEqual(sorted(ranks, key=ranks.get), ['DME', 'LED', 'KZN', 'SVX'])
+        distances = [row['distance_km'] for row in self.get_stats('/api/stats2/')]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_renderer_encodes_decimals_and_numpy(self):
+        import numpy as np
+
+        from .renderers import dumps
+
+        self.assertEqual(
+            json.loads(dumps({'amount': Decimal('6000.00'), 'n': np.int64(3), 't': timedelta(minutes=1)})),
+            {'amount': '6000.00', 'n': 3, 't': 60.0},
+        )
+
+
+@no_stats_cache
+class FlightRevenueStatsTests(StatsFixtureMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for row in range(1, 7):
+            for letter in 'ABCD':
+                Seats.objects.create(aircraft_code=cls.aircraft, seat_no=f'{row}{letter}',
+                                     fare_conditions='Business' if row == 1 else 'Economy')
+        business = cls.add_passenger(Flights.objects.get(flight_no='PG0001'), Decimal('30000.00'))
+        business.fare_conditions = 'Business'
+        business.save()
+
+    def setUp(self):
+        seat_capacity.invalidate()
+
+    def get_revenue(self):
+        response = self.client.get('/api/stats1/revenue/', {
+            'departure_airport_name': 'DME', 'from_date': '2017-08-01', 'to_date': '2017-08-04',
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_revenue_and_load_factor(self):
+        data = {row['airport_name']: row for row in self.get_revenue()}
+        pulkovo = data['Pulkovo Airport']
+        self.assertEqual((pulkovo['flight_count'], pulkovo['passenger_count'], pulkovo['seat_capacity']), (6, 25, 144))
+        self.assertEqual(pulkovo['load_factor'], round(25 / 144, 4))
+        self.assertEqual(Decimal(pulkovo['revenue']), Decimal('174000.00'))
+        self.assertEqual(pulkovo['by_fare']['Business'], {
+            'passenger_count': 1, 'seat_capacity': 24, 'load_factor': round(1 / 24, 4), 'revenue': '30000.00',
+        })
+        self.assertEqual(pulkovo['by_fare']['Economy']['revenue'], '144000.00')
+        self.assertIsNone(pulkovo['by_fare']['Comfort']['load_factor'])
+
+        # Same routes, order and counts as /api/stats1/
+        stats = self.get_stats('/api/stats1/')
+        self.assertEqual(
+            [(row['airport_name'], row['flight_count'], row['passenger_count']) for row in self.get_revenue()],
+            [(row['airport_name'], row['flight_count'], row['passenger_count']) for row in stats],
+        )
+
+    def test_seat_capacity_is_read_once(self):
+        self.get_revenue()
+        with CaptureQueriesContext(connection) as ctx:
+            self.get_revenue()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('seats', ctx.captured_queries[0]['sql'])
+
+        Seats.objects.create(aircraft_code=self.aircraft, seat_no='7A', fare_conditions='Economy')
+        pulkovo = next(row for row in self.get_revenue() if row['airport_name'] == 'Pulkovo Airport')
+        self.assertEqual(pulkovo['seat_capacity'], 150)
+
+
+@no_stats_cache
+class FlightStatisticsBatchTests(StatsFixtureMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for hour in (9, 21):
+            departure = utc(2017, 8, 2, hour)
+            flight = Flights.objects.create(
+                flight_no=f'PG9{hour:03d}',
+                scheduled_departure=departure,
+                scheduled_arrival=departure + timedelta(minutes=85),
+                departure_airport_id='LED',
+                arrival_airport_id='DME',
+                status='Arrived',
+                aircraft_code=cls.aircraft,
+                actual_departure=departure,
+                actual_arrival=departure + timedelta(minutes=80 + hour),
+            )
+            cls.add_passenger(flight)
+
+    def get_batch(self, names, stream=False):
+        params = {
+            'departure_airport_name': names,
+            'from_date': '2017-08-01',
+            'to_date': '2017-08-04',
+        }
+        if stream:
+            params['stream'] = '1'
+        response = self.client.get('/api/stats1/batch/', params)
+        self.assertEqual(response.status_code, 200)
+        if stream:
+            return json.loads(b''.join(response.streaming_content))['data']
+        return response.json()['data']
+
+    def test_matches_single_airport_endpoint(self):
+        data = self.get_batch(['Domodedovo International Airport', 'LED'])
+        self.assertEqual(list(data), ['DME', 'LED'])
+        self.assertEqual(data['DME'], self.get_stats('/api/stats1/'))
+        self.assertEqual(data['LED'][0]['airport_name'], 'Domodedovo International Airport')
+        self.assertEqual(data['LED'][0]['passenger_count'], 2)
+
+    def test_all_airports_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_batch(['all'])
+        self.assertEqual(sorted(data), ['DME', 'LED'])
+        self.assertEqual(sum('ticket_flights' in q['sql'] for q in ctx.captured_queries), 1)
+
+    def test_streaming_matches_buffered_response(self):
+        self.assertEqual(self.get_batch(['all'], stream=True), self.get_batch(['all']))
+        self.assertEqual(self.get_batch(['DME,LED'], stream=True), self.get_batch(['DME', 'LED']))
+
+    def test_unknown_airport(self):
+        response = self.client.get('/api/stats1/batch/', {'departure_airport_name': 'Nowhere'})
+        self.assertEqual(response.status_code, 404)
+
+
+class FastestItineraryTests(StatsFixtureMixin, TestCase):
+    """KZN has no direct flight to SVX; DME flies there at 06:00 and 18:00."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for flight_no, hour in (('PG9007', 7), ('PG9012', 12)):
+            departure = utc(2017, 8, 1, hour)
+            Flights.objects.create(
+                flight_no=flight_no,
+                scheduled_departure=departure,
+                scheduled_arrival=departure + timedelta(minutes=90),
+                departure_airport_id='KZN',
+                arrival_airport_id='DME',
+                status='Scheduled',
+                aircraft_code=cls.aircraft,
+            )
+
+    def setUp(self):
+        flight_networks.invalidate()
+
+    def get_itinerary(self, **params):
+        params = {
+            'departure_airport_name': 'KZN',
+            'arrival_airport_name': 'SVX',
+            'from_date': '2017-08-01',
+            'to_date': '2017-08-04',
+            **params,
+        }
+        response = self.client.get('/api/routes/fastest/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_one_connection_leaving_as_late_as_possible(self):
+        data = self.get_itinerary()
+        self.assertEqual(data['connections'], 1)
+        self.assertEqual([leg['flight_no'] for leg in data['legs']], ['PG9012', 'PG0006'])
+        self.assertEqual(data['scheduled_departure'], '2017-08-01T12:00:00+00:00')
+        self.assertEqual(data['scheduled_arrival'], '2017-08-01T20:20:00+00:00')
+        self.assertEqual(data['duration_seconds'], 8 * 3600 + 20 * 60)
+        self.assertEqual(data['legs'][1]['layover_seconds'], 4.5 * 3600)
+
+    def test_min_layover_and_depart_after(self):
+        data = self.get_itinerary(min_layover=600)
+        self.assertEqual(data['scheduled_arrival'], '2017-08-02T08:20:00+00:00')
+        self.assertEqual(data['legs'][0]['flight_no'], 'PG9012')
+        self.assertIsNone(self.get_itinerary(depart_after='2017-08-01T12:01'))
+
+    def test_max_connections(self):
+        self.assertIsNone(self.get_itinerary(max_connections=0))
+        direct = self.get_itinerary(departure_airport_name='DME', max_connections=0)
+        self.assertEqual(direct['connections'], 0)
+        self.assertEqual(direct['scheduled_arrival'], '2017-08-01T08:20:00+00:00')
+
+    def test_network_is_built_once_per_window(self):
+        self.get_itinerary()
+        with self.assertNumQueries(0):
+            self.get_itinerary(departure_airport_name='DME')
+        Flights.objects.filter(flight_no='PG9012').delete()
+        self.assertEqual(self.get_itinerary()['legs'][0]['flight_no'], 'PG9007')
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/routes/fastest/', {
+            'departure_airport_name': 'KZN', 'arrival_airport_name': 'Nowhere',
+            'from_date': '2017-08-01', 'to_date': '2017-08-04',
+        })
+        self.assertEqual(response.status_code, 404)
+        for params in ({'to_date': '2017-07-01'}, {'to_date': '2018-08-01'}, {'max_connections': 9}):
+            response = self.client.get('/api/routes/fastest/', {
+                'departure_airport_name': 'KZN', 'arrival_airport_name': 'SVX', 'from_date': '2017-08-01',
+                'to_date': '2017-08-04', **params,
+            })
+            self.assertEqual(response.status_code, 400)
+
+
+class FakeReplicaSet(replicas.ReplicaSet):
+    """
+    Replicas that exist only as probe results: alias -> (lag, latency) or
+    None if down. Errors on the aliases in broken count as lost connections.
+    """
+
+    def __init__(self, probes, broken=()):
+        super().__init__()
+        self.probes = probes
+        self.broken = set(broken)
+
+    def probe(self, alias):
+        if self.probes[alias] is None:
+            raise OperationalError('connection refused')
+        return self.probes[alias]
+
+    def connection_failed(self, alias, exc):
+        return alias in self.broken
+
+
+@override_settings(STATS_REPLICAS={
+    'ALIASES': ['r1', 'r2'], 'STRATEGY': 'round_robin', 'MAX_LAG': 5, 'CHECK_INTERVAL': 60, 'RETRY_AFTER': 60,
+})
+class ReplicaRoutingTests(StatsFixtureMixin, TestCase):
+
+    def test_round_robin_ends_with_primary(self):
+        replica_set = FakeReplicaSet({'r1': (0, 0.002), 'r2': (0, 0.001)})
+        first = replica_set.candidates('2017-08-01', '2017-08-04')
+        second = replica_set.candidates('2017-08-01', '2017-08-04')
+        self.assertEqual(sorted(first[:2]), ['r1', 'r2'])
+        self.assertEqual(second[:2], first[1::-1])
+        self.assertEqual(first[-1], 'default')
+
+    def test_least_latency(self):
+        replica_set = FakeReplicaSet({'r1': (0, 0.002), 'r2': (0, 0.001)})
+        with override_settings(STATS_REPLICAS={'ALIASES': ['r1', 'r2'], 'STRATEGY': 'least_latency'}):
+            self.assertEqual(replica_set.candidates('2017-08-01', '2017-08-04'), ['r2', 'r1', 'default'])
+
+    @no_stats_cache
+    def test_lagging_replica_only_serves_closed_windows(self):
+        replica_set = FakeReplicaSet({'r1': (60, 0.001), 'r2': (None, 0.001)})
+        self.assertEqual(sorted(replica_set.candidates('2017-08-01', '2017-08-04')), ['default', 'r1', 'r2'])
+        self.assertEqual(replica_set.candidates('2017-08-01', '2999-01-01'), ['default'])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'stats': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'replica-tests'},
+    }, STATS_CACHE={'ALIAS': 'stats'})
+    def test_lagging_replica_is_skipped_while_responses_are_cached(self):
+        # Its rows could be older than an invalidation the primary already made
+        replica_set = FakeReplicaSet({'r1': (60, 0.001), 'r2': (0, 0.001)})
+        self.assertEqual(replica_set.candidates('2017-08-01', '2017-08-04'), ['r2', 'default'])
+
+    def test_failed_replica_is_skipped(self):
+        replica_set = FakeReplicaSet({'r1': None, 'r2': (0, 0.001)})
+        self.assertEqual(replica_set.candidates('2017-08-01', '2017-08-04'), ['r2', 'default'])
+        self.assertFalse(replica_set.info()['replicas']['r1']['up'])
+
+    def test_run_falls_back_to_primary(self):
+        replica_set = FakeReplicaSet({'r1': (0, 0.001), 'r2': (0, 0.001)}, broken=['r1', 'r2'])
+        tried = []
+
+        def read():
+            tried.append(replicas.current())
+            if replicas.current() != 'default':
+                raise OperationalError('server closed the connection unexpectedly')
+            return list(RouteDailyStats.objects.values_list('departure_airport', flat=True))
+
+        self.assertEqual(replica_set.run('2017-08-01', '2017-08-04', read), [])
+        self.assertEqual(sorted(tried), ['default', 'r1', 'r2'])
+        self.assertEqual(tried[-1], 'default')
+        self.assertEqual(replicas.current(), 'default')
+        # Both are skipped until RETRY_AFTER
+        self.assertEqual(replica_set.candidates('2017-08-01', '2017-08-04'), ['default'])
+
+    def test_query_error_does_not_mark_replica_down(self):
+        replica_set = FakeReplicaSet({'r1': (0, 0.001), 'r2': (0, 0.001)})
+        tried = []
+
+        def read():
+            tried.append(replicas.current())
+            if replicas.current() != 'default':
+                raise OperationalError('canceling statement due to conflict with recovery')
+            return 'primary'
+
+        self.assertEqual(replica_set.run('2017-08-01', '2017-08-04', read), 'primary')
+        # Straight to the primary, not to the other replica
+        self.assertEqual(len(tried), 2)
+        self.assertEqual(tried[-1], 'default')
+        self.assertEqual(sorted(replica_set.candidates('2017-08-01', '2017-08-04')), ['default', 'r1', 'r2'])
+        self.assertTrue(all(status['up'] for status in replica_set.info()['replicas'].values()))
+
+    def test_router_sends_writes_to_primary(self):
+        router = replicas.ReplicaRouter()
+        self.assertEqual(replicas.run_on('r1', router.db_for_read, Flights), 'r1')
+        self.assertEqual(replicas.run_on('r1', router.db_for_write, Flights), 'default')
+        self.assertFalse(router.allow_migrate('r1', 'flightapp'))
+        self.assertIsNone(router.allow_migrate('default', 'flightapp'))
+
+    @override_settings(STATS_REPLICAS={})
+    def test_without_replicas_reads_use_primary(self):
+        self.assertEqual(replicas.replica_set.candidates('2017-08-01', '2999-01-01'), ['default'])
+        self.assertEqual(len(self.get_stats('/api/stats1/')), 3)
+
+
+@no_stats_cache
+class ParquetEngineTests(StatsFixtureMixin, TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(STATS_PARQUET={'ROOT': tmp.name, 'AUTO': False})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('export_parquet', '--from', '2017-07', '--to', '2017-08', stdout=StringIO())
+
+    def get_engine_stats(self, url, from_date, to_date):
+        response = self.client.get(url, {
+            'departure_airport_name': 'DME',
+            'from_date': from_date,
+            'to_date': to_date,
+            'engine': 'parquet',
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_matches_both_views_without_touching_flights(self):
+        windows = [
+            ('2017-08-01', '2017-08-04'),
+            ('2017-08-02', '2017-08-03'),
+            ('2017-07-15', '2017-08-02 12:00'),
+            ('2017-08-01T03:00:00+05:00', '2017-08-03T03:00:00+05:00'),
+        ]
+        for url in ('/api/stats1/', '/api/stats2/'):
+            for from_date, to_date in windows:
+                expected = self.get_stats(url, from_date, to_date)
+                with CaptureQueriesContext(connection) as ctx:
+                    data = self.get_engine_stats(url, from_date, to_date)
+                self.assertEqual(data, expected)
+                self.assertFalse(any('flights' in q['sql'] for q in ctx.captured_queries))
+
+    def test_months_are_utc_months(self):
+        # 2017-01-31 22:00 UTC: the January partition holds the first flights
+        start = datetime.fromisoformat('2017-02-01T03:00:00+05:00')
+        end = datetime.fromisoformat('2017-03-01T03:00:00+05:00')
+        self.assertEqual(list(columnar._months(start, end)), [date(2017, 1, 1), date(2017, 2, 1)])
+
+    def test_window_outside_export_uses_postgres(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_engine_stats('/api/stats1/', '2017-08-01', '2017-09-02')
+        self.assertTrue(any('ticket_flights' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(data, self.get_stats('/api/stats1/', '2017-08-01', '2017-09-02'))
+
+    def test_export_refuses_open_months(self):
+        with self.assertRaises(CommandError):
+            call_command('export_parquet', '--from', '2017-08', '--to', '2999-01')
+
+
+class FlightExportTests(StatsFixtureMixin, TestCase):
+
+    def export(self, **params):
+        response = self.client.get('/api/export/flights/', {
+            'from_date': '2017-08-01', 'to_date': '2017-08-04', **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(len(rows), Flights.objects.count())
+        first = rows[0]
+        self.assertEqual(first['flight_no'], 'PG0001')
+        self.assertEqual(first['actual_duration_seconds'], 85 * 60 + 6 * 60)
+        self.assertEqual(first['passenger_count'], 3)
+        self.assertEqual(Decimal(first['revenue']), Decimal('18000.00'))
+        self.assertIsNone(next(r for r in rows if r['status'] == 'Scheduled')['actual_duration_seconds'])
+
+    def test_csv_filtered_by_airport(self):
+        lines = self.export(export_format='csv', departure_airport_name='LED').splitlines()
+        self.assertEqual(lines, [','.join(['flight_id', 'flight_no', 'departure_airport', 'arrival_airport',
+                                           'scheduled_departure', 'status', 'actual_duration_seconds',
+                                           'passenger_count', 'revenue'])])
+        lines = self.export(export_format='csv').splitlines()
+        self.assertEqual(len(lines), Flights.objects.count() + 1)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'flights.ndjson')
+            call_command('export_flights', '--from', '2017-08-01', '--to', '2017-08-02',
+                         '--airport', 'DME', '--output', path)
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 6)
+
+
+@no_stats_cache
+class AsyncStatisticsViewTests(StatsFixtureMixin, TransactionTestCase):
+    """The async views read through their own connection pool, so fixtures must be committed."""
+
+    def setUp(self):
+        self.setUpTestData()
+
+    def test_same_response_as_sync_views(self):
+        for sync_url, async_url in (('/api/stats1/', '/api/async/stats1/'),
+                                    ('/api/stats2/', '/api/async/stats2/')):
+            self.assertEqual(self.get_stats(async_url), self.get_stats(sync_url))
+
+    def test_unknown_airport(self):
+        response = self.client.get('/api/async/stats2/', {'departure_airport_name': 'Nowhere'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_same_sources_as_sync_views(self):
+        call_command('refresh_route_stats')
+        # Emptied behind the rollup's back: only an answer from it comes back empty
+        RouteDailyStats.objects.all().delete()
+        for url in ('/api/stats1/', '/api/async/stats1/', '/api/stats2/', '/api/async/stats2/'):
+            self.assertEqual(self.get_stats(url), [])
+        self.assertTrue(self.get_stats('/api/async/stats1/', to_date='2017-08-04 00:00:01'))
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'stats': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'async-tests'},
+        },
+        STATS_CACHE={'ALIAS': 'stats', 'TIMEOUT': 60, 'HISTORICAL_TIMEOUT': 3600},
+    )
+    def test_responses_are_cached(self):
+        cache.get_cache().clear()
+        for url in ('/api/async/stats1/', '/api/async/stats2/'):
+            before = cache.cache_info()
+            self.assertEqual(self.get_stats(url), self.get_stats(url))
+            after = cache.cache_info()
+            self.assertEqual(after['misses'] - before['misses'], 1)
+            self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_reads_go_to_the_chosen_alias(self):
+        class RecordingReplicaSet(replicas.ReplicaSet):
+            chosen = []
+
+            def choose(self, from_date, to_date):
+                self.chosen.append(super().choose(from_date, to_date))
+                return self.chosen[-1]
+
+        original, replicas.replica_set = replicas.replica_set, RecordingReplicaSet()
+        try:
+            self.get_stats('/api/async/stats1/')
+            self.get_stats('/api/async/stats2/')
+        finally:
+            replicas.replica_set = original
+        self.assertEqual(RecordingReplicaSet.chosen, ['default', 'default'])
+
+
+@no_stats_cache
+class ProfilingMiddlewareTests(StatsFixtureMixin, TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def metric_lines(self, name):
+        body = self.client.get('/api/_metrics').content.decode()
+        return [line for line in body.splitlines() if line.startswith(name)]
+
+    @staticmethod
+    def metric_value(name, route):
+        # Straight from the registry, usable from async tests too
+        lines = [line for line in metrics.render().splitlines() if line.startswith(f'{name}{{route="{route}"}}')]
+        return float(lines[0].split()[-1]) if lines else None
+
+    def test_records_queries_serialization_and_size(self):
+        self.get_stats('/api/stats1/')
+        self.get_stats('/api/stats2/')
+
+        requests = self.metric_lines('flightapp_http_requests_total')
+        self.assertIn('flightapp_http_requests_total{route="/api/stats1/",status="200"} 1', requests)
+        self.assertIn('flightapp_http_requests_total{route="/api/stats2/",status="200"} 1', requests)
+
+        for name in ('flightapp_db_queries', 'flightapp_serialization_seconds', 'flightapp_response_bytes'):
+            counts = [line for line in self.metric_lines(name + '_count') if '/api/stats1/' in line]
+            self.assertEqual(counts, [f'{name}_count{{route="/api/stats1/"}} 1'])
+        queries_sum = [line for line in self.metric_lines('flightapp_db_queries_sum') if '/api/stats2/' in line]
+        self.assertGreaterEqual(float(queries_sum[0].split()[-1]), 2)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for _ in range(3):
+            self.get_stats('/api/stats1/')
+        buckets = [line for line in self.metric_lines('flightapp_request_duration_seconds_bucket')
+                   if '/api/stats1/' in line]
+        values = [int(line.split()[-1]) for line in buckets]
+        self.assertEqual(values, sorted(values))
+        self.assertTrue(buckets[-1].startswith('flightapp_request_duration_seconds_bucket{route="/api/stats1/",le="+Inf"}'))
+        self.assertEqual(values[-1], 3)
+
+    async def test_sync_views_are_profiled_under_asgi(self):
+        for url in ('/api/stats1/', '/api/stats2/'):
+            response = await self.async_client.get(url, {
+                'departure_airport_name': 'Domodedovo International Airport',
+                'from_date': '2017-08-01',
+                'to_date': '2017-08-04',
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertGreaterEqual(self.metric_value('flightapp_db_queries_sum', url), 1)
+            self.assertGreater(self.metric_value('flightapp_db_time_seconds_sum', url), 0)
+
+    def test_streamed_response_is_profiled_once_consumed(self):
+        route = '/api/export/flights/'
+        response = self.client.get(route, {'from_date': '2017-08-01', 'to_date': '2017-08-04'})
+        self.assertIsNone(self.metric_value('flightapp_db_queries_count', route))
+
+        body = b''.join(response.streaming_content)
+        self.assertEqual(self.metric_value('flightapp_db_queries_count', route), 1)
+        self.assertGreaterEqual(self.metric_value('flightapp_db_queries_sum', route), 1)
+        self.assertEqual(self.metric_value('flightapp_response_bytes_sum', route), len(body))
+
+    @override_settings(STATS_PROFILING={'ENABLED': True, 'SLOW_QUERY_MS': 0, 'EXPLAIN_SLOW': True})
+    def test_explains_slow_queries(self):
+        with self.assertLogs('flightapp.slow_queries', 'WARNING') as logs:
+            self.get_stats('/api/stats1/')
+        self.assertTrue(any('filtered_flights' in line and 'Scan' in line for line in logs.output))
+        self.assertTrue(self.metric_lines('flightapp_slow_queries_total{route="/api/stats1/"}'))
+
+
+@no_stats_cache
+class IngestTests(StatsFixtureMixin, TestCase):
+
+    FLIGHTS_CSV = (
+        'flight_no,scheduled_departure,scheduled_arrival,departure_airport,arrival_airport,'
+        'status,aircraft_code,actual_departure,actual_arrival\n'
+        'PG0100,2017-08-05T06:00:00Z,2017-08-05T07:25:00Z,DME,LED,Scheduled,321,,\n'
+        'PG0001,2017-08-01T06:00:00Z,2017-08-01T07:25:00Z,DME,LED,Cancelled,321,,\n'
+        'PG0101,2017-08-05T06:00:00Z,2017-08-05T07:25:00Z,DME,XXX,Scheduled,321,,\n'
+        'PG0102,yesterday,2017-08-05T07:25:00Z,DME,LED,Scheduled,321,,\n'
+    )
+
+    def load(self, feed, text, fmt, **kwargs):
+        records = ingest.read_records(StringIO(text), fmt)
+        return ingest.ingest(ingest.FEEDS[feed](), records, **kwargs)
+
+    def tickets_feed(self):
+        rows = [
+            {'ticket_no': '9000000000001', 'book_ref': 'F00001', 'book_date': '2017-07-20T10:00:00Z',
+             'total_amount': '12000', 'passenger_id': '1234 567890', 'passenger_name': 'IVAN PETROV',
+             'contact_data': {'phone': '+70000000000'}, 'flight_no': 'PG0100',
+             'scheduled_departure': '2017-08-05T06:00:00Z', 'fare_conditions': 'Economy', 'amount': '6000'},
+            {'ticket_no': '9000000000001', 'book_ref': 'F00001', 'book_date': '2017-07-20T10:00:00Z',
+             'total_amount': '12000', 'passenger_id': '1234 567890', 'passenger_name': 'IVAN PETROV',
+             'flight_no': 'PG0002', 'scheduled_departure': '2017-08-01T18:00:00Z',
+             'fare_conditions': 'Economy', 'amount': '6000'},
+            {'ticket_no': '9000000000002', 'book_ref': 'F00002', 'book_date': '2017-07-20T10:00:00Z',
+             'total_amount': '6000', 'passenger_id': '1234 567891', 'passenger_name': 'ANNA PETROVA',
+             'flight_no': 'PG9999', 'scheduled_departure': '2017-08-05T06:00:00Z',
+             'fare_conditions': 'Economy', 'amount': '6000'},
+        ]
+        return '\n'.join(json.dumps(row) for row in rows) + '\n{not json\n'
+
+    def test_flights_are_upserted_and_bad_rows_rejected(self):
+        result = self.load('flights', self.FLIGHTS_CSV, 'csv', batch_size=1)
+        self.assertEqual((result.rows, result.inserted, result.updated, result.rejected), (2, 1, 1, 2))
+        self.assertEqual(result.batches, 2)
+        self.assertEqual([line for line, _ in result.errors], [4, 5])
+        self.assertEqual(Flights.objects.get(flight_no='PG0001').status, 'Cancelled')
+        self.assertTrue(Flights.objects.filter(flight_no='PG0100', departure_airport='DME').exists())
+
+        # Loading the same feed again changes nothing
+        result = self.load('flights', self.FLIGHTS_CSV, 'csv')
+        self.assertEqual((result.inserted, result.updated), (0, 0))
+
+    def test_tickets_resolve_flights_by_natural_key(self):
+        self.load('flights', self.FLIGHTS_CSV, 'csv')
+        before = cache.cache_info()['invalidations']
+        result = self.load('tickets', self.tickets_feed(), 'ndjson')
+        self.assertEqual((result.rows, result.inserted, result.rejected), (3, 2, 2))
+        self.assertEqual(
+            sorted(TicketFlights.objects.filter(ticket_no='9000000000001').values_list('flight_id__flight_no', flat=True)),
+            ['PG0002', 'PG0100'],
+        )
+        self.assertEqual(Tickets.objects.get(ticket_no='9000000000001').contact_data, {'phone': '+70000000000'})
+        self.assertEqual(Bookings.objects.get(book_ref='F00001').total_amount, Decimal('12000.00'))
+        self.assertEqual(cache.cache_info()['invalidations'] - before, 1)
+
+    def test_too_many_errors(self):
+        with self.assertRaises(ingest.TooManyErrors):
+            self.load('flights', self.FLIGHTS_CSV, 'csv', max_errors=1)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/flights.csv'
+            with open(path, 'w') as f:
+                f.write(self.FLIGHTS_CSV)
+            out, err = StringIO(), StringIO()
+            call_command('ingest_feed', 'flights', path, stdout=out, stderr=err)
+            self.assertIn('1 inserted, 1 updated, 2 rejected', out.getvalue())
+            self.assertIn('line 4: arrival_airport XXX is not a known airport', err.getvalue())
+
+            call_command('ingest_feed', 'flights', path, '--dry-run', stdout=out, stderr=err)
+            with self.assertRaises(CommandError):
+                call_command('ingest_feed', 'flights', f'{tmp}/flights.txt', stdout=out)
+
+
+@no_stats_cache
+class SyntheticDatasetTests(TestCase):
+    dataset = datagen.Dataset(ticket_flights=800, seed=7, airports=8, start=utc(2099, 1, 1), days=40,
+                              chunk_flights=3)
+
+    def checksum(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT md5(string_agg(concat_ws(',', f.flight_id, f.flight_no, f.scheduled_departure,
+                                                f.departure_airport, f.arrival_airport, f.actual_arrival,
+                                                tf.ticket_no, tf.amount), ';'
+                                      ORDER BY f.flight_id, tf.ticket_no))
+                FROM bookings.flights f
+                JOIN bookings.ticket_flights tf ON tf.flight_id = f.flight_id
+                WHERE f.flight_no LIKE 'Z%%'
+            """)
+            return cursor.fetchone()[0]
+
+    def test_scale_and_determinism(self):
+        counts = datagen.generate(self.dataset)
+        self.assertEqual(counts['ticket_flights'], 800)
+        self.assertEqual(TicketFlights.objects.filter(ticket_no__ticket_no__startswith='Z').count(), 800)
+        self.assertEqual(Flights.objects.filter(flight_no__startswith='Z').count(), counts['flights'])
+        self.assertEqual(AirportsData.objects.filter(airport_code__startswith='Z').count(), 8)
+        first = self.checksum()
+
+        datagen.delete()
+        self.assertFalse(datagen.exists())
+        datagen.generate(self.dataset)
+        self.assertEqual(self.checksum(), first)
+
+        datagen.delete()
+        datagen.generate(replace(self.dataset, seed=8))
+        self.assertNotEqual(self.checksum(), first)
+
+    def test_flights_land_in_monthly_partitions(self):
+        datagen.generate(self.dataset)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM bookings.flights_default WHERE flight_no LIKE 'Z%%'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_parse_scale(self):
+        self.assertEqual(datagen.parse_scale('10k'), 10_000)
+        self.assertEqual(datagen.parse_scale('50M'), 50_000_000)
+        self.assertEqual(datagen.parse_scale('1500'), 1500)
+        with self.assertRaises(ValueError):
+            datagen.parse_scale('0')
+
+    def test_benchmark_results_can_be_compared(self):
+        call_command('generate_dataset', '--scale', '800', '--seed', '7', '--airports', '8',
+                     '--start', '2099-01-01', '--days', '40', stdout=StringIO())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/bench.json'
+            call_command('bench_stats_api', '--windows', '7,40', '--hubs', '2', '--repeat', '2',
+                         '--output', path, stdout=StringIO())
+            with open(path) as f:
+                results = json.load(f)['results']
+            self.assertEqual(len(results), 2 * 2 * 2)
+            self.assertEqual({r['endpoint'] for r in results}, {'stats1', 'stats2'})
+            largest = [r for r in results if r['hub_rank'] == 0 and r['window_days'] == 40]
+            self.assertEqual(largest[0]['rows'], largest[1]['rows'])
+            self.assertGreater(largest[0]['rows'], 0)
+
+            out = StringIO()
+            call_command('bench_stats_api', '--windows', '7,40', '--hubs', '2', '--repeat', '1',
+                         '--compare', path, stdout=out)
+            self.assertIn('% vs', out.getvalue())
+
+
+class DatabasePoolViewTests(TestCase):
+
+    def test_reports_connection_reuse(self):
+        self.client.get('/api/db/pool/')
+        data = self.client.get('/api/db/pool/').json()
+        self.assertIn(data['mode'], ('pool', 'persistent', 'per-request'))
+        self.assertGreaterEqual(data['requests'], 2)
+        self.assertIn('reuse_ratio', data)
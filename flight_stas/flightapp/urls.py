@@ -1,9 +1,21 @@
 # flightapp/urls.py
 from django.urls import path
-from .views import  FlightStatisticsSQL, FlightStatisticsAPIView
+from .async_views import AsyncFlightStatisticsSQL, AsyncFlightStatisticsAPIView
+from .views import  FlightStatisticsSQL, FlightStatisticsBatchSQL, FlightStatisticsTrendSQL, FlightRevenueStatsSQL, FlightStatisticsAPIView, StatsCacheInfoView, DatabasePoolView, MetricsView, AirportSearchView, FlightExportView, FastestItineraryView
 urlpatterns = [
    
     path('stats1/', FlightStatisticsSQL.as_view()),
+    path('stats1/batch/', FlightStatisticsBatchSQL.as_view()),
+    path('stats1/trend/', FlightStatisticsTrendSQL.as_view()),
+    path('stats1/revenue/', FlightRevenueStatsSQL.as_view()),
     path('stats2/', FlightStatisticsAPIView.as_view()),
+    path('async/stats1/', AsyncFlightStatisticsSQL.as_view()),
+    path('async/stats2/', AsyncFlightStatisticsAPIView.as_view()),
+    path('stats/cache/', StatsCacheInfoView.as_view()),
+    path('db/pool/', DatabasePoolView.as_view()),
+    path('_metrics', MetricsView.as_view()),
+    path('airports/', AirportSearchView.as_view()),
+    path('export/flights/', FlightExportView.as_view()),
+    path('routes/fastest/', FastestItineraryView.as_view()),
 
 ]
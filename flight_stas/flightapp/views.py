@@ -1,16 +1,18 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import groupby
 import math
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import JsonResponse
-from django.db import models, connection
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import BrowsableAPIRenderer
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.models import F, Sum, Avg, Count, Value, FloatField, OuterRef, Subquery, DurationField, ExpressionWrapper, IntegerField
 from django.db.models import Q
 from django.db.models.functions import Cast  # Buni ishlatib ko'ring
 
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Func
-from django.contrib.gis.db.models import GeometryField
 from datetime import timedelta
 from django.db.models.functions import Cast
 
@@ -20,135 +22,752 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.db.models import OuterRef, Subquery
 from django.contrib.gis.geos import Point
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Coalesce, NullIf
 
 
 
 
 
-from .models import AirportsData, Flights, TicketFlights
+from .models import FlightFacts, Flights, RouteDailyStats, TicketFlights
+from . import columnar, dbpool, export, facts, matview, metrics, network, replicas, rollup
+from .airports import airport_index
+from .cache import cache_info, cached_stats, parse_bound
+from .capacity import FARE_CONDITIONS, seat_capacity
+from .distances import distance_matrix
+from .renderers import StatsJSONRenderer, StatsJsonResponse, dumps
+from .replicas import replica_reads
 
 
 class FlightStatisticsSQL(APIView):
+    # Passenger counts come from one grouped join over ticket_flights instead of
+    # a correlated ANY(ARRAY_AGG(flight_id)) probe per destination.
+    # Names and distances are filled in from the in-memory airport index.
+    live_query = """
+        WITH filtered_flights AS (
+            SELECT
+                f.flight_id,
+                f.arrival_airport,
+                f.actual_arrival - f.actual_departure AS flight_time
+            FROM bookings.flights f
+            WHERE f.departure_airport = %s
+            AND f.scheduled_departure >= %s::timestamp
+            AND f.scheduled_departure < %s::timestamp
+        ),
+        flights_list AS (
+            SELECT
+                arrival_airport,
+                AVG(flight_time) AS avg_flight_time,
+                COUNT(flight_id) AS flight_count
+            FROM filtered_flights
+            GROUP BY arrival_airport
+        ),
+        passengers AS (
+            SELECT ff.arrival_airport, COUNT(*) AS passenger_count
+            FROM bookings.ticket_flights tf
+            JOIN filtered_flights ff ON ff.flight_id = tf.flight_id
+            GROUP BY ff.arrival_airport
+        )
+        SELECT
+            fl.arrival_airport,
+            fl.avg_flight_time,
+            fl.flight_count,
+            COALESCE(p.passenger_count, 0) AS passenger_count
+        FROM flights_list fl
+        LEFT JOIN passengers p
+        ON p.arrival_airport = fl.arrival_airport;
+        """
+
     def get(self, request):
         departure_airport_name = request.GET.get('departure_airport_name')
         from_date = request.GET.get('from_date')
         to_date = request.GET.get('to_date')
-        
-       
-        query = """
-        WITH depcity AS (
-            SELECT airport_code, coordinates
-            FROM bookings.airports_data a
-            WHERE airport_name ->> 'en' = %s
+
+        # ?engine=parquet answers closed historical windows from the Parquet export
+        self.engine = request.GET.get('engine')
+        return StatsJsonResponse(self.stats(departure_airport_name, from_date, to_date))
+
+    engine = None
+
+    @cached_stats('stats1')
+    @replica_reads
+    def stats(self, departure_airport_name, from_date, to_date):
+        dep_airport = airport_index.get(departure_airport_name)
+        if dep_airport is None:
+            return {'data': []}
+
+        window = columnar.covered_window(from_date, to_date) if columnar.wanted(self.engine) else None
+        if window is not None:
+            return {'data': self.build_rows(dep_airport.code, columnar.route_stats(dep_airport.code, *window))}
+
+        query, params = self.route_query(dep_airport.code, from_date, to_date)
+
+        with replicas.cursor() as cursor:
+
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+                
+
+            return {
+                'data': self.build_rows(dep_airport.code, results)
+            }
+
+    def route_query(self, departure_code, from_date, to_date):
+        # Materialized view (if STATS_SOURCE = 'matview' and it was refreshed
+        # after the window ended), then the daily rollup, then the per-flight
+        # facts once backfilled, then the live query
+        if matview.enabled():
+            window = matview.covered_window(from_date, to_date)
+            if window is not None:
+                return matview.ROUTE_STATS_SQL, [departure_code, *window]
+        window = rollup.covered_window(from_date, to_date)
+        if window is not None:
+            return rollup.ROUTE_STATS_SQL, [departure_code, *window]
+        if facts.available():
+            return facts.ROUTE_STATS_SQL, [departure_code, from_date, to_date]
+        return self.live_query, [departure_code, from_date, to_date]
+
+    @staticmethod
+    def build_rows(departure_code, results):
+        """
+        (arrival_airport, avg_flight_time, flight_count, passenger_count) rows ->
+        response rows, nearest destination first. avg_flight_time stays a
+        timedelta; renderers.dumps() writes it as seconds.
+        """
+        ranks = distance_matrix.ranks(departure_code)
+        flights_data = []
+        for row in sorted(results, key=lambda row: ranks.get(row[0], len(ranks))):
+            arrival = airport_index.by_code(row[0])
+            distance_km = distance_matrix.distance_km(departure_code, row[0])
+            flights_data.append({
+                'airport_name': arrival.name if arrival is not None else None,
+                'distance_km': round(distance_km, 3) if distance_km is not None else None,
+                'avg_flight_time': row[1],
+                'flight_count': row[2],
+                'passenger_count': row[3]
+            })
+        return flights_data
+
+
+class FlightStatisticsTrendSQL(FlightStatisticsSQL):
+    """
+    /api/stats1/ bucketed by date_trunc(granularity) in one grouped query, for
+    trend charts. Each destination is returned as one series of parallel
+    arrays (bucket, avg_flight_seconds, flight_count, passenger_count)
+    instead of one object per bucket.
+    """
+    GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+    live_query = """
+        WITH filtered_flights AS (
+            SELECT
+                f.flight_id,
+                f.arrival_airport,
+                date_trunc(%s, f.scheduled_departure AT TIME ZONE 'UTC') AS bucket,
+                f.actual_arrival - f.actual_departure AS flight_time
+            FROM bookings.flights f
+            WHERE f.departure_airport = %s
+            AND f.scheduled_departure >= %s::timestamp
+            AND f.scheduled_departure < %s::timestamp
         ),
-        filtered_flights AS (
-            SELECT f.*
+        flights_list AS (
+            SELECT
+                arrival_airport,
+                bucket,
+                AVG(flight_time) AS avg_flight_time,
+                COUNT(flight_id) AS flight_count
+            FROM filtered_flights
+            GROUP BY arrival_airport, bucket
+        ),
+        passengers AS (
+            SELECT ff.arrival_airport, ff.bucket, COUNT(*) AS passenger_count
+            FROM bookings.ticket_flights tf
+            JOIN filtered_flights ff ON ff.flight_id = tf.flight_id
+            GROUP BY ff.arrival_airport, ff.bucket
+        )
+        SELECT
+            fl.arrival_airport,
+            fl.bucket,
+            fl.avg_flight_time,
+            fl.flight_count,
+            COALESCE(p.passenger_count, 0) AS passenger_count
+        FROM flights_list fl
+        LEFT JOIN passengers p
+        ON p.arrival_airport = fl.arrival_airport
+        AND p.bucket = fl.bucket
+        ORDER BY fl.arrival_airport, fl.bucket;
+        """
+
+    def get(self, request):
+        departure_airport_name = request.GET.get('departure_airport_name')
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+        granularity = request.GET.get('granularity', 'day')
+
+        if granularity not in self.GRANULARITIES:
+            return JsonResponse(
+                {'detail': f"granularity must be one of: {', '.join(self.GRANULARITIES)}"}, status=400
+            )
+        return StatsJsonResponse(self.stats(departure_airport_name, from_date, to_date, granularity))
+
+    @cached_stats('trend')
+    @replica_reads
+    def stats(self, departure_airport_name, from_date, to_date, granularity):
+        dep_airport = airport_index.get(departure_airport_name)
+        if dep_airport is None:
+            return {'granularity': granularity, 'data': []}
+
+        query, params = self.trend_query(dep_airport.code, from_date, to_date, granularity)
+        with replicas.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        return {
+            'granularity': granularity,
+            'data': self.build_series(dep_airport.code, rows, granularity),
+        }
+
+    def trend_query(self, departure_code, from_date, to_date, granularity):
+        # Daily rollup rows can be re-bucketed to anything but hours
+        window = rollup.covered_window(from_date, to_date) if granularity != 'hour' else None
+        if window is not None:
+            return rollup.ROUTE_TREND_SQL, [granularity, departure_code, *window]
+        return self.live_query, [granularity, departure_code, from_date, to_date]
+
+    @staticmethod
+    def build_series(departure_code, rows, granularity):
+        """Rows ordered by (arrival_airport, bucket) -> one columnar series per destination."""
+        ranks = distance_matrix.ranks(departure_code)
+        groups = sorted(
+            ((arrival_code, list(group)) for arrival_code, group in groupby(rows, key=lambda row: row[0])),
+            key=lambda item: ranks.get(item[0], len(ranks))
+        )
+        series = []
+        for arrival_code, group in groups:
+            arrival = airport_index.by_code(arrival_code)
+            distance_km = distance_matrix.distance_km(departure_code, arrival_code)
+            series.append({
+                'airport_name': arrival.name if arrival is not None else None,
+                'distance_km': round(distance_km, 3) if distance_km is not None else None,
+                'bucket': [
+                    row[1].isoformat() if granularity == 'hour' else row[1].date().isoformat()
+                    for row in group
+                ],
+                'avg_flight_seconds': [
+                    row[2].total_seconds() if row[2] is not None else None for row in group
+                ],
+                'flight_count': [row[3] for row in group],
+                'passenger_count': [row[4] for row in group],
+            })
+        return series
+
+
+class FlightRevenueStatsSQL(FlightStatisticsSQL):
+    """
+    Revenue by fare class and load factor per destination. ticket_flights is
+    read once, grouped per flight, and joined back to the flights; seat
+    capacity comes from the in-memory per-aircraft counts, so seats is never
+    read on a request.
+    """
+    live_query = """
+        WITH filtered_flights AS (
+            SELECT f.flight_id, f.arrival_airport, f.aircraft_code
+            FROM bookings.flights f
+            WHERE f.departure_airport = %s
+            AND f.scheduled_departure >= %s::timestamp
+            AND f.scheduled_departure < %s::timestamp
+        ),
+        per_flight AS (
+            SELECT
+                tf.flight_id,
+                COUNT(*) FILTER (WHERE tf.fare_conditions = 'Economy') AS economy_passengers,
+                COUNT(*) FILTER (WHERE tf.fare_conditions = 'Comfort') AS comfort_passengers,
+                COUNT(*) FILTER (WHERE tf.fare_conditions = 'Business') AS business_passengers,
+                SUM(tf.amount) FILTER (WHERE tf.fare_conditions = 'Economy') AS economy_revenue,
+                SUM(tf.amount) FILTER (WHERE tf.fare_conditions = 'Comfort') AS comfort_revenue,
+                SUM(tf.amount) FILTER (WHERE tf.fare_conditions = 'Business') AS business_revenue
+            FROM bookings.ticket_flights tf
+            JOIN filtered_flights ff ON ff.flight_id = tf.flight_id
+            GROUP BY tf.flight_id
+        )
+        SELECT
+            ff.arrival_airport,
+            ff.aircraft_code,
+            COUNT(*) AS flight_count,
+            COALESCE(SUM(p.economy_passengers), 0),
+            COALESCE(SUM(p.comfort_passengers), 0),
+            COALESCE(SUM(p.business_passengers), 0),
+            COALESCE(SUM(p.economy_revenue), 0),
+            COALESCE(SUM(p.comfort_revenue), 0),
+            COALESCE(SUM(p.business_revenue), 0)
+        FROM filtered_flights ff
+        LEFT JOIN per_flight p ON p.flight_id = ff.flight_id
+        GROUP BY ff.arrival_airport, ff.aircraft_code;
+        """
+
+    def get(self, request):
+        departure_airport_name = request.GET.get('departure_airport_name')
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+        return StatsJsonResponse(self.stats(departure_airport_name, from_date, to_date))
+
+    @cached_stats('revenue')
+    @replica_reads
+    def stats(self, departure_airport_name, from_date, to_date):
+        dep_airport = airport_index.get(departure_airport_name)
+        if dep_airport is None:
+            return {'data': []}
+
+        with replicas.cursor() as cursor:
+            cursor.execute(self.live_query, [dep_airport.code, from_date, to_date])
+            rows = cursor.fetchall()
+        return {'data': self.build_revenue_rows(dep_airport.code, rows)}
+
+    @staticmethod
+    def build_revenue_rows(departure_code, rows):
+        """(arrival, aircraft, flights, passengers x3, revenue x3) rows -> one row per destination."""
+        routes = {}
+        for arrival_code, aircraft_code, flight_count, *by_fare in rows:
+            route = routes.get(arrival_code)
+            if route is None:
+                route = routes[arrival_code] = {
+                    'flight_count': 0,
+                    'passengers': dict.fromkeys(FARE_CONDITIONS, 0),
+                    'seats': dict.fromkeys(FARE_CONDITIONS, 0),
+                    'revenue': dict.fromkeys(FARE_CONDITIONS, Decimal('0.00')),
+                }
+            route['flight_count'] += flight_count
+            seats = seat_capacity.by_fare(aircraft_code)
+            for i, fare in enumerate(FARE_CONDITIONS):
+                route['passengers'][fare] += by_fare[i]
+                route['revenue'][fare] += by_fare[len(FARE_CONDITIONS) + i]
+                route['seats'][fare] += seats[fare] * flight_count
+
+        ranks = distance_matrix.ranks(departure_code)
+        data = []
+        for arrival_code in sorted(routes, key=lambda code: ranks.get(code, len(ranks))):
+            route = routes[arrival_code]
+            arrival = airport_index.by_code(arrival_code)
+            distance_km = distance_matrix.distance_km(departure_code, arrival_code)
+            passengers = sum(route['passengers'].values())
+            seats = sum(route['seats'].values())
+            data.append({
+                'airport_name': arrival.name if arrival is not None else None,
+                'distance_km': round(distance_km, 3) if distance_km is not None else None,
+                'flight_count': route['flight_count'],
+                'passenger_count': passengers,
+                'seat_capacity': seats,
+                # Aircraft without a seat map have no capacity to divide by
+                'load_factor': round(passengers / seats, 4) if seats else None,
+                'revenue': sum(route['revenue'].values(), Decimal('0.00')),
+                'by_fare': {
+                    fare: {
+                        'passenger_count': route['passengers'][fare],
+                        'seat_capacity': route['seats'][fare],
+                        'load_factor': (
+                            round(route['passengers'][fare] / route['seats'][fare], 4)
+                            if route['seats'][fare] else None
+                        ),
+                        'revenue': route['revenue'][fare],
+                    }
+                    for fare in FARE_CONDITIONS
+                },
+            })
+        return data
+
+
+class FlightStatisticsBatchSQL(APIView):
+    """
+    /api/stats1/ for many departure airports at once, in one grouped query.
+
+    departure_airport_name may be repeated (or comma separated), or "all".
+    With stream=1 the response is written one departure airport at a time
+    from a server-side cursor, so memory does not grow with the airport list.
+    """
+    live_query = """
+        WITH filtered_flights AS (
+            SELECT
+                f.flight_id,
+                f.departure_airport,
+                f.arrival_airport,
+                f.actual_arrival - f.actual_departure AS flight_time
             FROM bookings.flights f
-            JOIN depcity d ON f.departure_airport = d.airport_code
             WHERE f.scheduled_departure >= %s::timestamp
             AND f.scheduled_departure < %s::timestamp
+            {airport_filter}
         ),
         flights_list AS (
-            SELECT 
+            SELECT
+                departure_airport,
                 arrival_airport,
-                ARRAY_AGG(flight_id) AS flight_ids,  
-                AVG(actual_arrival - actual_departure) AS avg_flight_time,
+                AVG(flight_time) AS avg_flight_time,
                 COUNT(flight_id) AS flight_count
             FROM filtered_flights
-            GROUP BY arrival_airport
+            GROUP BY departure_airport, arrival_airport
+        ),
+        passengers AS (
+            SELECT ff.departure_airport, ff.arrival_airport, COUNT(*) AS passenger_count
+            FROM bookings.ticket_flights tf
+            JOIN filtered_flights ff ON ff.flight_id = tf.flight_id
+            GROUP BY ff.departure_airport, ff.arrival_airport
         )
-        SELECT 
-            ad.airport_name ->> 'en' AS airport_name,
-            ROUND(ST_DistanceSphere(d.coordinates, ad.coordinates)::numeric / 1000,3) AS distance_km, 
+        SELECT
+            fl.departure_airport,
+            fl.arrival_airport,
             fl.avg_flight_time,
             fl.flight_count,
-            (
-                SELECT COUNT(*) 
-                FROM bookings.ticket_flights tf
-                WHERE tf.flight_id = ANY(fl.flight_ids)
-            ) AS passenger_count
+            COALESCE(p.passenger_count, 0) AS passenger_count
         FROM flights_list fl
-        JOIN bookings.airports_data ad
-        ON ad.airport_code = fl.arrival_airport
-        CROSS JOIN depcity d   
-        ORDER BY distance_km ASC;
+        LEFT JOIN passengers p
+        ON p.departure_airport = fl.departure_airport
+        AND p.arrival_airport = fl.arrival_airport
+        ORDER BY fl.departure_airport;
         """
-        
-        
-        with connection.cursor() as cursor:
 
-            cursor.execute(query, [departure_airport_name, from_date, to_date])
-            results = cursor.fetchall()
-                
+    def get(self, request):
+        names = []
+        for value in request.GET.getlist('departure_airport_name'):
+            names.extend(name.strip() for name in value.split(',') if name.strip())
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+        stream = request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
 
-            flights_data = []
-            for row in results:
-                flights_data.append({
-                    'airport_name': row[0],
-                    'distance_km': float(row[1]) if row[1] is not None else None,
-                    'avg_flight_time': str(row[2]) if row[2] is not None else None,
-                    'flight_count': row[3],
-                    'passenger_count': row[4]
-                })
-                
-            return JsonResponse({
-                'data': flights_data
-            })
-                
+        if not names:
+            return JsonResponse({'detail': 'departure_airport_name is required'}, status=400)
+
+        if any(name.lower() == 'all' for name in names):
+            codes = None
+        else:
+            codes = []
+            for name in names:
+                airport = airport_index.get(name)
+                if airport is None:
+                    return JsonResponse({'detail': f'Unknown departure airport: {name}'}, status=404)
+                if airport.code not in codes:
+                    codes.append(airport.code)
+
+        if stream:
+            # The rows are read after get() returns, so the replica is picked
+            # (and connected) up front
+            alias = replicas.replica_set.choose(from_date, to_date)
+            query, params = replicas.run_on(alias, self.build_query, codes, from_date, to_date)
+            response = StreamingHttpResponse(self.stream(query, params, alias), content_type='application/json')
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        return StatsJsonResponse({'data': replicas.run(from_date, to_date, self.fetch, codes, from_date, to_date)})
+
+    def fetch(self, codes, from_date, to_date):
+        query, params = self.build_query(codes, from_date, to_date)
+        with replicas.cursor() as cursor:
+            cursor.execute(query, params)
+            return {
+                departure_code: FlightStatisticsSQL.build_rows(departure_code, rows)
+                for departure_code, rows in self.group_rows(cursor.fetchall())
+            }
 
-class DistanceSphere(Func):
-    function = 'ST_DistanceSphere'
-    output_field = models.FloatField()
+    def build_query(self, codes, from_date, to_date):
+        window = rollup.covered_window(from_date, to_date)
+        if window is not None:
+            query, params, column = rollup.BATCH_ROUTE_STATS_SQL, [*window], 'r.departure_airport'
+        elif facts.available():
+            query, params, column = facts.BATCH_ROUTE_STATS_SQL, [from_date, to_date], 'ff.departure_airport'
+        else:
+            query, params, column = self.live_query, [from_date, to_date], 'f.departure_airport'
 
-    def __init__(self, expr1, expr2, **extra):
-        super().__init__(expr1, expr2, **extra)
-    
-    def as_sql(self, compiler, connection, **extra_context):
-        sql, params = super().as_sql(compiler, connection, **extra_context)
-        return f"({sql} / 1000.0)", params
+        airport_filter = ''
+        if codes is not None:
+            airport_filter = f'AND {column} = ANY(%s)'
+            params.append(codes)
+        return query.format(airport_filter=airport_filter), params
+
+    @staticmethod
+    def group_rows(rows):
+        """Split rows ordered by departure_airport into (departure_code, rows) groups."""
+        for departure_code, group in groupby(rows, key=lambda row: row[0]):
+            yield departure_code, [row[1:] for row in group]
+
+    def stream(self, query, params, using=DEFAULT_DB_ALIAS):
+        # Server-side (named) cursor: rows arrive in chunks, only one departure
+        # airport's destinations are held in memory at a time
+        with connections[using].chunked_cursor() as cursor:
+            cursor.execute(query, params)
+
+            def fetch():
+                while True:
+                    rows = cursor.fetchmany(2000)
+                    if not rows:
+                        return
+                    yield from rows
+
+            yield b'{"data": {'
+            separator = b''
+            for departure_code, rows in self.group_rows(fetch()):
+                rows = FlightStatisticsSQL.build_rows(departure_code, rows)
+                yield separator + dumps(departure_code) + b': ' + dumps(rows)
+                separator = b', '
+            yield b'}}'
 
 
-    
 class FlightStatisticsAPIView(APIView):
+    renderer_classes = [StatsJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request):
         departure_airport_name = request.GET.get('departure_airport_name')
         from_date = request.GET.get('from_date')
         to_date = request.GET.get('to_date')
 
+        self.engine = request.GET.get('engine')
+        return Response(self.stats(departure_airport_name, from_date, to_date))
+
+    engine = None
+
+    @cached_stats('stats2')
+    @replica_reads
+    def stats(self, departure_airport_name, from_date, to_date):
         # Departure airportni olish
-        dep_airport = AirportsData.objects.get(airport_name__en=departure_airport_name)
+        dep_airport = airport_index.get(departure_airport_name)
+        if dep_airport is None:
+            raise NotFound(f"Unknown departure airport: {departure_airport_name}")
+
+        parquet_window = columnar.covered_window(from_date, to_date) if columnar.wanted(self.engine) else None
+        if parquet_window is not None:
+            flights_list = [
+                {'arrival_airport': arrival, 'avg_flight_time': avg, 'flight_count': count, 'total_passengers': passengers}
+                for arrival, avg, count, passengers in columnar.route_stats(dep_airport.code, *parquet_window)
+            ]
+            return {'data': self.build_rows(dep_airport.code, flights_list)}
+
+        window = rollup.covered_window(from_date, to_date)
+        if window is not None:
+            flights_list = self.rollup_flights(dep_airport, *window)
+        elif facts.available():
+            flights_list = self.facts_queryset(dep_airport.code, from_date, to_date)
+        else:
+            flights_list = self.live_flights(dep_airport, from_date, to_date)
 
-        # Passenger count subquery
-        passenger_count_subquery = TicketFlights.objects.filter(
-            flight_id=OuterRef('pk')
-        ).values('flight_id').annotate(
-            count=Count('ticket_no')
-        ).values('count')[:1]
+        return {'data': self.build_rows(dep_airport.code, flights_list)}
 
+    @staticmethod
+    def build_rows(departure_code, flights_list):
+        ranks = distance_matrix.ranks(departure_code)
+        results = []
+        for row in sorted(flights_list, key=lambda row: ranks.get(row['arrival_airport'], len(ranks))):
+            arrival = airport_index.by_code(row['arrival_airport'])
+            results.append({
+                'arrival_airport__airport_name__en': arrival.name if arrival is not None else None,
+                'avg_flight_time': row['avg_flight_time'],
+                'flight_count': row['flight_count'],
+                'distance_km': distance_matrix.distance_km(departure_code, row['arrival_airport']),
+                'total_passengers': row['total_passengers'],
+            })
+        return results
+
+    def live_flights(self, dep_airport, from_date, to_date):
+        flights_list = list(self.flights_queryset(dep_airport.code, from_date, to_date))
+        passengers = dict(self.passengers_queryset(dep_airport.code, from_date, to_date))
+
+        for row in flights_list:
+            row['total_passengers'] = passengers.get(row['arrival_airport'], 0)
+        return flights_list
 
-        filtered_flights = Flights.objects.filter(
-            departure_airport=dep_airport,
+    @staticmethod
+    def flights_queryset(departure_code, from_date, to_date):
+        return Flights.objects.filter(
+            departure_airport=departure_code,
             scheduled_departure__gte=from_date,
             scheduled_departure__lt=to_date
-        ).annotate(
-            passenger_count=Subquery(
-                passenger_count_subquery, output_field=IntegerField()
-            )
+        ).values('arrival_airport').annotate(
+            avg_flight_time=Avg(F('actual_arrival') - F('actual_departure')),
+            flight_count=Count('flight_id')
         )
 
-        # raise Exception(filtered_flights.values()[0])
+    @staticmethod
+    def passengers_queryset(departure_code, from_date, to_date):
+        # Passenger count: one grouped join over ticket_flights for the whole
+        # window, instead of a correlated subquery per flight
+        return TicketFlights.objects.filter(
+            flight_id__departure_airport=departure_code,
+            flight_id__scheduled_departure__gte=from_date,
+            flight_id__scheduled_departure__lt=to_date
+        ).values('flight_id__arrival_airport').annotate(
+            # COUNT(*) rather than COUNT(id), so the flight_id index alone answers it
+            count=Count('*')
+        ).values_list('flight_id__arrival_airport', 'count')
 
-        flights_list = filtered_flights.values('arrival_airport__airport_name__en').annotate(
-            avg_flight_time=Avg(F('actual_arrival') - F('actual_departure')),
-            flight_count=Count('flight_id'),
-            distance_km=DistanceSphere(
-                F('arrival_airport__coordinates'),
-                Value(dep_airport.coordinates, output_field=GeometryField())
+    @staticmethod
+    def facts_queryset(departure_code, from_date, to_date):
+        # Same keys as live_flights(), from one narrow table instead of the
+        # flights/ticket_flights join; the average is rebuilt as in the rollup
+        total_flight_time = ExpressionWrapper(
+            Sum('duration_seconds') * Value(timedelta(seconds=1)), output_field=DurationField()
+        )
+        return FlightFacts.objects.filter(
+            departure_airport=departure_code,
+            scheduled_departure__gte=from_date,
+            scheduled_departure__lt=to_date
+        ).values('arrival_airport').annotate(
+            avg_flight_time=ExpressionWrapper(
+                total_flight_time / NullIf(Count('duration_seconds'), 0),
+                output_field=DurationField()
             ),
+            flight_count=Count('*'),
             total_passengers=Coalesce(Sum('passenger_count'), Value(0))
         )
 
-        results = sorted(flights_list, key=lambda x: x['distance_km'] or 0)
+    def rollup_flights(self, dep_airport, from_day, to_day):
+        # Same keys as live_flights(); the average is rebuilt from the daily sums
+        return RouteDailyStats.objects.filter(
+            departure_airport=dep_airport.code,
+            day__gte=from_day,
+            day__lt=to_day
+        ).values('arrival_airport').annotate(
+            avg_flight_time=ExpressionWrapper(
+                Sum('total_flight_time') / NullIf(Sum('actual_count'), 0),
+                output_field=DurationField()
+            ),
+            flight_count=Sum('flight_count'),
+            total_passengers=Coalesce(Sum('passenger_count'), Value(0))
+        )
+
+
+class FlightExportView(APIView):
+    """Per-flight rows (route, actual duration, passengers, revenue) as NDJSON or CSV."""
+
+    def get(self, request):
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+        fmt = request.GET.get('export_format', 'ndjson')
+        if not from_date or not to_date:
+            return JsonResponse({'detail': 'from_date and to_date are required'}, status=400)
+        if fmt not in export.FORMATS:
+            return JsonResponse({'detail': f'export_format must be one of {", ".join(export.FORMATS)}'}, status=400)
+
+        airport_code = None
+        departure_airport_name = request.GET.get('departure_airport_name')
+        if departure_airport_name:
+            airport = airport_index.get(departure_airport_name)
+            if airport is None:
+                return JsonResponse({'detail': f'Unknown departure airport: {departure_airport_name}'}, status=404)
+            airport_code = airport.code
+
+        using = replicas.replica_set.choose(from_date, to_date)
+        rows = export.iter_rows(from_date, to_date, airport_code, using=using)
+        response = StreamingHttpResponse(export.encode(rows, fmt), content_type=export.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="flights.{fmt}"'
+        return response
+
+
+class StatsCacheInfoView(APIView):
+    def get(self, request):
+        return Response(cache_info())
+
+
+class MetricsView(APIView):
+    """Request metrics of this process in the Prometheus text format."""
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-        return Response({'data': results})
+
+class DatabasePoolView(APIView):
+    def get(self, request):
+        return Response({**dbpool.pool_info(), 'read_replicas': replicas.replica_set.info()})
+
+
+class AirportSearchView(APIView):
+    def get(self, request):
+        query = request.GET.get('q', '')
+        try:
+            limit = min(int(request.GET.get('limit', 10)), 100)
+        except ValueError:
+            limit = 10
+        airports = airport_index.search(query, limit) if query else []
+        return Response({'data': [
+            {
+                'airport_code': airport.code,
+                'airport_name': airport.name,
+                'timezone': airport.timezone,
+                'longitude': airport.longitude,
+                'latitude': airport.latitude,
+            }
+            for airport in airports
+        ]})
+
+
+class FastestItineraryView(APIView):
+    """
+    Fastest itinerary between two airports over the scheduled flights of
+    from_date..to_date, from the in-memory route network (network.py): the
+    earliest arrival for a departure at depart_after (default from_date) or
+    later, leaving as late as that arrival allows.
+    """
+    MAX_CONNECTIONS = 4
+
+    def get(self, request):
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+        start = self.parse_time(from_date)
+        end = self.parse_time(to_date)
+        if start is None or end is None or start >= end:
+            return JsonResponse({'detail': 'from_date and to_date must be dates, from_date first'}, status=400)
+        if end - start > timedelta(days=network.conf('MAX_DAYS')):
+            return JsonResponse({'detail': f"The window is limited to {network.conf('MAX_DAYS')} days"}, status=400)
+        depart_after = self.parse_time(request.GET.get('depart_after') or from_date)
+        if depart_after is None:
+            return JsonResponse({'detail': 'depart_after must be a date or datetime'}, status=400)
+        try:
+            max_connections = int(request.GET.get('max_connections', 2))
+            min_layover = int(request.GET.get('min_layover', 45))
+        except ValueError:
+            return JsonResponse({'detail': 'max_connections and min_layover (minutes) must be integers'}, status=400)
+        if not 0 <= max_connections <= self.MAX_CONNECTIONS or min_layover < 0:
+            return JsonResponse(
+                {'detail': f'max_connections must be 0..{self.MAX_CONNECTIONS}, min_layover not negative'}, status=400
+            )
+
+        airports = []
+        for param in ('departure_airport_name', 'arrival_airport_name'):
+            name = request.GET.get(param)
+            airport = airport_index.get(name) if name else None
+            if airport is None:
+                return JsonResponse({'detail': f'Unknown airport for {param}: {name}'}, status=404)
+            airports.append(airport)
+        departure, arrival = airports
+
+        flight_network = network.flight_networks.get(int(start.timestamp()), int(end.timestamp()))
+        legs = flight_network.fastest(
+            departure.code, arrival.code, int(depart_after.timestamp()), max_connections, min_layover * 60
+        )
+        return StatsJsonResponse({'data': self.build_itinerary(legs) if legs else None})
+
+    @staticmethod
+    def parse_time(value):
+        try:
+            return parse_bound(value or '')
+        except ValueError:
+            return None
+
+    @staticmethod
+    def build_itinerary(legs):
+        rows = []
+        previous_arrival = None
+        for leg in legs:
+            rows.append({
+                'flight_id': leg['flight_id'],
+                'flight_no': leg['flight_no'],
+                'departure_airport': leg['departure_airport'],
+                'arrival_airport': leg['arrival_airport'],
+                'scheduled_departure': datetime.fromtimestamp(leg['departure'], dt_timezone.utc).isoformat(),
+                'scheduled_arrival': datetime.fromtimestamp(leg['arrival'], dt_timezone.utc).isoformat(),
+                'layover_seconds': leg['departure'] - previous_arrival if previous_arrival is not None else None,
+            })
+            previous_arrival = leg['arrival']
+        return {
+            'departure_airport': legs[0]['departure_airport'],
+            'arrival_airport': legs[-1]['arrival_airport'],
+            'scheduled_departure': rows[0]['scheduled_departure'],
+            'scheduled_arrival': rows[-1]['scheduled_arrival'],
+            'duration_seconds': legs[-1]['arrival'] - legs[0]['departure'],
+            'connections': len(legs) - 1,
+            'legs': rows,
+        }